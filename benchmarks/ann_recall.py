@@ -0,0 +1,81 @@
+"""Measures recall@k and latency of the IVF index against exact search.
+
+Usage:
+    python benchmarks/ann_recall.py [--db path/to/recall.db] [--n 200000]
+
+Without --db, a synthetic clustered data set of 384-dim vectors is used.
+"""
+
+import argparse
+import sqlite3
+import time
+
+import numpy as np
+
+from openrecall.ann import IVFIndex
+from openrecall.vector_index import EmbeddingIndex
+
+
+def load_embeddings(db_path: str) -> np.ndarray:
+    """Reads every embedding blob from an OpenRecall database."""
+    with sqlite3.connect(db_path) as conn:
+        blobs = [row[0] for row in conn.execute("SELECT embedding FROM entries ORDER BY id")]
+    return np.frombuffer(b"".join(blobs), dtype=np.float32).reshape(len(blobs), -1)
+
+
+def synthetic_embeddings(n: int, dim: int, n_topics: int, seed: int = 0) -> np.ndarray:
+    """Generates vectors scattered around random topic centres, like screen text."""
+    rng = np.random.default_rng(seed)
+    topics = rng.normal(size=(n_topics, dim)).astype(np.float32)
+    assignments = rng.integers(0, n_topics, size=n)
+    noise = rng.normal(scale=0.6, size=(n, dim)).astype(np.float32)
+    return topics[assignments] + noise
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--db", help="OpenRecall database to read embeddings from")
+    parser.add_argument("--n", type=int, default=200_000, help="Synthetic vector count")
+    parser.add_argument("--dim", type=int, default=384, help="Synthetic vector dimension")
+    parser.add_argument("--queries", type=int, default=200, help="Number of queries")
+    parser.add_argument("--k", type=int, default=10, help="Results per query")
+    parser.add_argument("--nlist", type=int, default=None, help="IVF cluster count")
+    parser.add_argument(
+        "--nprobe", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32], help="nprobe values to test"
+    )
+    args = parser.parse_args()
+
+    embeddings = load_embeddings(args.db) if args.db else synthetic_embeddings(args.n, args.dim, 1000)
+    rng = np.random.default_rng(1)
+    queries = embeddings[rng.choice(len(embeddings), args.queries)] + rng.normal(
+        scale=0.3, size=(args.queries, embeddings.shape[1])
+    ).astype(np.float32)
+    ids = np.arange(len(embeddings), dtype=np.int64)
+    print(f"{len(embeddings)} vectors, dim {embeddings.shape[1]}, {args.queries} queries, k={args.k}")
+
+    exact = EmbeddingIndex()
+    exact.add_batch(ids, embeddings)
+    start = time.perf_counter()
+    truth = [set(exact.search(q, args.k)[0].tolist()) for q in queries]
+    exact_ms = (time.perf_counter() - start) * 1000 / args.queries
+    print(f"exact: {exact_ms:.2f} ms/query")
+
+    start = time.perf_counter()
+    ivf = IVFIndex(nlist=args.nlist, min_train_size=1)
+    ivf.train(embeddings)
+    ivf.add_batch(ids, embeddings)
+    print(f"ivf: nlist={ivf.nlist}, built in {time.perf_counter() - start:.1f} s")
+
+    for nprobe in args.nprobe:
+        start = time.perf_counter()
+        results = [ivf.search(q, args.k, nprobe=nprobe)[0] for q in queries]
+        ivf_ms = (time.perf_counter() - start) * 1000 / args.queries
+        recall = np.mean([len(truth[i] & set(r.tolist())) / args.k for i, r in enumerate(results)])
+        print(
+            f"nprobe={nprobe:>4}: recall@{args.k}={recall:.3f}  "
+            f"{ivf_ms:.2f} ms/query  ({exact_ms / ivf_ms:.1f}x vs exact)"
+        )
+
+
+if __name__ == "__main__":
+    main()
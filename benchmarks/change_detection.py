@@ -0,0 +1,153 @@
+"""Compares the block-signature change detector with full-resolution MSSIM.
+
+Usage:
+    python benchmarks/change_detection.py [--width 3840 --height 2160] [--images DIR]
+
+For a set of typical screen changes, prints the similarity and keep/skip
+decision of `is_similar` and of `ChangeDetector`, then the time and peak
+memory each needs per monitor per tick. With --images, consecutive
+screenshots in DIR (sorted by name) are compared instead of synthetic ones.
+"""
+
+import argparse
+import os
+import time
+import tracemalloc
+
+import numpy as np
+
+from openrecall.change_detection import (
+    SIGNATURE_BLOCK,
+    SIMILARITY_THRESHOLD,
+    ChangeDetector,
+    frame_signature,
+    is_similar,
+    mean_structured_similarity_index,
+    signature_similarity,
+)
+
+LINE_HEIGHT = 24
+GLYPH_WIDTH = 10
+
+
+def text_screen(rng, width: int, height: int) -> np.ndarray:
+    """Draws a light screen covered in lines of dark glyph-sized marks."""
+    image = np.full((height, width, 3), 245, dtype=np.uint8)
+    for top in range(40, height - LINE_HEIGHT, LINE_HEIGHT):
+        write_line(rng, image, top)
+    return image
+
+
+def write_line(rng, image: np.ndarray, top: int, left: int = 20) -> None:
+    image[top : top + LINE_HEIGHT, left:] = 245
+    length = rng.integers(10, (image.shape[1] - left) // GLYPH_WIDTH)
+    for i in range(length):
+        if rng.random() < 0.15:
+            continue  # a space
+        x = left + i * GLYPH_WIDTH
+        glyph = rng.random((14, 7)) < 0.45
+        image[top + 5 : top + 19, x + 1 : x + 8][glyph] = rng.integers(0, 60)
+
+
+def scenarios(width: int, height: int):
+    """Yields (name, previous frame, current frame) for typical screen changes."""
+    rng = np.random.default_rng(0)
+    base = text_screen(rng, width, height)
+
+    yield "identical", base, base.copy()
+
+    frame = base.copy()
+    frame[100:124, 600:602] = 0
+    yield "cursor blink", base, frame
+
+    frame = base.copy()
+    write_line(rng, frame, 40 + 10 * LINE_HEIGHT)
+    yield "one line edited", base, frame
+
+    frame = base.copy()
+    top = 40 + 20 * LINE_HEIGHT
+    frame[top:-LINE_HEIGHT] = base[top + LINE_HEIGHT :]
+    yield "terminal scrolled a line", base, frame
+
+    frame = base.copy()
+    frame[40 : 40 + height // 3] = base[40 + height // 3 : 40 + 2 * (height // 3)]
+    yield "page scrolled a third", base, frame
+
+    frame = base.copy()
+    frame[height - 160 : height - 40, width - 420 : width - 20] = (50, 50, 60)
+    yield "notification popup", base, frame
+
+    frame = base.copy()
+    frame[:, width // 2 :] = text_screen(rng, width - width // 2, height)
+    yield "window switched on half", base, frame
+
+    yield "new page of text", base, text_screen(rng, width, height)
+
+    yield "brightness shift", base, np.clip(base.astype(np.int16) - 40, 0, 255).astype(np.uint8)
+
+
+def image_pairs(directory: str):
+    """Yields (name, previous frame, current frame) for consecutive screenshots."""
+    from PIL import Image
+
+    names = sorted(n for n in os.listdir(directory) if n.lower().endswith((".webp", ".png", ".jpg")))
+    previous = None
+    for name in names:
+        with Image.open(os.path.join(directory, name)) as image:
+            frame = np.array(image.convert("RGB"))
+        if previous is not None and previous.shape == frame.shape:
+            yield name, previous, frame
+        previous = frame
+
+
+def measure(fn, repeats: int):
+    """Returns the mean seconds per call and the peak bytes allocated by one call."""
+    fn()  # warm-up
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn()
+    elapsed = (time.perf_counter() - start) / repeats
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--width", type=int, default=3840)
+    parser.add_argument("--height", type=int, default=2160)
+    parser.add_argument("--images", help="Directory of consecutive screenshots to compare")
+    parser.add_argument("--block", type=int, default=SIGNATURE_BLOCK)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    pairs = image_pairs(args.images) if args.images else scenarios(args.width, args.height)
+    agree = total = 0
+    print(f"{'change':<26} {'MSSIM':>7} {'keep':>5}   {'signature':>9} {'keep':>5}")
+    for name, previous, current in pairs:
+        mssim = mean_structured_similarity_index(current, previous)
+        fast = signature_similarity(
+            frame_signature(current, args.block), frame_signature(previous, args.block)
+        )
+        keep_mssim = not is_similar(current, previous)
+        keep_fast = fast < SIMILARITY_THRESHOLD
+        agree += keep_mssim == keep_fast
+        total += 1
+        print(f"{name[:26]:<26} {mssim:7.4f} {keep_mssim!s:>5}   {fast:9.4f} {keep_fast!s:>5}")
+    print(f"decisions agree on {agree}/{total}")
+
+    height, width = previous.shape[:2]
+    detector = ChangeDetector(block=args.block)
+    detector.has_changed(0, previous)
+    for label, fn in (
+        ("is_similar", lambda: is_similar(current, previous)),
+        ("ChangeDetector", lambda: detector.has_changed(0, previous)),
+    ):
+        elapsed, peak = measure(fn, args.repeats)
+        print(f"{label:>14} at {width}x{height}: {elapsed * 1e3:8.1f} ms/tick  peak {peak / 1e6:7.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""Compares one WebP file per frame with keyframe + delta segments.
+
+Usage:
+    python benchmarks/frame_storage.py [--frames 300] [--width 1920 --height 1080] [--images DIR]
+
+Writes the same frame sequence both ways into a temporary directory and
+reports the bytes on disk, the write time per frame, and the latency of
+reading back randomly chosen frames. Without --images, synthetic desktop
+work is used: typing, scrolling and the occasional window switch.
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+from openrecall.encoding import load_frame
+from openrecall.segments import KEYFRAME_INTERVAL, SegmentWriter, read_frame, segment_files
+
+LINE_HEIGHT = 24
+
+
+def text_lines(rng, image: np.ndarray, top: int, count: int) -> None:
+    for line in range(count):
+        y = top + line * LINE_HEIGHT
+        if y + LINE_HEIGHT > image.shape[0]:
+            break
+        image[y : y + LINE_HEIGHT] = 250
+        length = rng.integers(10, image.shape[1] // 10)
+        marks = rng.random((14, length * 10)) < 0.3
+        image[y + 5 : y + 19, 20 : 20 + length * 10][marks[:, : image.shape[1] - 20]] = 30
+
+
+def synthetic_frames(count: int, width: int, height: int, seed: int = 0):
+    """Yields frames of someone typing, scrolling and switching windows."""
+    rng = np.random.default_rng(seed)
+    frame = np.full((height, width, 3), 250, dtype=np.uint8)
+    text_lines(rng, frame, 0, height // LINE_HEIGHT)
+    for i in range(count):
+        frame = frame.copy()
+        event = rng.random()
+        if event < 0.02:  # window switch
+            text_lines(rng, frame, 0, height // LINE_HEIGHT)
+        elif event < 0.15:  # scroll by a few lines
+            shift = LINE_HEIGHT * int(rng.integers(1, 6))
+            frame[:-shift] = frame[shift:]
+            text_lines(rng, frame, height - shift - height % LINE_HEIGHT, shift // LINE_HEIGHT)
+        else:  # typing on a line or two
+            text_lines(rng, frame, LINE_HEIGHT * int(rng.integers(0, height // LINE_HEIGHT)), 1)
+        yield frame
+
+
+def image_frames(directory: str):
+    names = sorted(n for n in os.listdir(directory) if n.lower().endswith((".webp", ".png", ".jpg")))
+    for name in names:
+        with Image.open(os.path.join(directory, name)) as image:
+            yield np.array(image.convert("RGB"))
+
+
+def directory_bytes(paths) -> int:
+    return sum(os.path.getsize(path) for path in paths)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--frames", type=int, default=300)
+    parser.add_argument("--width", type=int, default=1920)
+    parser.add_argument("--height", type=int, default=1080)
+    parser.add_argument("--images", help="Directory of consecutive screenshots to store instead")
+    parser.add_argument("--keyframe-interval", type=int, default=KEYFRAME_INTERVAL)
+    parser.add_argument("--reads", type=int, default=50, help="Random frames read back")
+    args = parser.parse_args()
+
+    if args.images:
+        frames = list(image_frames(args.images))
+    else:
+        frames = list(synthetic_frames(args.frames, args.width, args.height))
+    # One frame every 3 seconds, as recorded
+    start = 1_700_000_000 - 1_700_000_000 % 3600
+    timestamps = [start + 3 * i for i in range(len(frames))]
+    raw_bytes = sum(frame.nbytes for frame in frames)
+    height, width = frames[0].shape[:2]
+    print(f"{len(frames)} frames of {width}x{height}, {raw_bytes / 1e6:.1f} MB raw")
+    rng = np.random.default_rng(1)
+    picks = rng.integers(0, len(frames), args.reads)
+
+    with tempfile.TemporaryDirectory() as files_dir, tempfile.TemporaryDirectory() as segments_dir:
+        began = time.perf_counter()
+        names = []
+        for frame, timestamp in zip(frames, timestamps):
+            # The frame alone, as recorded before previews existed
+            names.append(f"{timestamp}_0.webp")
+            Image.fromarray(frame).save(os.path.join(files_dir, names[-1]), format="webp", lossless=True)
+        files_write = (time.perf_counter() - began) / len(frames)
+        files_bytes = directory_bytes(os.path.join(files_dir, name) for name in names)
+
+        writer = SegmentWriter(segments_dir, args.keyframe_interval)
+        began = time.perf_counter()
+        for frame, timestamp in zip(frames, timestamps):
+            writer.append(0, timestamp, frame)
+        segments_write = (time.perf_counter() - began) / len(frames)
+        segment_paths = segment_files(segments_dir)
+        segments_bytes = directory_bytes(segment_paths)
+
+        files_reads, segments_reads = [], []
+        for i in picks:
+            began = time.perf_counter()
+            from_file = load_frame(files_dir, names[i])
+            files_reads.append(time.perf_counter() - began)
+            began = time.perf_counter()
+            from_segment = read_frame(segments_dir, 0, timestamps[i])
+            segments_reads.append(time.perf_counter() - began)
+            assert np.array_equal(from_file, frames[i]) and np.array_equal(from_segment, frames[i])
+
+        for label, stored, files, write, reads in (
+            ("webp per frame", files_bytes, len(names), files_write, files_reads),
+            ("segments", segments_bytes, len(segment_paths), segments_write, segments_reads),
+        ):
+            print(
+                f"{label:>15}: {stored / 1e6:8.2f} MB in {files:4d} files ({raw_bytes / stored:5.1f}x)  "
+                f"write {write * 1e3:7.1f} ms/frame  "
+                f"read mean {np.mean(reads) * 1e3:6.1f} ms p95 {np.percentile(reads, 95) * 1e3:6.1f} ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
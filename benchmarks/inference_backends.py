@@ -0,0 +1,93 @@
+"""Compares the throughput and output parity of the CPU inference backends.
+
+Usage:
+    python benchmarks/inference_backends.py [--lines 512] [--image frame.webp]
+
+Embeds the same lines with every backend in openrecall.inference and reports
+lines per second and the cosine agreement with the eager backend. With
+--image, the OCR predictor is timed on that screenshot as well.
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from openrecall.inference import INFERENCE_BACKENDS, load_ocr_predictor, load_sentence_transformer
+from openrecall.nlp import MODEL_NAME
+
+SAMPLE_LINES = [
+    "File Edit View Selection Go Run Terminal Help",
+    "def get_embedding(text: str) -> np.ndarray:",
+    "Inbox (3) - Quarterly planning meeting moved to Thursday",
+    "Search results for cheap flights to Lisbon in October",
+    "Build succeeded: 0 errors, 2 warnings",
+    "Pull request #412: Paginate search results",
+    "Settings > Privacy > Screen recording",
+    "The quick brown fox jumps over the lazy dog",
+]
+
+
+def benchmark_embeddings(lines, repeats: int) -> None:
+    reference = None
+    for backend in INFERENCE_BACKENDS:
+        model = load_sentence_transformer(MODEL_NAME, backend)
+        model.encode(lines[:8])  # warm-up
+        start = time.perf_counter()
+        for _ in range(repeats):
+            embeddings = model.encode(lines, normalize_embeddings=True)
+        elapsed = (time.perf_counter() - start) / repeats
+        if reference is None:
+            reference = embeddings
+        cosine = np.sum(reference * embeddings, axis=1)
+        print(
+            f"embeddings {backend:>6}: {len(lines) / elapsed:8.1f} lines/s  "
+            f"cosine vs eager min {cosine.min():.4f} mean {cosine.mean():.4f}"
+        )
+
+
+def benchmark_ocr(image_path: str, repeats: int) -> None:
+    from PIL import Image
+
+    image = np.array(Image.open(image_path).convert("RGB"))
+    reference = None
+    for backend in INFERENCE_BACKENDS:
+        predictor = load_ocr_predictor(backend)
+        predictor([image])  # warm-up
+        start = time.perf_counter()
+        for _ in range(repeats):
+            result = predictor([image])
+        elapsed = (time.perf_counter() - start) / repeats
+        words = [
+            word.value
+            for page in result.pages
+            for block in page.blocks
+            for line in block.lines
+            for word in line.words
+        ]
+        if reference is None:
+            reference = words
+        matching = sum(a == b for a, b in zip(reference, words)) / max(len(reference), 1)
+        print(
+            f"ocr        {backend:>6}: {elapsed * 1000:8.1f} ms/frame  "
+            f"{len(words)} words, {matching:.1%} identical to eager"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--lines", type=int, default=512, help="Number of lines to embed")
+    parser.add_argument("--repeats", type=int, default=3, help="Timed repetitions per backend")
+    parser.add_argument("--image", help="Screenshot to run OCR on")
+    args = parser.parse_args()
+
+    lines = [
+        f"{SAMPLE_LINES[i % len(SAMPLE_LINES)]} ({i})" for i in range(args.lines)
+    ]
+    benchmark_embeddings(lines, args.repeats)
+    if args.image:
+        benchmark_ocr(args.image, args.repeats)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Compares one file per frame in a flat directory with pack files.
+
+Usage:
+    python benchmarks/pack_files.py [--files 20000] [--size 16384] [--reads 2000]
+
+Stores the same random blobs both ways into a temporary directory and
+reports the files created, the time to write them, to list what is stored
+(as backups and retention do) and to read randomly chosen blobs back, as
+the web interface does. Blob contents do not matter here, only their
+number and size.
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from openrecall.packs import PackStore, migrate_directory
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--files", type=int, default=20000)
+    parser.add_argument("--size", type=int, default=16384, help="Mean blob size in bytes")
+    parser.add_argument("--reads", type=int, default=2000, help="Random blobs read back")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    sizes = rng.integers(args.size // 2, args.size * 3 // 2, args.files)
+    data = rng.integers(0, 256, int(sizes.max()), dtype=np.uint8).tobytes()
+    names = [f"{1_700_000_000 + 3 * i}_0.webp" for i in range(args.files)]
+    picks = rng.integers(0, args.files, args.reads)
+    print(f"{args.files} blobs, {sizes.sum() / 1e6:.1f} MB")
+
+    with tempfile.TemporaryDirectory() as files_dir, tempfile.TemporaryDirectory() as packs_dir:
+        began = time.perf_counter()
+        for name, size in zip(names, sizes):
+            with open(os.path.join(files_dir, name), "wb") as f:
+                f.write(data[:size])
+        files_write = time.perf_counter() - began
+
+        began = time.perf_counter()
+        files_listed = len(os.listdir(files_dir))
+        files_list = time.perf_counter() - began
+
+        files_reads = []
+        for i in picks:
+            began = time.perf_counter()
+            with open(os.path.join(files_dir, names[i]), "rb") as f:
+                f.read()
+            files_reads.append(time.perf_counter() - began)
+
+        # Packs are filled the way existing installs get them
+        store = PackStore(os.path.join(packs_dir, "packs"))
+        began = time.perf_counter()
+        migrate_directory(files_dir, store, keep_files=True)
+        packs_write = time.perf_counter() - began
+
+        began = time.perf_counter()
+        packs_listed = store.stats()["files"]
+        packs_list = time.perf_counter() - began
+
+        packs_reads = []
+        for i in picks:
+            began = time.perf_counter()
+            blob = store.read(names[i])
+            packs_reads.append(time.perf_counter() - began)
+            assert len(blob) == sizes[i]
+        pack_count = len(store.packs()) + 1  # and the index
+        store.close()
+
+        assert files_listed == packs_listed == args.files
+        for label, created, write, listing, reads in (
+            ("file per frame", args.files, files_write, files_list, files_reads),
+            ("packs", pack_count, packs_write, packs_list, packs_reads),
+        ):
+            print(
+                f"{label:>15}: {created:6d} files  write {write:6.2f} s  list {listing * 1e3:7.1f} ms  "
+                f"read mean {np.mean(reads) * 1e6:6.1f} us p95 {np.percentile(reads, 95) * 1e6:6.1f} us"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""Measures the bytes saved by compressing OCR text and the cost of decoding it.
+
+Usage:
+    python benchmarks/text_compression.py [--db path/to/recall.db] [--n 20000]
+
+Trains a dictionary on the older half of the texts and compresses the newer
+half with every available codec, with and without the dictionary. Decode
+cost is reported per search results page. Without --db, synthetic screen
+text with the frame-to-frame repetition of real captures is used.
+"""
+
+import argparse
+import random
+import sqlite3
+import time
+import zlib
+
+from openrecall.text_codec import (
+    CODECS,
+    COMPRESSION_LEVEL,
+    TextDictionary,
+    train_dictionary,
+    zstandard,
+)
+
+# Rows decoded to render one page of search results (see app.SEARCH_PAGE_SIZE)
+PAGE_SIZE = 24
+
+CHROME = [
+    "File Edit View Selection Go Run Terminal Help",
+    "Inbox - Mail    Calendar    Contacts    Tasks",
+    "Settings > Privacy > Screen recording",
+    "Pull requests  Issues  Marketplace  Explore",
+]
+WORDS = "invoice meeting quarterly budget deploy review draft notes search results flights".split()
+
+
+def load_texts(db_path: str) -> list:
+    """Reads every plain OCR text from an OpenRecall database, oldest first."""
+    with sqlite3.connect(db_path) as conn:
+        return [
+            text
+            for (text,) in conn.execute("SELECT text FROM entries ORDER BY id")
+            if isinstance(text, str)
+        ]
+
+
+def synthetic_texts(n: int, seed: int = 0) -> list:
+    """Generates screens that mostly repeat the previous one with a few edits."""
+    rng = random.Random(seed)
+    lines = [rng.choice(CHROME)] + [" ".join(rng.choices(WORDS, k=8)) for _ in range(30)]
+    texts = []
+    for _ in range(n):
+        if rng.random() < 0.05:
+            lines[0] = rng.choice(CHROME)
+        for _ in range(rng.randint(0, 3)):
+            lines[rng.randrange(1, len(lines))] = " ".join(rng.choices(WORDS, k=8))
+        texts.append("\n".join(lines))
+    return texts
+
+
+def plain_codec(codec: str):
+    """Returns (compress, decompress) for a codec without a dictionary."""
+    if codec == "zstd":
+        compressor, decompressor = zstandard.ZstdCompressor(level=COMPRESSION_LEVEL), zstandard.ZstdDecompressor()
+        return (
+            lambda text: compressor.compress(text.encode("utf-8")),
+            lambda value: decompressor.decompress(value).decode("utf-8"),
+        )
+    return (
+        lambda text: zlib.compress(text.encode("utf-8"), COMPRESSION_LEVEL),
+        lambda value: zlib.decompress(value).decode("utf-8"),
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--db", help="OpenRecall database to read texts from")
+    parser.add_argument("--n", type=int, default=20_000, help="Synthetic text count")
+    parser.add_argument("--samples", type=int, default=2000, help="Texts to train the dictionary on")
+    args = parser.parse_args()
+
+    texts = load_texts(args.db) if args.db else synthetic_texts(args.n)
+    half = len(texts) // 2
+    training, texts = texts[max(0, half - args.samples):half], texts[half:]
+    raw_bytes = sum(len(text.encode("utf-8")) for text in texts)
+    print(f"{len(texts)} texts, {raw_bytes / 1e6:.2f} MB raw, dictionary trained on {len(training)}")
+
+    for codec in CODECS:
+        if codec == "zstd" and zstandard is None:
+            print("zstd: skipped, the zstandard package is not installed")
+            continue
+        start = time.perf_counter()
+        trained = train_dictionary(training, codec)
+        train_s = time.perf_counter() - start
+        dictionary = TextDictionary(1, codec, trained)
+        for label, compress, decompress in (
+            ("no dictionary", *plain_codec(codec)),
+            (f"{len(trained) // 1024} KiB dictionary", dictionary.compress, dictionary.decompress),
+        ):
+            start = time.perf_counter()
+            values = [compress(text) for text in texts]
+            encode_s = time.perf_counter() - start
+            start = time.perf_counter()
+            for value in values:
+                decompress(value)
+            decode_s = time.perf_counter() - start
+            stored = sum(len(value) for value in values)
+            print(
+                f"{codec:>4} {label:>18}: {stored / 1e6:7.2f} MB ({raw_bytes / stored:5.1f}x)  "
+                f"encode {encode_s * 1e6 / len(texts):6.1f} us/row  "
+                f"decode {decode_s * 1e6 / len(texts) * PAGE_SIZE:7.1f} us/page"
+                + (f"  training {train_s:.2f} s" if compress == dictionary.compress else "")
+            )
+
+
+if __name__ == "__main__":
+    main()
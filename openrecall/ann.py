@@ -0,0 +1,233 @@
+import os
+import threading
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from openrecall.vector_index import EmbeddingIndex, normalize, top_k
+
+# Number of vectors buffered (and searched exactly) before the coarse
+# quantizer is trained
+MIN_TRAIN_SIZE: int = 10_000
+KMEANS_ITERATIONS: int = 10
+# Upper bound on the sample used to train the coarse quantizer
+MAX_TRAIN_SAMPLE: int = 100_000
+
+
+def spherical_kmeans(
+    vectors: np.ndarray, n_clusters: int, iterations: int = KMEANS_ITERATIONS, seed: int = 0
+) -> np.ndarray:
+    """Clusters unit vectors by cosine similarity.
+
+    Args:
+        vectors: A (n, dim) array of L2-normalised vectors.
+        n_clusters: The number of centroids to produce.
+        iterations: The number of Lloyd iterations to run.
+        seed: Seed for the random initialisation.
+
+    Returns:
+        A (n_clusters, dim) float32 array of unit-length centroids.
+    """
+    rng = np.random.default_rng(seed)
+    n_clusters = min(n_clusters, len(vectors))
+    centroids = vectors[rng.choice(len(vectors), n_clusters, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = np.argmax(vectors @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, vectors)
+        counts = np.bincount(assignments, minlength=n_clusters)
+        # Re-seed empty clusters from random points so no list stays unused
+        empty = counts == 0
+        sums[empty] = vectors[rng.choice(len(vectors), int(empty.sum()))]
+        centroids = normalize(sums)
+    return centroids
+
+
+class IVFIndex:
+    """Approximate nearest-neighbour index using an inverted file (IVF).
+
+    Vectors are partitioned into `nlist` clusters by a spherical k-means
+    coarse quantizer. A query scores only the vectors in the `nprobe`
+    clusters whose centroids are closest to it, trading recall for latency.
+    Until `min_train_size` vectors have been added the index has no
+    quantizer and searches its buffered vectors exactly.
+    """
+
+    def __init__(
+        self,
+        nlist: Optional[int] = None,
+        nprobe: int = 8,
+        min_train_size: int = MIN_TRAIN_SIZE,
+    ) -> None:
+        """
+        Args:
+            nlist: The number of clusters. Defaults to 4 * sqrt(n) of the
+                   training set.
+            nprobe: The number of clusters scanned per query.
+            min_train_size: Vectors to buffer before training the quantizer.
+        """
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.min_train_size = min_train_size
+        self.centroids: Optional[np.ndarray] = None
+        self.last_id: int = 0
+        self._lists: List[EmbeddingIndex] = []
+        self._pending = EmbeddingIndex()
+        self._size: int = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def is_trained(self) -> bool:
+        return self.centroids is not None
+
+    def train(self, vectors: np.ndarray) -> None:
+        """Fits the coarse quantizer on a sample of `vectors`.
+
+        Args:
+            vectors: A (n, dim) array of raw embeddings.
+        """
+        vectors = normalize(vectors)
+        if len(vectors) > MAX_TRAIN_SAMPLE:
+            rng = np.random.default_rng(0)
+            vectors = vectors[rng.choice(len(vectors), MAX_TRAIN_SAMPLE, replace=False)]
+        nlist = self.nlist or max(1, int(4 * np.sqrt(len(vectors))))
+        self.centroids = spherical_kmeans(vectors, nlist)
+        self.nlist = len(self.centroids)
+        self._lists = [EmbeddingIndex(dim=self.centroids.shape[1]) for _ in range(self.nlist)]
+
+    def _assign(self, ids: np.ndarray, vectors: np.ndarray) -> None:
+        """Appends normalised vectors to the inverted list of their nearest centroid."""
+        assignments = np.argmax(vectors @ self.centroids.T, axis=1)
+        order = np.argsort(assignments, kind="stable")
+        bounds = np.searchsorted(assignments[order], np.arange(self.nlist + 1))
+        for list_no in np.flatnonzero(np.diff(bounds)):
+            members = order[bounds[list_no] : bounds[list_no + 1]]
+            self._lists[list_no].add_batch(ids[members], vectors[members])
+
+    def add_batch(self, ids: np.ndarray, embeddings: np.ndarray) -> None:
+        """Adds several embeddings, training the quantizer once enough are buffered.
+
+        Args:
+            ids: Entry ids, one per embedding.
+            embeddings: A (n, dim) array of raw embeddings.
+        """
+        if len(ids) == 0:
+            return
+        ids = np.asarray(ids, dtype=np.int64)
+        vectors = normalize(embeddings)
+        with self._lock:
+            if self.is_trained:
+                self._assign(ids, vectors)
+            else:
+                self._pending.add_batch(ids, vectors)
+                if len(self._pending) >= self.min_train_size:
+                    pending_ids, pending_vectors = self._pending.export()
+                    self.train(pending_vectors)
+                    self._assign(pending_ids, pending_vectors)
+                    self._pending = EmbeddingIndex()
+            self._size += len(ids)
+            self.last_id = max(self.last_id, int(ids.max()))
+
+    def add(self, entry_id: int, embedding: np.ndarray) -> None:
+        """Adds a single embedding.
+
+        Args:
+            entry_id: The id of the database entry the embedding belongs to.
+            embedding: The raw embedding vector.
+        """
+        self.add_batch(np.array([entry_id], dtype=np.int64), embedding)
+
+    def search(
+        self, query: np.ndarray, k: int, nprobe: Optional[int] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Finds approximately the `k` entries most similar to `query`.
+
+        Args:
+            query: The query embedding.
+            k: The maximum number of results to return.
+            nprobe: Overrides the number of clusters scanned for this query.
+
+        Returns:
+            A tuple (ids, scores) ordered by descending cosine similarity.
+        """
+        if not self.is_trained:
+            return self._pending.search(query, k)
+
+        query = normalize(query)[0]
+        nprobe = min(nprobe or self.nprobe, self.nlist)
+        probes = top_k(self.centroids @ query, nprobe)
+        candidate_ids = []
+        candidate_scores = []
+        for list_no in probes:
+            ids, scores = self._lists[list_no].search(query, k)
+            candidate_ids.append(ids)
+            candidate_scores.append(scores)
+        ids = np.concatenate(candidate_ids)
+        scores = np.concatenate(candidate_scores)
+        top = top_k(scores, k)
+        return ids[top], scores[top]
+
+    def save(self, path: str) -> None:
+        """Persists the index to `path`, replacing any previous file atomically.
+
+        Args:
+            path: The destination file (an uncompressed .npz archive).
+        """
+        with self._lock:
+            if self.is_trained:
+                exported = [inverted_list.export() for inverted_list in self._lists]
+            else:
+                exported = [self._pending.export()]
+            list_sizes = np.array([len(ids) for ids, _ in exported], dtype=np.int64)
+            ids = np.concatenate([ids for ids, _ in exported])
+            vectors = np.concatenate([vectors for _, vectors in exported])
+            centroids = self.centroids if self.is_trained else np.empty((0, 0), np.float32)
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "wb") as f:
+                np.savez(
+                    f,
+                    centroids=centroids,
+                    list_sizes=list_sizes,
+                    ids=ids,
+                    vectors=vectors,
+                    last_id=np.int64(self.last_id),
+                    nprobe=np.int64(self.nprobe),
+                )
+            os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str, nprobe: Optional[int] = None, min_train_size: int = MIN_TRAIN_SIZE) -> "IVFIndex":
+        """Loads an index previously written by `save`.
+
+        Args:
+            path: The file to read.
+            nprobe: Overrides the persisted nprobe if given.
+            min_train_size: Training threshold if the index is not yet trained.
+
+        Returns:
+            The restored IVFIndex.
+        """
+        with np.load(path) as data:
+            index = cls(nprobe=int(nprobe or data["nprobe"]), min_train_size=min_train_size)
+            centroids = data["centroids"]
+            list_sizes = data["list_sizes"]
+            ids = data["ids"]
+            vectors = data["vectors"]
+            last_id = int(data["last_id"])
+
+        offsets = np.concatenate([[0], np.cumsum(list_sizes)])
+        if centroids.size:
+            index.centroids = centroids
+            index.nlist = len(centroids)
+            index._lists = [EmbeddingIndex(dim=centroids.shape[1]) for _ in range(index.nlist)]
+            for list_no, inverted_list in enumerate(index._lists):
+                start, end = offsets[list_no], offsets[list_no + 1]
+                inverted_list.add_batch(ids[start:end], vectors[start:end])
+        else:
+            index._pending.add_batch(ids, vectors)
+        index._size = len(ids)
+        index.last_id = last_id
+        return index
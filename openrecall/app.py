@@ -1,17 +1,109 @@
+import os
+import time
 from threading import Thread
+from typing import Optional, Tuple, Union
 
 import numpy as np
-from flask import Flask, render_template_string, request, send_from_directory
+from flask import (
+    Flask,
+    Response,
+    abort,
+    jsonify,
+    render_template_string,
+    request,
+    send_from_directory,
+)
 from jinja2 import BaseLoader
 
-from openrecall.config import appdata_folder, screenshots_path
-from openrecall.database import create_db, get_all_entries, get_timestamps
-from openrecall.nlp import cosine_similarity, get_embedding
-from openrecall.screenshot import record_screenshots_thread
+# Imported first so its clock covers the imports below
+from openrecall import startup
+from openrecall import config
+from openrecall.ann import IVFIndex
+from openrecall.database import (
+    add_insert_listener,
+    attach_embedding_store,
+    create_db,
+    get_all_embeddings,
+    ROLLUP_GRANULARITIES,
+    get_entries_by_ids,
+    get_timeline_bounds,
+    get_timeline_buckets,
+    get_frames_window,
+    get_monitors,
+)
+from openrecall.embedding_store import EmbeddingStore
+from openrecall.encoding import MIME_TYPES, derived_filename, frame_to_png, load_frame
+from openrecall.nlp import EMBEDDING_DIM, MODEL_NAME, get_embedding, get_line_cache, get_model
+from openrecall.ocr import get_dirty_region_ocr, get_ocr
+from openrecall.packs import PackStore, get_pack_store
+from openrecall.quantization import QuantizedIndex, load_quantized_index
+from openrecall.retention import compaction_enabled, compaction_thread
+from openrecall.screenshot import drain_spool_thread, pipeline_stats, record_screenshots_thread
+from openrecall.spool import get_spool
+from openrecall.search import RANKING_SIZE, SearchCache, hybrid_search, parse_query
+from openrecall.segments import is_segment_frame
 from openrecall.utils import human_readable_time, timestamp_to_human_readable
+from openrecall.vector_index import EmbeddingIndex
+
+# Results shown per search page
+SEARCH_PAGE_SIZE: int = 24
+# Timestamps per timeline window fetched by the slider, and the most a
+# single /api/timeline request may ask for
+TIMELINE_WINDOW: int = 500
+TIMELINE_MAX_WINDOW: int = 5_000
+# Buckets shown by the timeline overview; the finest granularity that fits
+# the visible range in this many buckets is used
+TIMELINE_MAX_BUCKETS: int = 500
+# Persist the IVF index after this many new entries
+ANN_SAVE_INTERVAL: int = 10_000
 
 app = Flask(__name__)
 
+# Loaded once at startup by load_vector_index(); new entries reach it
+# through insert_entry
+vector_index: Union[EmbeddingIndex, EmbeddingStore, IVFIndex, QuantizedIndex] = EmbeddingIndex()
+search_cache = SearchCache()
+
+
+def load_vector_index() -> Union[EmbeddingStore, IVFIndex, QuantizedIndex]:
+    """Builds the search index selected by `--search-backend` and `--quantization`.
+
+    The memory-mapped embedding store is always attached to the database and
+    serves exact search directly, or rescores the shortlist of a quantized
+    index. The IVF index is restored from disk if present, caught up with the
+    rows inserted since it was last saved, and persisted again.
+    """
+    args = config.args
+    store = EmbeddingStore(config.embeddings_path, EMBEDDING_DIM, MODEL_NAME)
+    attach_embedding_store(store)
+    if args.search_backend != "ivf":
+        if args.quantization == "none":
+            return store
+        index = load_quantized_index(store, args.quantization)
+        add_insert_listener(index.add)
+        return index
+
+    ann_index_path = config.ann_index_path
+    if os.path.exists(ann_index_path):
+        index = IVFIndex.load(ann_index_path, nprobe=args.ivf_nprobe)
+    else:
+        index = IVFIndex(nlist=args.ivf_nlist, nprobe=args.ivf_nprobe)
+    index.add_batch(*get_all_embeddings(after_id=index.last_id))
+    index.save(ann_index_path)
+
+    saved_size = len(index)
+
+    def add_and_persist(entry_id: int, embedding: np.ndarray) -> None:
+        nonlocal saved_size
+        index.add(entry_id, embedding)
+        if len(index) - saved_size >= ANN_SAVE_INTERVAL:
+            index.save(ann_index_path)
+            saved_size = len(index)
+
+    add_insert_listener(add_and_persist)
+    return index
+
+
 app.jinja_env.filters["human_readable_time"] = human_readable_time
 app.jinja_env.filters["timestamp_to_human_readable"] = timestamp_to_human_readable
 
@@ -39,6 +131,20 @@ base_template = """
       margin-top: 10px;
       font-size: 1.2em;
     }
+    .overview {
+      display: flex;
+      align-items: flex-end;
+      width: 80%;
+      height: 60px;
+      margin: 0 auto;
+    }
+    .overview-bar {
+      flex: 1;
+      min-width: 1px;
+      margin-right: 1px;
+      background-color: #6c757d;
+      cursor: pointer;
+    }
     .image-container {
       margin-top: 20px;
       text-align: center;
@@ -53,7 +159,7 @@ base_template = """
 <nav class="navbar navbar-light bg-light">
   <div class="container">
     <form class="form-inline my-2 my-lg-0 w-100 d-flex" action="/search" method="get">
-      <input class="form-control flex-grow-1 mr-sm-2" type="search" name="q" placeholder="Search" aria-label="Search">
+      <input class="form-control flex-grow-1 mr-sm-2" type="search" name="q" placeholder="Search, e.g. invoice app:Firefox after:2024-05-01" aria-label="Search" value="{{ q|default('', true) }}">
       <button class="btn btn-outline-secondary my-2 my-sm-0" type="submit">
         <i class="bi bi-search"></i>
       </button>
@@ -86,39 +192,121 @@ app.jinja_env.loader = StringLoader()
 
 @app.route("/")
 def timeline():
-    # connect to db
-    timestamps = get_timestamps()
+    count, first, last = get_timeline_bounds()
+    monitor = request.args.get("monitor", 0, type=int)
     return render_template_string(
         """
 {% extends "base_template" %}
 {% block content %}
-{% if timestamps|length > 0 %}
+{% if count > 0 %}
   <div class="container">
+    {% if monitors|length > 1 %}
+    <ul class="nav nav-pills justify-content-center mt-3">
+      {% for m in monitors %}
+      <li class="nav-item">
+        <a class="nav-link {% if m == monitor %}active{% endif %}" href="/?monitor={{m}}">Monitor {{m + 1}}</a>
+      </li>
+      {% endfor %}
+    </ul>
+    {% endif %}
     <div class="slider-container">
-      <input type="range" class="slider custom-range" id="discreteSlider" min="0" max="{{timestamps|length - 1}}" step="1" value="{{timestamps|length - 1}}">
-      <div class="slider-value" id="sliderValue">{{timestamps[0] | timestamp_to_human_readable }}</div>
+      <div class="overview" id="overview"></div>
+      <button class="btn btn-link btn-sm" id="zoomOut" type="button">Zoom out</button>
+      <input type="range" class="slider custom-range" id="discreteSlider" min="{{first}}" max="{{last}}" step="1" value="{{last}}">
+      <div class="slider-value" id="sliderValue">{{last | timestamp_to_human_readable }}</div>
     </div>
     <div class="image-container">
-      <img id="timestampImage" src="/static/{{timestamps[0]}}.webp" alt="Image for timestamp">
+      <img id="timestampImage" alt="Image for timestamp">
     </div>
   </div>
   <script>
-    const timestamps = {{ timestamps|tojson }};
+    // The slider spans the recorded time range; frames are fetched from
+    // /api/timeline one window at a time around the scrubbed position
+    const windowSize = {{ window_size }};
+    const monitor = {{ monitor }};
     const slider = document.getElementById('discreteSlider');
     const sliderValue = document.getElementById('sliderValue');
     const timestampImage = document.getElementById('timestampImage');
+    let frames = [];  // Descending by timestamp, the currently loaded window
+    let pending = null;
+
+    function show(frame) {
+      sliderValue.textContent = new Date(frame.timestamp * 1000).toLocaleString();  // Convert to human-readable format
+      // Frames past --keep-images-days keep only their text
+      timestampImage.style.visibility = frame.filename ? 'visible' : 'hidden';
+      // A scaled-down preview; clicking it opens the full frame
+      if (frame.filename) { timestampImage.src = `/preview/${frame.filename}`; timestampImage.dataset.full = `/static/${frame.filename}`; }
+    }
 
-    slider.addEventListener('input', function() {
-      const reversedIndex = timestamps.length - 1 - slider.value;
-      const timestamp = timestamps[reversedIndex];
-      sliderValue.textContent = new Date(timestamp * 1000).toLocaleString();  // Convert to human-readable format
-      timestampImage.src = `/static/${timestamp}.webp`;
-    });
-
-    // Initialize the slider with a default value
-    slider.value = timestamps.length - 1;
-    sliderValue.textContent = new Date(timestamps[0] * 1000).toLocaleString();  // Convert to human-readable format
-    timestampImage.src = `/static/${timestamps[0]}.webp`;
+    function nearest(target) {
+      // Binary search for the newest frame at or before the target
+      let lo = 0, hi = frames.length - 1;
+      while (lo < hi) {
+        const mid = (lo + hi) >> 1;
+        if (frames[mid].timestamp <= target) { hi = mid; } else { lo = mid + 1; }
+      }
+      return frames[lo];
+    }
+
+    function inWindow(target) {
+      return frames.length > 0 &&
+        target <= frames[0].timestamp && target >= frames[frames.length - 1].timestamp;
+    }
+
+    function update() {
+      const target = Number(slider.value);
+      if (inWindow(target)) {
+        show(nearest(target));
+        return;
+      }
+      pending = target;
+      fetch(`/api/timeline?around=${target}&limit=${windowSize}&monitor=${monitor}`)
+        .then(response => response.json())
+        .then(data => {
+          if (pending !== target) { return; }  // A newer position was requested
+          frames = data.frames;
+          if (frames.length > 0) { show(nearest(target)); }
+        });
+    }
+
+    // Overview of the visible range from the precomputed rollups; clicking
+    // a bucket zooms the slider and the overview into it
+    const overview = document.getElementById('overview');
+
+    function loadOverview(start, end) {
+      fetch(`/api/timeline/buckets?start=${start}&end=${end}`)
+        .then(response => response.json())
+        .then(data => {
+          overview.innerHTML = '';
+          const maxCount = Math.max(1, ...data.buckets.map(bucket => bucket.frame_count));
+          for (const bucket of data.buckets) {
+            const bar = document.createElement('div');
+            bar.className = 'overview-bar';
+            bar.style.height = `${Math.max(5, 100 * bucket.frame_count / maxCount)}%`;
+            bar.title = `${new Date(bucket.start * 1000).toLocaleString()}: ` +
+              `${bucket.frame_count} frames, mostly ${bucket.dominant_app}`;
+            bar.addEventListener('click', () => zoom(
+              Math.max(bucket.start, {{first}}),
+              Math.min(bucket.start + data.seconds - 1, {{last}}),
+              bucket.representative_timestamp));
+            overview.appendChild(bar);
+          }
+        });
+    }
+
+    function zoom(start, end, focus) {
+      slider.min = start;
+      slider.max = end;
+      slider.value = focus ?? end;
+      loadOverview(start, end);
+      update();
+    }
+
+    document.getElementById('zoomOut').addEventListener('click', () => zoom({{first}}, {{last}}));
+    slider.addEventListener('input', update);
+    timestampImage.addEventListener('click', () => window.open(timestampImage.dataset.full, '_blank'));
+    loadOverview({{first}}, {{last}});
+    update();
   </script>
 {% else %}
   <div class="container">
@@ -129,19 +317,95 @@ def timeline():
 {% endif %}
 {% endblock %}
 """,
-        timestamps=timestamps,
+        count=count,
+        first=first,
+        last=last,
+        window_size=TIMELINE_WINDOW,
+        monitor=monitor,
+        monitors=get_monitors(),
+    )
+
+
+@app.route("/api/timeline")
+def timeline_window():
+    """Returns one window of frames plus the total count and bounds.
+
+    Query parameters (all optional):
+        before: Only frames older than this cursor.
+        after: Only frames newer than this cursor.
+        around: Frames on both sides of this time, e.g. a slider position.
+        limit: The window size, capped at TIMELINE_MAX_WINDOW.
+        monitor: Only frames of this monitor.
+    """
+    limit = min(max(request.args.get("limit", TIMELINE_WINDOW, type=int), 1), TIMELINE_MAX_WINDOW)
+    monitor = request.args.get("monitor", type=int)
+    around = request.args.get("around", type=int)
+    if around is not None:
+        half = limit // 2
+        frames = get_frames_window(after=around, limit=half, monitor=monitor) + get_frames_window(
+            before=around + 1, limit=limit - half, monitor=monitor
+        )
+    else:
+        frames = get_frames_window(
+            before=request.args.get("before", type=int),
+            after=request.args.get("after", type=int),
+            limit=limit,
+            monitor=monitor,
+        )
+    count, first, last = get_timeline_bounds()
+    return jsonify(
+        frames=[frame._asdict() for frame in frames], count=count, first=first, last=last
+    )
+
+
+@app.route("/api/timeline/buckets")
+def timeline_buckets():
+    """Returns the rollup buckets of a time range for the timeline overview.
+
+    Query parameters:
+        start, end: The range to cover, defaulting to the whole timeline.
+        granularity: "minute", "hour" or "day"; by default the finest one
+                     that covers the range in at most TIMELINE_MAX_BUCKETS.
+    """
+    _, first, last = get_timeline_bounds()
+    start = request.args.get("start", first, type=int)
+    end = request.args.get("end", last, type=int)
+    granularity = request.args.get("granularity")
+    if granularity not in ROLLUP_GRANULARITIES:
+        span = (end - start) if start is not None and end is not None else 0
+        granularity = next(
+            (name for name, seconds in ROLLUP_GRANULARITIES.items() if span // seconds < TIMELINE_MAX_BUCKETS),
+            "day",
+        )
+    buckets = get_timeline_buckets(granularity, start, end)
+    return jsonify(
+        granularity=granularity,
+        seconds=ROLLUP_GRANULARITIES[granularity],
+        buckets=[bucket._asdict() for bucket in buckets],
     )
 
 
 @app.route("/search")
 def search():
-    q = request.args.get("q")
-    entries = get_all_entries()
-    embeddings = [np.frombuffer(entry.embedding, dtype=np.float64) for entry in entries]
-    query_embedding = get_embedding(q)
-    similarities = [cosine_similarity(query_embedding, emb) for emb in embeddings]
-    indices = np.argsort(similarities)[::-1]
-    sorted_entries = [entries[i] for i in indices]
+    q = request.args.get("q", "")
+    page = max(request.args.get("page", 1, type=int), 1)
+    offset = (page - 1) * SEARCH_PAGE_SIZE
+
+    text, filters = parse_query(q)
+
+    def rank():
+        if text:
+            query_embedding = search_cache.embedding(text, get_embedding)
+        else:
+            query_embedding = np.zeros(EMBEDDING_DIM, dtype=np.float32)
+        return tuple(hybrid_search(text, query_embedding, vector_index, RANKING_SIZE, filters))
+
+    # Every page is a slice of one ranking; later pages keep using it even
+    # after new frames arrive, so results never move across page boundaries
+    ranking = search_cache.results((text, filters), rank, refresh=page == 1)
+    page_ids = list(ranking[offset : offset + SEARCH_PAGE_SIZE])
+    has_next = len(ranking) > offset + SEARCH_PAGE_SIZE
+    sorted_entries = get_entries_by_ids(page_ids)
 
     return render_template_string(
         """
@@ -152,41 +416,185 @@ def search():
             {% for entry in entries %}
                 <div class="col-md-3 mb-4">
                     <div class="card">
-                        <a href="#" data-toggle="modal" data-target="#modal-{{ loop.index0 }}">
-                            <img src="/static/{{ entry['timestamp'] }}.webp" alt="Image" class="card-img-top">
+                        {% if entry['filename'] %}
+                        <a href="#" data-toggle="modal" data-target="#imageModal" data-src="/static/{{ entry['filename'] }}">
+                            <img src="/thumbnail/{{ entry['filename'] }}" alt="Image" class="card-img-top" loading="lazy">
                         </a>
-                    </div>
-                </div>
-                <div class="modal fade" id="modal-{{ loop.index0 }}" tabindex="-1" role="dialog" aria-labelledby="exampleModalLabel" aria-hidden="true">
-                    <div class="modal-dialog modal-xl" role="document" style="max-width: none; width: 100vw; height: 100vh; padding: 20px;">
-                        <div class="modal-content" style="height: calc(100vh - 40px); width: calc(100vw - 40px); padding: 0;">
-                            <div class="modal-body" style="padding: 0;">
-                                <img src="/static/{{ entry['timestamp'] }}.webp" alt="Image" style="width: 100%; height: 100%; object-fit: contain; margin: 0 auto;">
-                            </div>
+                        {% else %}
+                        <div class="card-body">
+                            <h6 class="card-title">{{ entry['app'] }}</h6>
+                            <p class="card-text small">{{ entry['text'][:300] }}</p>
                         </div>
+                        {% endif %}
                     </div>
                 </div>
             {% endfor %}
         </div>
+        <nav>
+            <ul class="pagination justify-content-center">
+                <li class="page-item {% if page == 1 %}disabled{% endif %}">
+                    <a class="page-link" href="/search?{{ {'q': q, 'page': page - 1}|urlencode }}">Previous</a>
+                </li>
+                <li class="page-item disabled"><span class="page-link">{{ page }}</span></li>
+                <li class="page-item {% if not has_next %}disabled{% endif %}">
+                    <a class="page-link" href="/search?{{ {'q': q, 'page': page + 1}|urlencode }}">Next</a>
+                </li>
+            </ul>
+        </nav>
     </div>
+    <div class="modal fade" id="imageModal" tabindex="-1" role="dialog" aria-hidden="true">
+        <div class="modal-dialog modal-xl" role="document" style="max-width: none; width: 100vw; height: 100vh; padding: 20px;">
+            <div class="modal-content" style="height: calc(100vh - 40px); width: calc(100vw - 40px); padding: 0;">
+                <div class="modal-body" style="padding: 0;">
+                    <img id="modalImage" alt="Image" style="width: 100%; height: 100%; object-fit: contain; margin: 0 auto;">
+                </div>
+            </div>
+        </div>
+    </div>
+    <script>
+        // One shared modal; the full-size frame is only loaded when opened
+        document.addEventListener('DOMContentLoaded', function() {
+            $('#imageModal').on('show.bs.modal', function(event) {
+                document.getElementById('modalImage').src = $(event.relatedTarget).data('src');
+            });
+        });
+    </script>
 {% endblock %}
 """,
         entries=sorted_entries,
+        q=q,
+        page=page,
+        has_next=has_next,
+    )
+
+
+@app.route("/api/stats")
+def stats():
+    return jsonify(
+        line_cache=get_line_cache().stats(),
+        ocr=get_dirty_region_ocr().stats(),
+        packs=pack_stats(),
+        pipeline=pipeline_stats(),
+        spool=get_spool().stats(),
+        search_cache=search_cache.stats(),
+        startup=startup.startup_report(),
     )
 
 
 @app.route("/static/<filename>")
 def serve_image(filename):
-    return send_from_directory(screenshots_path, filename)
+    if is_segment_frame(filename):
+        # Rebuilt from its keyframe and deltas on demand
+        try:
+            pixels = load_frame(config.screenshots_path, filename)
+        except ValueError:
+            pixels = None
+        if pixels is None:
+            abort(404)
+        return Response(frame_to_png(pixels), mimetype="image/png")
+    packed = find_packed(filename)
+    if packed is not None:
+        return serve_packed(filename, *packed)
+    return send_from_directory(config.screenshots_path, filename)
+
+
+@app.route("/thumbnail/<filename>")
+def serve_thumbnail(filename):
+    return serve_derived(filename, "thumbnail")
+
+
+@app.route("/preview/<filename>")
+def serve_preview(filename):
+    return serve_derived(filename, "preview")
+
+
+def serve_derived(filename: str, kind: str):
+    """Serves a frame's thumbnail or preview, or the frame itself for frames saved without one."""
+    derived = derived_filename(filename, kind)
+    if os.path.exists(os.path.join(config.screenshots_path, derived)):
+        return send_from_directory(config.screenshots_path, derived)
+    packed = find_packed(derived)
+    if packed is not None:
+        return serve_packed(derived, *packed)
+    return serve_image(filename)
+
+
+def find_packed(name: str) -> Optional[Tuple[PackStore, Tuple[int, int, int]]]:
+    """Returns the pack store holding a file and the file's location in it, if packed."""
+    store = get_pack_store(config.screenshots_path, create=False)
+    location = store.locate(name) if store is not None else None
+    if location is None:
+        return None
+    return store, location
+
+
+def serve_packed(name: str, store: PackStore, location: Tuple[int, int, int]):
+    """Serves a file, or the single byte range requested of it, straight from its pack.
+
+    The ETag is the file's place in the packs, which changes whenever the
+    file is rewritten, e.g. when retention re-encodes it.
+    """
+    length = location[2]
+    etag = f"{location[0]}-{location[1]}"
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+    start, end, status = 0, length, 200
+    if request.range is not None:
+        byte_range = request.range.range_for_length(length)
+        if byte_range is not None:
+            (start, end), status = byte_range, 206
+        elif len(request.range.ranges) == 1:
+            return Response(status=416, headers={"Content-Range": f"bytes */{length}"})
+    response = Response(
+        store.read_at(location, start, end),
+        status=status,
+        mimetype=MIME_TYPES.get(os.path.splitext(name)[1], "application/octet-stream"),
+    )
+    response.set_etag(etag)
+    response.accept_ranges = "bytes"
+    if status == 206:
+        response.headers["Content-Range"] = f"bytes {start}-{end - 1}/{length}"
+    return response
+
+
+def pack_stats() -> Optional[dict]:
+    """Returns the stats of the pack store, or None if screenshots are not packed."""
+    store = get_pack_store(config.screenshots_path, create=False)
+    return store.stats() if store is not None else None
+
+
+def warm_models() -> None:
+    """Loads the embedding and OCR models ahead of their first use."""
+    get_model()
+    get_ocr()
 
 
 if __name__ == "__main__":
-    create_db()
+    config.parse_args()
+    startup.record_phase("imports", time.perf_counter() - startup.PROCESS_START)
 
-    print(f"Appdata folder: {appdata_folder}")
+    with startup.timed_phase("create_db"):
+        create_db()
+    with startup.timed_phase("load_vector_index"):
+        vector_index = load_vector_index()
+
+    print(f"Appdata folder: {config.appdata_folder}")
+
+    # Models load in the background while the web server starts serving
+    Thread(target=warm_models, daemon=True).start()
 
     # Start the thread to record screenshots
     t = Thread(target=record_screenshots_thread)
     t.start()
 
+    # OCRs and embeds frames spooled by --deferred-processing, also those
+    # left over from a previous run
+    Thread(target=drain_spool_thread, daemon=True).start()
+
+    # Applies the retention tiers while the user is idle, if any is set
+    if compaction_enabled():
+        Thread(target=compaction_thread, daemon=True).start()
+
     app.run(port=8082)
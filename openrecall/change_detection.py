@@ -0,0 +1,284 @@
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+# Side in pixels of the square blocks a frame is averaged over. A 3840x2160
+# frame becomes a 480x270 signature, fine enough that a changed line of text
+# still moves the block means it covers.
+SIGNATURE_BLOCK = 8
+# Block rows summed per pass when computing a signature
+SIGNATURE_BAND_ROWS = 16
+# Frames at or above this similarity are considered unchanged
+SIMILARITY_THRESHOLD = 0.9
+# Integer version of the 0.2989/0.5870/0.1140 luma weights, summing to 1024
+GRAY_WEIGHTS = np.array([306, 601, 117], dtype=np.uint32)
+GRAY_SCALE = 1024
+# Side in pixels of the tiles compared to find which regions of a frame changed
+TILE_SIZE = 32
+
+# (left, top, right, bottom) in pixels, right and bottom exclusive
+Rect = Tuple[int, int, int, int]
+
+
+def mean_structured_similarity_index(
+    img1: np.ndarray, img2: np.ndarray, L: int = 255
+) -> float:
+    """Calculates the Mean Structural Similarity Index (MSSIM) between two images.
+
+    Args:
+        img1: The first image as a NumPy array (RGB).
+        img2: The second image as a NumPy array (RGB).
+        L: The dynamic range of the pixel values (default is 255).
+
+    Returns:
+        The MSSIM value between the two images (float between -1 and 1).
+    """
+    K1, K2 = 0.01, 0.03
+    C1, C2 = (K1 * L) ** 2, (K2 * L) ** 2
+
+    def rgb2gray(img: np.ndarray) -> np.ndarray:
+        """Converts an RGB image to grayscale."""
+        return 0.2989 * img[..., 0] + 0.5870 * img[..., 1] + 0.1140 * img[..., 2]
+
+    img1_gray: np.ndarray = rgb2gray(img1)
+    img2_gray: np.ndarray = rgb2gray(img2)
+    mu1: float = np.mean(img1_gray)
+    mu2: float = np.mean(img2_gray)
+    sigma1_sq = np.var(img1_gray)
+    sigma2_sq = np.var(img2_gray)
+    sigma12 = np.mean((img1_gray - mu1) * (img2_gray - mu2))
+    ssim_index = ((2 * mu1 * mu2 + C1) * (2 * sigma12 + C2)) / (
+        (mu1**2 + mu2**2 + C1) * (sigma1_sq + sigma2_sq + C2)
+    )
+    return ssim_index
+
+
+def is_similar(
+    img1: np.ndarray, img2: np.ndarray, similarity_threshold: float = SIMILARITY_THRESHOLD
+) -> bool:
+    """Checks if two images are similar based on MSSIM.
+
+    Args:
+        img1: The first image as a NumPy array.
+        img2: The second image as a NumPy array.
+        similarity_threshold: The threshold above which images are considered similar.
+
+    Returns:
+        True if the images are similar, False otherwise.
+    """
+    similarity: float = mean_structured_similarity_index(img1, img2)
+    return similarity >= similarity_threshold
+
+
+def frame_signature(image: np.ndarray, block: int = SIGNATURE_BLOCK) -> np.ndarray:
+    """Reduces a frame to the grayscale means of its blocks.
+
+    The frame is summed in uint32 one band of SIGNATURE_BAND_ROWS block
+    rows at a time, so the only intermediate is the column sums of one
+    band (about 1.5 MB for a 3840 pixel wide frame), never a
+    full-resolution float, grayscale or copied array. Edge pixels that do
+    not fill a whole block are ignored.
+
+    Args:
+        image: The frame as an (height, width, 3) uint8 RGB array; extra
+            channels, such as alpha, are ignored.
+        block: The side of the square blocks in pixels.
+
+    Returns:
+        A (height // block, width // block) uint8 array.
+    """
+    block = max(1, min(block, image.shape[0], image.shape[1]))
+    rows, cols = image.shape[0] // block, image.shape[1] // block
+    signature = np.empty((rows, cols), dtype=np.uint8)
+    for top in range(0, rows, SIGNATURE_BAND_ROWS):
+        count = min(SIGNATURE_BAND_ROWS, rows - top)
+        # Splitting the row axis is always a view, even of a sliced frame
+        band = image[top * block : (top + count) * block, : cols * block, :3]
+        column_sums = band.reshape(count, block, cols * block, 3).sum(axis=1, dtype=np.uint32)
+        block_sums = column_sums.reshape(count, cols, block, 3).sum(axis=2, dtype=np.uint32)
+        signature[top : top + count] = (block_sums @ GRAY_WEIGHTS) // (GRAY_SCALE * block * block)
+    return signature
+
+
+def signature_similarity(sig1: np.ndarray, sig2: np.ndarray, L: int = 255) -> float:
+    """Calculates the MSSIM of two frame signatures.
+
+    Uses the same global statistics as `mean_structured_similarity_index`,
+    accumulated exactly in int64, so `SIMILARITY_THRESHOLD` keeps its
+    meaning. Identical signatures return 1.0 without computing them.
+
+    Args:
+        sig1: The first signature, from `frame_signature`.
+        sig2: The second signature, of the same shape.
+        L: The dynamic range of the pixel values (default is 255).
+
+    Returns:
+        The MSSIM value between the two signatures (float between -1 and 1).
+    """
+    if np.array_equal(sig1, sig2):
+        return 1.0
+    K1, K2 = 0.01, 0.03
+    C1, C2 = (K1 * L) ** 2, (K2 * L) ** 2
+
+    x = sig1.ravel().astype(np.int64)
+    y = sig2.ravel().astype(np.int64)
+    n = x.size
+    sum_x, sum_y = int(x.sum()), int(y.sum())
+    mu1, mu2 = sum_x / n, sum_y / n
+    sigma1_sq = (int(x @ x) - sum_x * sum_x / n) / n
+    sigma2_sq = (int(y @ y) - sum_y * sum_y / n) / n
+    sigma12 = (int(x @ y) - sum_x * sum_y / n) / n
+    return ((2 * mu1 * mu2 + C1) * (2 * sigma12 + C2)) / (
+        (mu1**2 + mu2**2 + C1) * (sigma1_sq + sigma2_sq + C2)
+    )
+
+
+class ChangeDetector:
+    """Decides which captured frames differ enough from the last kept one.
+
+    Only the signature of the last kept frame of each monitor is held, a
+    few hundred KB even for 4K displays, instead of the full frame.
+    """
+
+    def __init__(
+        self,
+        similarity_threshold: float = SIMILARITY_THRESHOLD,
+        block: int = SIGNATURE_BLOCK,
+    ) -> None:
+        """
+        Args:
+            similarity_threshold: Frames at or above this similarity to the
+                last kept frame of their monitor are considered unchanged.
+            block: The block size of the frame signatures.
+        """
+        self.similarity_threshold = similarity_threshold
+        self.block = block
+        self._signatures: Dict[int, np.ndarray] = {}
+
+    def has_changed(self, monitor: int, image: np.ndarray) -> bool:
+        """Checks a frame against the last kept frame of its monitor.
+
+        A changed frame becomes the new reference for its monitor. The first
+        frame of a monitor, or one whose resolution changed, counts as changed.
+
+        Args:
+            monitor: The monitor index the frame was captured from.
+            image: The frame as an RGB NumPy array.
+
+        Returns:
+            True if the frame should be kept.
+        """
+        signature = frame_signature(image, self.block)
+        last: Optional[np.ndarray] = self._signatures.get(monitor)
+        if (
+            last is not None
+            and last.shape == signature.shape
+            and signature_similarity(signature, last) >= self.similarity_threshold
+        ):
+            return False
+        self._signatures[monitor] = signature
+        return True
+
+    def reset(self) -> None:
+        """Forgets the last kept frame of every monitor."""
+        self._signatures.clear()
+
+
+def changed_tiles(previous: np.ndarray, current: np.ndarray, tile: int = TILE_SIZE) -> np.ndarray:
+    """Finds the tiles of a frame whose pixels differ from the previous frame.
+
+    The frames are compared one band of tile rows at a time, so no
+    full-resolution mask is allocated.
+
+    Args:
+        previous: The previous frame, of the same shape as `current`.
+        current: The current frame.
+        tile: The side of the square tiles in pixels.
+
+    Returns:
+        A boolean array of ceil(height / tile) by ceil(width / tile) tiles.
+    """
+    height, width = current.shape[:2]
+    rows, cols = -(-height // tile), -(-width // tile)
+    tiles = np.zeros((rows, cols), dtype=bool)
+    for row in range(rows):
+        band = slice(row * tile, (row + 1) * tile)
+        columns = (previous[band] != current[band]).any(axis=(0, 2))
+        if columns.any():
+            columns = np.pad(columns, (0, cols * tile - width))
+            tiles[row] = columns.reshape(cols, tile).any(axis=1)
+    return tiles
+
+
+def merge_rectangles(rects: Iterable[Rect]) -> List[Rect]:
+    """Merges overlapping or touching rectangles into their bounding boxes.
+
+    Args:
+        rects: (left, top, right, bottom) rectangles.
+
+    Returns:
+        Rectangles no two of which overlap or touch.
+    """
+    rects = list(rects)
+    merged = True
+    while merged:
+        merged = False
+        result: List[Rect] = []
+        for rect in rects:
+            for i, other in enumerate(result):
+                if rect[0] <= other[2] and other[0] <= rect[2] and rect[1] <= other[3] and other[1] <= rect[3]:
+                    result[i] = (
+                        min(rect[0], other[0]),
+                        min(rect[1], other[1]),
+                        max(rect[2], other[2]),
+                        max(rect[3], other[3]),
+                    )
+                    merged = True
+                    break
+            else:
+                result.append(rect)
+        rects = result
+    return rects
+
+
+def tile_rectangles(
+    tiles: np.ndarray, shape: Tuple[int, int], tile: int = TILE_SIZE, pad: int = 1
+) -> List[Rect]:
+    """Turns changed tiles into padded pixel rectangles.
+
+    Each changed tile is grown by `pad` tiles on every side, so that text
+    around a change is seen with some context, and the result is merged
+    into as few non-overlapping rectangles as possible.
+
+    Args:
+        tiles: A boolean tile array from `changed_tiles`.
+        shape: The (height, width) of the frame in pixels.
+        tile: The side of the tiles in pixels.
+        pad: The number of tiles to grow each changed tile by.
+
+    Returns:
+        (left, top, right, bottom) rectangles in pixels, clipped to the frame.
+    """
+    grown = tiles.copy()
+    for shift in range(1, pad + 1):
+        grown[shift:] |= tiles[:-shift]
+        grown[:-shift] |= tiles[shift:]
+    rows = grown.copy()
+    for shift in range(1, pad + 1):
+        grown[:, shift:] |= rows[:, :-shift]
+        grown[:, :-shift] |= rows[:, shift:]
+
+    height, width = shape
+    runs: List[Rect] = []
+    for row in np.flatnonzero(grown.any(axis=1)):
+        edges = np.flatnonzero(np.diff(np.concatenate(([0], grown[row].view(np.int8), [0]))))
+        for start, end in zip(edges[::2], edges[1::2]):
+            runs.append(
+                (
+                    int(start) * tile,
+                    int(row) * tile,
+                    min(int(end) * tile, width),
+                    min((int(row) + 1) * tile, height),
+                )
+            )
+    return merge_rectangles(runs)
@@ -1,6 +1,7 @@
 import os
 import sys
 import argparse
+from typing import List, Optional
 
 parser = argparse.ArgumentParser(description="OpenRecall")
 
@@ -17,7 +18,199 @@ parser.add_argument(
     default=False,
 )
 
-args = parser.parse_args()
+parser.add_argument(
+    "--search-backend",
+    choices=["exact", "ivf"],
+    default="exact",
+    help="Vector search engine: exact brute force or an approximate IVF index",
+)
+
+parser.add_argument(
+    "--ivf-nlist",
+    type=int,
+    default=None,
+    help="Number of IVF clusters (default: 4 * sqrt of the training set size)",
+)
+
+parser.add_argument(
+    "--ivf-nprobe",
+    type=int,
+    default=8,
+    help="Number of IVF clusters scanned per query; higher is slower but more accurate",
+)
+
+parser.add_argument(
+    "--quantization",
+    choices=["none", "int8", "float16"],
+    default="none",
+    help="Hold compact embedding codes in memory and rescore a shortlist at full precision",
+)
+
+parser.add_argument(
+    "--line-cache-size",
+    type=int,
+    default=20_000,
+    help="Number of per-line text embeddings cached in memory",
+)
+
+parser.add_argument(
+    "--line-cache-spill",
+    action="store_true",
+    default=False,
+    help="Spill line embeddings evicted from memory to a cache file on disk",
+)
+
+parser.add_argument(
+    "--inference-backend",
+    choices=["eager", "int8"],
+    default="eager",
+    help="Run the embedding and OCR models as shipped or with dynamic int8 quantization",
+)
+
+parser.add_argument(
+    "--full-frame-ocr",
+    action="store_true",
+    default=False,
+    help="OCR every changed frame in full instead of only the regions that changed",
+)
+
+parser.add_argument(
+    "--ocr-workers",
+    type=int,
+    default=1,
+    help="Threads running OCR on captured frames; frames of one monitor stay on one thread",
+)
+
+parser.add_argument(
+    "--embed-workers",
+    type=int,
+    default=1,
+    help="Threads computing the text embeddings of captured frames",
+)
+
+parser.add_argument(
+    "--save-workers",
+    type=int,
+    default=2,
+    help="Threads encoding and storing captured frames",
+)
+
+parser.add_argument(
+    "--image-format",
+    choices=["webp-lossless", "webp", "png", "avif"],
+    default="webp-lossless",
+    help="Format screenshots are saved in (avif needs Pillow AVIF support)",
+)
+
+parser.add_argument(
+    "--image-quality",
+    type=int,
+    default=80,
+    help="Quality of lossy webp and avif screenshots (0-100)",
+)
+
+parser.add_argument(
+    "--webp-method",
+    type=int,
+    choices=range(7),
+    default=4,
+    help="WebP encoder effort, from 0 (fastest) to 6 (smallest files)",
+)
+
+parser.add_argument(
+    "--frame-store",
+    choices=["files", "segments", "packs"],
+    default="files",
+    help="Save each screenshot as its own file, as keyframes and tile deltas "
+    "in one segment file per monitor and hour, or appended to large pack files",
+)
+
+parser.add_argument(
+    "--keyframe-interval",
+    type=int,
+    default=30,
+    help="With --frame-store segments, the maximum number of frames between keyframes",
+)
+
+parser.add_argument(
+    "--encode-processes",
+    type=int,
+    default=2,
+    help="Processes encoding screenshots off the recorder (0 encodes in the saving threads)",
+)
+
+parser.add_argument(
+    "--pipeline-queue-size",
+    type=int,
+    default=4,
+    help="Frames each processing stage may queue before --ocr-overflow or backpressure applies",
+)
+
+parser.add_argument(
+    "--ocr-overflow",
+    choices=["coalesce", "drop", "block"],
+    default="coalesce",
+    help="When OCR falls behind: replace a queued frame with the newer frame of its monitor, "
+    "drop the new frame, or delay capture until there is room",
+)
+
+parser.add_argument(
+    "--deferred-processing",
+    action="store_true",
+    default=False,
+    help="Only capture and save frames while you are active; OCR and embed them when idle",
+)
+
+parser.add_argument(
+    "--keep-lossless-days",
+    type=int,
+    default=0,
+    help="Days to keep screenshots lossless before re-encoding them lossy (default: 0, forever)",
+)
+
+parser.add_argument(
+    "--keep-images-days",
+    type=int,
+    default=0,
+    help="Days to keep screenshots at all; older frames keep only their text and embedding "
+    "(default: 0, forever)",
+)
+
+parser.add_argument(
+    "--retention-days",
+    type=int,
+    default=0,
+    help="Days to keep frames in the database (default: 0, forever)",
+)
+
+parser.add_argument(
+    "--compact-quality",
+    type=int,
+    default=60,
+    help="WebP quality used when re-encoding screenshots lossy",
+)
+
+parser.add_argument(
+    "--compact-max-width",
+    type=int,
+    default=1280,
+    help="Maximum width of re-encoded screenshots (0 keeps the original size)",
+)
+
+parser.add_argument(
+    "--text-compression",
+    choices=["auto", "zstd", "zlib", "none"],
+    default="auto",
+    help="Compress stored OCR text with a dictionary trained on your history "
+    "(auto: zstd if the zstandard package is installed, otherwise zlib)",
+)
+
+parser.add_argument(
+    "--shard-by-month",
+    action="store_true",
+    default=False,
+    help="Store each month of frames in its own database file under the storage path",
+)
 
 
 def get_appdata_folder(app_name="openrecall"):
@@ -37,17 +230,52 @@ def get_appdata_folder(app_name="openrecall"):
     return path
 
 
-if args.storage_path:
-    appdata_folder = args.storage_path
-    screenshots_path = os.path.join(appdata_folder, "screenshots")
-    db_path = os.path.join(appdata_folder, "recall.db")
-else:
-    appdata_folder = get_appdata_folder()
+def configure(parsed_args: argparse.Namespace) -> None:
+    """Sets the module-level settings and storage paths from parsed arguments.
+
+    Args:
+        parsed_args: The namespace produced by `parser`.
+    """
+    global args, appdata_folder, db_path, screenshots_path
+    global ann_index_path, embeddings_path, line_cache_path, shards_path, spool_path
+
+    args = parsed_args
+    if args.storage_path:
+        appdata_folder = args.storage_path
+    else:
+        appdata_folder = get_appdata_folder()
     db_path = os.path.join(appdata_folder, "recall.db")
     screenshots_path = os.path.join(appdata_folder, "screenshots")
+    ann_index_path = os.path.join(appdata_folder, "recall.ivf.npz")
+    embeddings_path = os.path.join(appdata_folder, "embeddings.f32")
+    line_cache_path = os.path.join(appdata_folder, "line_cache.db")
+    shards_path = os.path.join(appdata_folder, "shards")
+    spool_path = os.path.join(appdata_folder, "spool.db")
+
+    if not os.path.exists(screenshots_path):
+        try:
+            os.makedirs(screenshots_path)
+        except:
+            pass
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """Parses the command line and reconfigures the settings from it.
+
+    Entry points call this before doing any work; importing the package
+    never reads `sys.argv`.
+
+    Args:
+        argv: The arguments to parse, defaulting to `sys.argv[1:]`.
+
+    Returns:
+        The parsed arguments.
+    """
+    parsed_args = parser.parse_args(argv)
+    configure(parsed_args)
+    return parsed_args
+
 
-if not os.path.exists(screenshots_path):
-    try:
-        os.makedirs(screenshots_path)
-    except:
-        pass
+# Defaults until an entry point calls parse_args(); read settings as
+# `config.<name>` at call time so they pick up the parsed values
+configure(parser.parse_args([]))
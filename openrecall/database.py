@@ -1,43 +1,729 @@
+import atexit
+import os
+import queue
 import sqlite3
+import threading
 from collections import namedtuple
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timezone
+from urllib.request import pathname2url
 import numpy as np
-from typing import Any, List, Optional, Tuple
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
 
-from openrecall.config import db_path
+from openrecall import config
+from openrecall.embedding_store import EmbeddingStore
+from openrecall.text_codec import TextDictionary, dictionary_id, train_dictionary
 
 # Define the structure of a database entry using namedtuple
-Entry = namedtuple("Entry", ["id", "app", "title", "text", "timestamp", "embedding"])
+Entry = namedtuple(
+    "Entry",
+    ["id", "app", "title", "text", "timestamp", "embedding", "filename", "monitor"],
+    defaults=(None, 0),
+)
+# A row queued for the batched writer; see insert_entry for the fields
+PendingEntry = namedtuple(
+    "PendingEntry",
+    ["text", "timestamp", "embedding", "app", "title", "filename", "monitor",
+     "width", "height", "embedding_model", "ocr_model"],
+    defaults=(None, 0, None, None, None, None),
+)
+# One timeline frame: its entry id, capture time, monitor and image file
+Frame = namedtuple("Frame", ["id", "timestamp", "monitor", "filename"])
+# One precomputed timeline bucket; see get_timeline_buckets
+TimelineBucket = namedtuple(
+    "TimelineBucket",
+    ["start", "frame_count", "dominant_app", "representative_id", "representative_timestamp"],
+)
+
+# Search filters parsed from a query; None means unfiltered. `after` is
+# inclusive and `before` exclusive.
+SearchFilters = namedtuple(
+    "SearchFilters", ["app", "title", "after", "before", "monitor"], defaults=(None,) * 5
+)
+
+# One database file of the history. The base shard is recall.db itself, which
+# also holds the catalog of monthly shards (see get_shards). `start` and `end`
+# bound the timestamps in the shard, end exclusive; months are UTC months.
+# `first_id` and `last_id` bound the ids in a monthly shard, None while it is
+# empty or for the base shard.
+Shard = namedtuple(
+    "Shard", ["path", "name", "start", "end", "read_only", "first_id", "last_id"], defaults=(None, None)
+)
+
+# Storage tiers of a frame, from full quality to text and embedding only
+TIER_LOSSLESS: int = 0
+TIER_LOSSY: int = 1
+TIER_TEXT_ONLY: int = 2
+
+# Bucket widths in seconds of the timeline rollups, finest first. Buckets are
+# aligned to UTC.
+ROLLUP_GRANULARITIES: Dict[str, int] = {"minute": 60, "hour": 3600, "day": 86400}
+
+# Connection tuning: WAL lets readers run while the writer commits, and with
+# synchronous=NORMAL a WAL commit does not wait for an fsync
+MMAP_SIZE: int = 256 * 1024 * 1024
+CACHE_SIZE_KIB: int = 32 * 1024
+BUSY_TIMEOUT_SECONDS: float = 5.0
+# Maximum number of queued inserts committed in one transaction
+WRITE_BATCH_SIZE: int = 64
+# Threads querying shards concurrently for one search
+SHARD_SEARCH_THREADS: int = 4
+
+# Per-thread connections, keyed by database path
+_local = threading.local()
+
+# Memory-mapped copy of the embeddings, written in step with each insert
+_embedding_store: Optional[EmbeddingStore] = None
+
+# Callbacks invoked with (entry_id, embedding) after an insert is committed
+_insert_listeners: List[Callable[[int, np.ndarray], None]] = []
+
+# Text compression dictionaries by id, keyed by database path
+_text_dictionaries: Dict[str, Dict[int, TextDictionary]] = {}
+
+# Runs the per-shard queries of a search concurrently, started on first use
+_shard_pool: Optional[ThreadPoolExecutor] = None
+_shard_pool_lock = threading.Lock()
+
+
+def get_connection(path: Optional[str] = None, read_only: bool = False) -> sqlite3.Connection:
+    """
+    Returns the calling thread's connection to a database, opening it on first use.
+
+    Connections are kept open for the life of the thread instead of being
+    opened on every call, and are switched to WAL mode with tuned pragmas.
+    Use it as `with get_connection() as conn:` to commit on success and roll
+    back on error; the connection stays open afterwards.
+
+    Args:
+        path (Optional[str]): The database file; `config.db_path` by default.
+        read_only (bool): Open the file read-only, as sealed shards are.
+
+    Returns:
+        sqlite3.Connection: The connection to `path`.
+    """
+    path = path or config.db_path
+    connections: Dict[str, sqlite3.Connection] = getattr(_local, "connections", None)
+    if connections is None:
+        connections = _local.connections = {}
+    conn = connections.get(path)
+    if conn is None:
+        if read_only:
+            conn = sqlite3.connect(
+                f"file:{pathname2url(path)}?mode=ro", uri=True, timeout=BUSY_TIMEOUT_SECONDS
+            )
+        else:
+            conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT_SECONDS)
+            # Must precede anything that writes the file, so it only takes effect
+            # on a new database (older ones switch after a full VACUUM); lets
+            # retention hand freed pages back with incremental_vacuum()
+            conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+        conn.execute(f"PRAGMA cache_size=-{CACHE_SIZE_KIB}")
+        connections[path] = conn
+    return conn
+
+
+def _connect(shard: Shard) -> sqlite3.Connection:
+    """Returns the calling thread's connection to a shard."""
+    return get_connection(shard.path, read_only=shard.read_only)
+
+
+def close_connections(path: Optional[str] = None) -> None:
+    """
+    Closes the calling thread's pooled connections.
+
+    Args:
+        path (Optional[str]): Only close the connection to this file.
+    """
+    connections = getattr(_local, "connections", {})
+    for conn_path in [path] if path else list(connections):
+        conn = connections.pop(conn_path, None)
+        if conn is not None:
+            conn.close()
+
+
+def add_insert_listener(callback: Callable[[int, np.ndarray], None]) -> None:
+    """
+    Registers a callback to be notified of every committed insert.
+
+    Used to keep in-memory structures such as the search index in step with
+    the database without re-reading the table.
+
+    Args:
+        callback: Called with the new entry id and its embedding.
+    """
+    _insert_listeners.append(callback)
+
+
+# Keeps the external-content FTS5 index in step with the entries table
+_FTS_TRIGGERS = """
+    CREATE TRIGGER IF NOT EXISTS entries_fts_insert AFTER INSERT ON entries BEGIN
+        INSERT INTO entries_fts (rowid, text, app, title)
+        VALUES (new.id, new.text, new.app, new.title);
+    END;
+    CREATE TRIGGER IF NOT EXISTS entries_fts_delete AFTER DELETE ON entries BEGIN
+        INSERT INTO entries_fts (entries_fts, rowid, text, app, title)
+        VALUES ('delete', old.id, old.text, old.app, old.title);
+    END;
+    CREATE TRIGGER IF NOT EXISTS entries_fts_update
+    AFTER UPDATE OF text, app, title ON entries BEGIN
+        INSERT INTO entries_fts (entries_fts, rowid, text, app, title)
+        VALUES ('delete', old.id, old.text, old.app, old.title);
+        INSERT INTO entries_fts (rowid, text, app, title)
+        VALUES (new.id, new.text, new.app, new.title);
+    END;"""
+
+# Once text can be compressed, the triggers only index rows whose text is
+# stored plain, so they stay plain SQL that any client can run. The index
+# always holds the plain text: _insert_rows and delete_entries_before index
+# and unindex compressed rows themselves, and compressing a row's text does
+# not change what is indexed. For the same reason the FTS5 'rebuild'
+# command must not be used; see rebuild_text_index.
+_FTS_PLAIN_TEXT_TRIGGERS = """
+    CREATE TRIGGER IF NOT EXISTS entries_fts_insert AFTER INSERT ON entries
+    WHEN typeof(new.text) IS NOT 'blob' BEGIN
+        INSERT INTO entries_fts (rowid, text, app, title)
+        VALUES (new.id, new.text, new.app, new.title);
+    END;
+    CREATE TRIGGER IF NOT EXISTS entries_fts_delete AFTER DELETE ON entries
+    WHEN typeof(old.text) IS NOT 'blob' BEGIN
+        INSERT INTO entries_fts (entries_fts, rowid, text, app, title)
+        VALUES ('delete', old.id, old.text, old.app, old.title);
+    END;
+    CREATE TRIGGER IF NOT EXISTS entries_fts_update
+    AFTER UPDATE OF text, app, title ON entries
+    WHEN typeof(old.text) IS NOT 'blob' AND typeof(new.text) IS NOT 'blob' BEGIN
+        INSERT INTO entries_fts (entries_fts, rowid, text, app, title)
+        VALUES ('delete', old.id, old.text, old.app, old.title);
+        INSERT INTO entries_fts (rowid, text, app, title)
+        VALUES (new.id, new.text, new.app, new.title);
+    END;"""
 
 
 def create_db() -> None:
     """
-    Creates the SQLite database and the 'entries' table if they don't exist.
+    Creates the SQLite database if needed and migrates it to the current schema.
 
-    The table schema includes columns for an auto-incrementing ID, application name,
-    window title, extracted text, timestamp, and text embedding.
+    The schema version is kept in the 'schema_version' table, and every
+    migration in MIGRATIONS that the database has not seen yet is applied in
+    order. Databases created before versioning start at version 0; the
+    first migration only creates what is missing, so they upgrade in place.
     """
+    _migrate_database(config.db_path)
+    # Sealed shards are kept exactly as they were written
+    for shard in _catalog():
+        if not shard.read_only:
+            _migrate_database(shard.path)
+
+
+def _migrate_database(path: str) -> None:
+    """Brings one database file, recall.db or a shard, to the current schema."""
     try:
-        with sqlite3.connect(db_path) as conn:
+        with get_connection(path) as conn:
             cursor = conn.cursor()
-            cursor.execute(
-                """CREATE TABLE IF NOT EXISTS entries (
-                       id INTEGER PRIMARY KEY AUTOINCREMENT,
-                       app TEXT,
-                       title TEXT,
-                       text TEXT,
-                       timestamp INTEGER UNIQUE,
-                       embedding BLOB
-                   )"""
-            )
-            # Add index on timestamp for faster lookups
-            cursor.execute(
-                "CREATE INDEX IF NOT EXISTS idx_timestamp ON entries (timestamp)"
-            )
+            cursor.execute("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)")
+            row = cursor.execute("SELECT version FROM schema_version").fetchone()
+            if row is None:
+                cursor.execute("INSERT INTO schema_version (version) VALUES (0)")
             conn.commit()
+            for version in range(row[0] if row else 0, SCHEMA_VERSION):
+                MIGRATIONS[version](cursor)
+                cursor.execute("UPDATE schema_version SET version = ?", (version + 1,))
+                conn.commit()
     except sqlite3.Error as e:
         print(f"Database error during table creation: {e}")
 
 
+def _migrate_to_v1(cursor: sqlite3.Cursor) -> None:
+    """
+    Creates the original schema: entries, the FTS5 index, embedding codes and rollups.
+    """
+    cursor.execute(
+        """CREATE TABLE IF NOT EXISTS entries (
+               id INTEGER PRIMARY KEY AUTOINCREMENT,
+               app TEXT,
+               title TEXT,
+               text TEXT,
+               timestamp INTEGER UNIQUE,
+               embedding BLOB
+           )"""
+    )
+    # Add index on timestamp for faster lookups
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_timestamp ON entries (timestamp)"
+    )
+    # Serves app: search filters, optionally narrowed to a time range
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_app_timestamp ON entries (app COLLATE NOCASE, timestamp)"
+    )
+    # Full-text index over the OCR text, kept in sync by triggers
+    cursor.execute(
+        "SELECT name FROM sqlite_master WHERE type='table' AND name='entries_fts'"
+    )
+    fts_exists = cursor.fetchone() is not None
+    cursor.execute(
+        """CREATE VIRTUAL TABLE IF NOT EXISTS entries_fts USING fts5(
+               text, app, title, content='entries', content_rowid='id'
+           )"""
+    )
+    cursor.executescript(_FTS_TRIGGERS)
+    if not fts_exists:
+        # Index the rows of a database created before the FTS table
+        cursor.execute("INSERT INTO entries_fts (entries_fts) VALUES ('rebuild')")
+    # Quantized embedding codes, one row per entry (see quantization.py)
+    cursor.execute(
+        """CREATE TABLE IF NOT EXISTS embedding_codes (
+               id INTEGER PRIMARY KEY,
+               mode TEXT NOT NULL,
+               scale REAL NOT NULL,
+               codes BLOB NOT NULL
+           )"""
+    )
+    _create_rollups(cursor)
+
+
+def _migrate_to_v2(cursor: sqlite3.Cursor) -> None:
+    """
+    Records each frame's file, monitor, dimensions and model versions.
+
+    SQLite cannot relax the UNIQUE(timestamp) constraint in place, and frames
+    of several monitors share a timestamp, so the table is rebuilt with
+    UNIQUE(timestamp, monitor). Ids are kept, so the FTS index, the rollups
+    and the embedding store stay valid. Existing rows get the
+    `{timestamp}.webp` file name they were saved under and monitor 0.
+    """
+    columns = [row[1] for row in cursor.execute("PRAGMA table_info(entries)")]
+    if "filename" in columns:
+        return
+    cursor.executescript(
+        """BEGIN;
+           CREATE TABLE entries_v2 (
+               id INTEGER PRIMARY KEY AUTOINCREMENT,
+               app TEXT,
+               title TEXT,
+               text TEXT,
+               timestamp INTEGER NOT NULL,
+               embedding BLOB,
+               filename TEXT,
+               monitor INTEGER NOT NULL DEFAULT 0,
+               width INTEGER,
+               height INTEGER,
+               embedding_model TEXT,
+               ocr_model TEXT,
+               UNIQUE (timestamp, monitor)
+           );
+           INSERT INTO entries_v2 (id, app, title, text, timestamp, embedding, filename, monitor)
+           SELECT id, app, title, text, timestamp, embedding, timestamp || '.webp', 0 FROM entries;
+           -- Never hand out the ids of deleted rows again
+           UPDATE sqlite_sequence SET seq = MAX(seq, (SELECT seq FROM sqlite_sequence WHERE name = 'entries'))
+           WHERE name = 'entries_v2';
+           DROP TABLE entries;
+           ALTER TABLE entries_v2 RENAME TO entries;
+           CREATE INDEX idx_timestamp ON entries (timestamp);
+           CREATE INDEX idx_app_timestamp ON entries (app COLLATE NOCASE, timestamp);
+           -- Serves the per-monitor timeline and monitor: search filters
+           CREATE INDEX idx_monitor_timestamp ON entries (monitor, timestamp);"""
+        + _FTS_TRIGGERS
+        + "".join(_rollup_triggers(seconds) for seconds in ROLLUP_GRANULARITIES.values())
+        + "COMMIT;"
+    )
+
+
+def _migrate_to_v3(cursor: sqlite3.Cursor) -> None:
+    """
+    Tracks the storage tier of each frame for retention (see retention.py).
+    """
+    columns = [row[1] for row in cursor.execute("PRAGMA table_info(entries)")]
+    if "storage_tier" not in columns:
+        cursor.execute(
+            f"ALTER TABLE entries ADD COLUMN storage_tier INTEGER NOT NULL DEFAULT {TIER_LOSSLESS}"
+        )
+    # Lets compaction find the oldest frames of a tier with one range scan
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_tier_timestamp ON entries (storage_tier, timestamp)"
+    )
+
+
+def _migrate_to_v4(cursor: sqlite3.Cursor) -> None:
+    """
+    Adds the versioned dictionaries `entries.text` can be compressed with (see text_codec.py).
+    """
+    cursor.execute(
+        """CREATE TABLE IF NOT EXISTS text_dictionaries (
+               id INTEGER PRIMARY KEY AUTOINCREMENT,
+               codec TEXT NOT NULL,
+               dictionary BLOB NOT NULL,
+               max_entry_id INTEGER NOT NULL,
+               created_at INTEGER NOT NULL
+           )"""
+    )
+
+
+def _migrate_to_v5(cursor: sqlite3.Cursor) -> None:
+    """
+    Adds the catalog of monthly shards. Only the one in recall.db is used.
+    """
+    cursor.execute(
+        """CREATE TABLE IF NOT EXISTS shards (
+               name TEXT PRIMARY KEY,
+               start_time INTEGER NOT NULL,
+               end_time INTEGER NOT NULL,
+               read_only INTEGER NOT NULL DEFAULT 0
+           )"""
+    )
+
+
+def _migrate_to_v6(cursor: sqlite3.Cursor) -> None:
+    """
+    Limits the FTS triggers to rows whose text is stored plain.
+
+    Replaces the triggers that decompressed text through a Python SQL
+    function, which made every write from other SQLite clients fail.
+    """
+    cursor.executescript(
+        """BEGIN;
+           DROP TRIGGER IF EXISTS entries_fts_insert;
+           DROP TRIGGER IF EXISTS entries_fts_delete;
+           DROP TRIGGER IF EXISTS entries_fts_update;"""
+        + _FTS_PLAIN_TEXT_TRIGGERS
+        + "COMMIT;"
+    )
+
+
+def _migrate_to_v7(cursor: sqlite3.Cursor) -> None:
+    """
+    Indexes the entries whose text is not compressed yet, for compress_text_batch.
+    """
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_plain_text ON entries (id) WHERE typeof(text) = 'text'"
+    )
+
+
+def _migrate_to_v8(cursor: sqlite3.Cursor) -> None:
+    """
+    Records the range of ids held by each monthly shard in the catalog.
+
+    Lookups by id then only open the shards whose range holds one of the
+    ids. The ranges of existing shards are read from their files.
+    """
+    cursor.execute("ALTER TABLE shards ADD COLUMN first_id INTEGER")
+    cursor.execute("ALTER TABLE shards ADD COLUMN last_id INTEGER")
+    for (name,) in cursor.execute("SELECT name FROM shards").fetchall():
+        path = _shard_path(name)
+        if not os.path.exists(path):
+            continue
+        shard = sqlite3.connect(f"file:{pathname2url(path)}?mode=ro", uri=True)
+        try:
+            first, last = shard.execute("SELECT MIN(id), MAX(id) FROM entries").fetchone()
+        finally:
+            shard.close()
+        cursor.execute(
+            "UPDATE shards SET first_id = ?, last_id = ? WHERE name = ?", (first, last, name)
+        )
+
+
+# MIGRATIONS[n] upgrades a database from schema version n to n + 1
+MIGRATIONS: List[Callable[[sqlite3.Cursor], None]] = [
+    _migrate_to_v1,
+    _migrate_to_v2,
+    _migrate_to_v3,
+    _migrate_to_v4,
+    _migrate_to_v5,
+    _migrate_to_v6,
+    _migrate_to_v7,
+    _migrate_to_v8,
+]
+SCHEMA_VERSION: int = len(MIGRATIONS)
+
+
+def _rollup_triggers(seconds: int) -> str:
+    """Returns the triggers keeping the rollups of one granularity in step with entries."""
+    bucket = f"{seconds}, new.timestamp / {seconds}"
+    old_bucket = f"granularity = {seconds} AND bucket = old.timestamp / {seconds}"
+    new_count = f"""(SELECT frame_count FROM timeline_app_counts
+                     WHERE granularity = {seconds} AND bucket = new.timestamp / {seconds}
+                       AND app = COALESCE(new.app, ''))"""
+    return f"""
+        CREATE TRIGGER IF NOT EXISTS entries_rollup_{seconds}_insert AFTER INSERT ON entries BEGIN
+            INSERT INTO timeline_app_counts (granularity, bucket, app, frame_count)
+            VALUES ({bucket}, COALESCE(new.app, ''), 1)
+            ON CONFLICT DO UPDATE SET frame_count = frame_count + 1;
+            -- The latest frame of the most frequent app represents the bucket
+            INSERT INTO timeline_buckets
+                (granularity, bucket, frame_count, dominant_app, dominant_count, representative_id)
+            VALUES ({bucket}, 1, COALESCE(new.app, ''), 1, new.id)
+            ON CONFLICT DO UPDATE SET
+                frame_count = frame_count + 1,
+                dominant_app = CASE WHEN {new_count} >= dominant_count
+                                    THEN excluded.dominant_app ELSE dominant_app END,
+                representative_id = CASE WHEN {new_count} >= dominant_count
+                                         THEN new.id ELSE representative_id END,
+                dominant_count = MAX(dominant_count, {new_count});
+        END;
+        CREATE TRIGGER IF NOT EXISTS entries_rollup_{seconds}_delete AFTER DELETE ON entries BEGIN
+            UPDATE timeline_app_counts SET frame_count = frame_count - 1
+            WHERE {old_bucket} AND app = COALESCE(old.app, '');
+            DELETE FROM timeline_app_counts WHERE {old_bucket} AND frame_count <= 0;
+            UPDATE timeline_buckets SET frame_count = frame_count - 1 WHERE {old_bucket};
+            DELETE FROM timeline_buckets WHERE {old_bucket} AND frame_count <= 0;
+            UPDATE timeline_buckets SET (dominant_app, dominant_count) = (
+                SELECT app, frame_count FROM timeline_app_counts
+                WHERE {old_bucket} ORDER BY frame_count DESC LIMIT 1
+            ) WHERE {old_bucket};
+            UPDATE timeline_buckets SET representative_id = (
+                SELECT id FROM entries
+                WHERE timestamp >= (old.timestamp / {seconds}) * {seconds}
+                  AND timestamp < (old.timestamp / {seconds} + 1) * {seconds}
+                  AND COALESCE(app, '') = timeline_buckets.dominant_app
+                ORDER BY timestamp DESC LIMIT 1
+            ) WHERE {old_bucket} AND (
+                representative_id = old.id
+                OR (SELECT COALESCE(app, '') FROM entries WHERE id = representative_id) != dominant_app
+            );
+        END;"""
+
+
+def _create_rollups(cursor: sqlite3.Cursor) -> None:
+    """
+    Creates the timeline rollup tables and their triggers, backfilling new tables.
+
+    `timeline_buckets` holds one compact row per bucket, so a zoomed-out
+    timeline reads a bounded number of rows whatever the number of entries.
+    `timeline_app_counts` holds the per-app frame counts the dominant app is
+    derived from. Both are maintained by triggers as entries are inserted and
+    deleted.
+    """
+    cursor.execute(
+        "SELECT name FROM sqlite_master WHERE type='table' AND name='timeline_buckets'"
+    )
+    rollups_exist = cursor.fetchone() is not None
+    cursor.executescript(
+        """CREATE TABLE IF NOT EXISTS timeline_buckets (
+               granularity INTEGER NOT NULL,
+               bucket INTEGER NOT NULL,
+               frame_count INTEGER NOT NULL,
+               dominant_app TEXT NOT NULL,
+               dominant_count INTEGER NOT NULL,
+               representative_id INTEGER,
+               PRIMARY KEY (granularity, bucket)
+           ) WITHOUT ROWID;
+           CREATE TABLE IF NOT EXISTS timeline_app_counts (
+               granularity INTEGER NOT NULL,
+               bucket INTEGER NOT NULL,
+               app TEXT NOT NULL,
+               frame_count INTEGER NOT NULL,
+               PRIMARY KEY (granularity, bucket, app)
+           ) WITHOUT ROWID;"""
+        + "".join(_rollup_triggers(seconds) for seconds in ROLLUP_GRANULARITIES.values())
+    )
+    if rollups_exist:
+        return
+    # Roll up the rows of a database created before the rollup tables
+    for seconds in ROLLUP_GRANULARITIES.values():
+        cursor.execute(
+            """INSERT INTO timeline_app_counts (granularity, bucket, app, frame_count)
+               SELECT ?, timestamp / ?, COALESCE(app, ''), COUNT(*) FROM entries
+               GROUP BY timestamp / ?, COALESCE(app, '')""",
+            (seconds, seconds, seconds),
+        )
+    cursor.execute(
+        """INSERT INTO timeline_buckets
+               (granularity, bucket, frame_count, dominant_app, dominant_count, representative_id)
+           SELECT c.granularity, c.bucket,
+                  (SELECT SUM(frame_count) FROM timeline_app_counts t
+                   WHERE t.granularity = c.granularity AND t.bucket = c.bucket),
+                  c.app, c.frame_count,
+                  (SELECT id FROM entries
+                   WHERE timestamp >= c.bucket * c.granularity
+                     AND timestamp < (c.bucket + 1) * c.granularity
+                     AND COALESCE(app, '') = c.app
+                   ORDER BY timestamp DESC LIMIT 1)
+           FROM timeline_app_counts c
+           WHERE c.frame_count = (SELECT MAX(frame_count) FROM timeline_app_counts t
+                                  WHERE t.granularity = c.granularity AND t.bucket = c.bucket)
+           ON CONFLICT DO NOTHING"""
+    )
+
+
+def _shard_path(name: str) -> str:
+    return os.path.join(config.shards_path, f"{name}.db")
+
+
+def _month_bounds(timestamp: int) -> Tuple[str, int, int]:
+    """Returns the name, start and end of the UTC month containing a timestamp."""
+    moment = datetime.fromtimestamp(timestamp, tz=timezone.utc)
+    start = datetime(moment.year, moment.month, 1, tzinfo=timezone.utc)
+    end = datetime(moment.year + moment.month // 12, moment.month % 12 + 1, 1, tzinfo=timezone.utc)
+    return start.strftime("%Y-%m"), int(start.timestamp()), int(end.timestamp())
+
+
+def _catalog() -> List[Shard]:
+    """Returns the monthly shards recorded in the catalog, newest first."""
+    try:
+        with get_connection() as conn:
+            rows = conn.execute(
+                """SELECT name, start_time, end_time, read_only, first_id, last_id
+                   FROM shards ORDER BY start_time DESC"""
+            ).fetchall()
+    except sqlite3.Error as e:
+        print(f"Database error while reading the shard catalog: {e}")
+        return []
+    return [
+        Shard(_shard_path(name), name, start, end, bool(read_only), first_id, last_id)
+        for name, start, end, read_only, first_id, last_id in rows
+    ]
+
+
+def get_shards(
+    after: Optional[int] = None, before: Optional[int] = None, writable_only: bool = False
+) -> List[Shard]:
+    """
+    Lists the database files holding entries in a time range.
+
+    With `--shard-by-month`, frames are written to one file per UTC month
+    under `config.shards_path`, recorded in the catalog in recall.db.
+    recall.db itself is the base shard, holding the frames recorded without
+    sharding. Queries only visit the shards this returns, so a bounded time
+    range touches a bounded number of files.
+
+    Args:
+        after (Optional[int]): Inclusive lower bound on the timestamps.
+        before (Optional[int]): Exclusive upper bound on the timestamps.
+        writable_only (bool): Leave out sealed, read-only shards.
+
+    Returns:
+        List[Shard]: The overlapping shards, newest first. Without monthly
+                     shards, just the base shard with unknown bounds.
+    """
+    base = Shard(config.db_path, None, None, None, False)
+    shards = _catalog()
+    if not shards:
+        return [base]
+    try:
+        with get_connection() as conn:
+            # Separate subqueries so MIN and MAX are single idx_timestamp lookups
+            first, last = conn.execute(
+                "SELECT (SELECT MIN(timestamp) FROM entries), (SELECT MAX(timestamp) FROM entries)"
+            ).fetchone()
+    except sqlite3.Error as e:
+        print(f"Database error while reading the base shard bounds: {e}")
+        first = last = None
+    if first is not None:
+        shards.append(base._replace(start=first, end=last + 1))
+    shards.sort(key=lambda shard: shard.end, reverse=True)
+    return [
+        shard
+        for shard in shards
+        if (after is None or shard.end > after)
+        and (before is None or shard.start < before)
+        and not (writable_only and shard.read_only)
+    ]
+
+
+def _writable_shard(timestamp: int) -> Shard:
+    """
+    Returns the shard a new frame goes to, creating its monthly shard if needed.
+
+    Raises:
+        sqlite3.Error: If the month's shard has been sealed.
+    """
+    if not config.args.shard_by_month:
+        return Shard(config.db_path, None, None, None, False)
+    name, start, end = _month_bounds(timestamp)
+    with get_connection() as conn:
+        row = conn.execute("SELECT read_only FROM shards WHERE name = ?", (name,)).fetchone()
+    if row is not None and row[0]:
+        raise sqlite3.OperationalError(f"Shard {name} is sealed")
+    shard = Shard(_shard_path(name), name, start, end, False)
+    if row is None:
+        os.makedirs(config.shards_path, exist_ok=True)
+        _migrate_database(shard.path)
+        with get_connection() as conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO shards (name, start_time, end_time) VALUES (?, ?, ?)",
+                (name, start, end),
+            )
+    return shard
+
+
+def _next_entry_id() -> int:
+    """
+    Returns an id above any handed out in any shard, so ids stay unique across files.
+
+    Sealed shards take no new ids, so their highest ids are read from the
+    catalog; only the sequences of the writable files are opened.
+    """
+    with get_connection() as conn:
+        highest = conn.execute(
+            "SELECT COALESCE(MAX(last_id), 0) FROM shards WHERE read_only = 1"
+        ).fetchone()[0]
+    writable = [shard for shard in _catalog() if not shard.read_only]
+    for shard in [Shard(config.db_path, None, None, None, False), *writable]:
+        with _connect(shard) as conn:
+            row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'entries'").fetchone()
+        # The sequence of a new file is NULL until its first insert
+        highest = max(highest, (row[0] if row else None) or 0)
+    return highest + 1
+
+
+def _fan_out(shards: Sequence[Shard], query: Callable[[Shard], Any]) -> List[Any]:
+    """Runs `query` on every shard, concurrently if there are several."""
+    global _shard_pool
+    if len(shards) <= 1:
+        return [query(shard) for shard in shards]
+    with _shard_pool_lock:
+        if _shard_pool is None:
+            _shard_pool = ThreadPoolExecutor(
+                max_workers=SHARD_SEARCH_THREADS, thread_name_prefix="shard-search"
+            )
+    return list(_shard_pool.map(query, shards))
+
+
+def seal_shard(shard: Shard) -> bool:
+    """
+    Makes a monthly shard read-only.
+
+    The file is compacted with a full VACUUM and its write-ahead log folded
+    in and truncated, so the .db file alone holds the shard, no longer
+    changes, and can be archived or backed up once. Frames of its month can
+    no longer be added, and it is opened read-only from then on.
+
+    Args:
+        shard (Shard): The shard to seal.
+
+    Returns:
+        bool: True if the shard was sealed.
+    """
+    try:
+        conn = _connect(shard)
+        conn.execute("VACUUM")
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        with get_connection() as catalog:
+            catalog.execute("UPDATE shards SET read_only = 1 WHERE name = ?", (shard.name,))
+    except sqlite3.Error as e:
+        print(f"Database error while sealing shard {shard.name}: {e}")
+        return False
+    close_connections(shard.path)
+    return True
+
+
+def _drop_shard(shard: Shard) -> None:
+    """Removes a monthly shard from the catalog and deletes its file."""
+    with get_connection() as conn:
+        conn.execute("DELETE FROM shards WHERE name = ?", (shard.name,))
+    close_connections(shard.path)
+    for path in (shard.path, shard.path + "-wal", shard.path + "-shm"):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"Could not delete {path}: {e}")
+
+
 def get_all_entries() -> List[Entry]:
     """
     Retrieves all entries from the database.
@@ -47,27 +733,34 @@ def get_all_entries() -> List[Entry]:
                      Returns an empty list if the table is empty or an error occurs.
     """
     entries: List[Entry] = []
-    try:
-        with sqlite3.connect(db_path) as conn:
-            conn.row_factory = sqlite3.Row  # Return rows as dictionary-like objects
-            cursor = conn.cursor()
-            cursor.execute("SELECT id, app, title, text, timestamp, embedding FROM entries ORDER BY timestamp DESC")
-            results = cursor.fetchall()
-            for row in results:
-                # Deserialize the embedding blob back into a NumPy array
-                embedding = np.frombuffer(row["embedding"], dtype=np.float32) # Assuming float32, adjust if needed
-                entries.append(
-                    Entry(
-                        id=row["id"],
-                        app=row["app"],
-                        title=row["title"],
-                        text=row["text"],
-                        timestamp=row["timestamp"],
-                        embedding=embedding,
-                    )
+    for shard in get_shards():
+        try:
+            with _connect(shard) as conn:
+                cursor = conn.cursor()
+                cursor.row_factory = sqlite3.Row  # Return rows as dictionary-like objects
+                cursor.execute(
+                    """SELECT id, app, title, text, timestamp, embedding, filename, monitor
+                       FROM entries ORDER BY timestamp DESC"""
                 )
-    except sqlite3.Error as e:
-        print(f"Database error while fetching all entries: {e}")
+                results = cursor.fetchall()
+                for row in results:
+                    # Deserialize the embedding blob back into a NumPy array
+                    embedding = np.frombuffer(row["embedding"], dtype=np.float32) # Assuming float32, adjust if needed
+                    entries.append(
+                        Entry(
+                            id=row["id"],
+                            app=row["app"],
+                            title=row["title"],
+                            text=decode_text(row["text"], shard.path),
+                            timestamp=row["timestamp"],
+                            embedding=embedding,
+                            filename=row["filename"],
+                            monitor=row["monitor"],
+                        )
+                    )
+        except sqlite3.Error as e:
+            print(f"Database error while fetching all entries: {e}")
+    entries.sort(key=lambda entry: entry.timestamp, reverse=True)
     return entries
 
 
@@ -80,54 +773,1168 @@ def get_timestamps() -> List[int]:
                    Returns an empty list if the table is empty or an error occurs.
     """
     timestamps: List[int] = []
+    for shard in get_shards():
+        try:
+            with _connect(shard) as conn:
+                cursor = conn.cursor()
+                # Use the index for potentially faster retrieval
+                cursor.execute("SELECT timestamp FROM entries ORDER BY timestamp DESC")
+                results = cursor.fetchall()
+                timestamps.extend(result[0] for result in results)
+        except sqlite3.Error as e:
+            print(f"Database error while fetching timestamps: {e}")
+    timestamps.sort(reverse=True)
+    return timestamps
+
+
+def get_frames_window(
+    before: Optional[int] = None,
+    after: Optional[int] = None,
+    limit: int = 500,
+    monitor: Optional[int] = None,
+) -> List[Frame]:
+    """
+    Retrieves one window of frames using keyset pagination on the timestamp.
+
+    With `before`, returns the `limit` frames just older than it; with
+    `after`, the `limit` frames just newer than it; with neither, the newest
+    ones. Each window is a single range scan of idx_timestamp, or of
+    idx_monitor_timestamp for one monitor, however deep into the history it
+    starts. Frames carry their file name, so no file lookups are needed.
+    Shards are visited from the cursor outwards, stopping as soon as the
+    next one can only hold frames beyond the window.
+
+    Args:
+        before (Optional[int]): Exclusive upper bound (cursor) on the timestamps.
+        after (Optional[int]): Exclusive lower bound (cursor) on the timestamps.
+        limit (int): The maximum number of frames to return.
+        monitor (Optional[int]): Only frames of this monitor; all if None.
+
+    Returns:
+        List[Frame]: The frames, ordered by descending timestamp. Returns an
+                     empty list if there are none or an error occurs.
+    """
+    monitor_clause = "" if monitor is None else "AND monitor = ?"
+    monitor_params = [] if monitor is None else [monitor]
+    ascending = after is not None and before is None
+    shards = get_shards(after=after + 1 if after is not None else None, before=before)
+    if ascending:
+        shards.reverse()
+    frames: List[Frame] = []
+    for shard in shards:
+        if len(frames) >= limit:
+            edge = frames[limit - 1].timestamp
+            if (shard.start > edge) if ascending else (shard.end <= edge):
+                continue  # Only holds frames beyond the window
+        try:
+            with _connect(shard) as conn:
+                if ascending:
+                    # Walk the index upwards from the cursor
+                    cursor = conn.execute(
+                        f"""SELECT id, timestamp, monitor, filename FROM entries
+                            WHERE timestamp > ? {monitor_clause}
+                            ORDER BY timestamp ASC LIMIT ?""",
+                        [after, *monitor_params, limit],
+                    )
+                else:
+                    cursor = conn.execute(
+                        f"""SELECT id, timestamp, monitor, filename FROM entries
+                            WHERE timestamp < ? AND timestamp > ? {monitor_clause}
+                            ORDER BY timestamp DESC LIMIT ?""",
+                        [
+                            before if before is not None else 2**63 - 1,
+                            after if after is not None else -(2**63),
+                            *monitor_params,
+                            limit,
+                        ],
+                    )
+                frames.extend(Frame(*row) for row in cursor)
+        except sqlite3.Error as e:
+            print(f"Database error while fetching a frame window: {e}")
+        frames.sort(key=lambda frame: frame.timestamp, reverse=not ascending)
+        del frames[limit:]
+    # Flip the upward walk to descending
+    return frames[::-1] if ascending else frames
+
+
+def get_monitors() -> List[int]:
+    """
+    Retrieves the indexes of the monitors that have recorded frames.
+
+    Each monitor is found with one seek on idx_monitor_timestamp, instead of
+    scanning the table for distinct values.
+
+    Returns:
+        List[int]: The monitor indexes in ascending order; empty on error.
+    """
+    monitors = set()
+    for shard in get_shards():
+        try:
+            with _connect(shard) as conn:
+                monitor = conn.execute("SELECT MIN(monitor) FROM entries").fetchone()[0]
+                while monitor is not None:
+                    monitors.add(monitor)
+                    monitor = conn.execute(
+                        "SELECT MIN(monitor) FROM entries WHERE monitor > ?", (monitor,)
+                    ).fetchone()[0]
+        except sqlite3.Error as e:
+            print(f"Database error while fetching monitors: {e}")
+    return sorted(monitors)
+
+
+def get_timeline_buckets(
+    granularity: str, start: Optional[int] = None, end: Optional[int] = None
+) -> List[TimelineBucket]:
+    """
+    Retrieves the precomputed timeline rollups of one granularity.
+
+    Only the compact rollup table is read, so the cost depends on the number
+    of buckets in the range, not on the number of entries. Monthly shards
+    hold whole days, so a bucket only spans shards where the base shard
+    meets the first monthly one; its counts are then added up.
+
+    Args:
+        granularity (str): A key of ROLLUP_GRANULARITIES.
+        start (Optional[int]): Only buckets containing or after this timestamp.
+        end (Optional[int]): Only buckets starting at or before this timestamp.
+
+    Returns:
+        List[TimelineBucket]: The buckets in chronological order, each with its
+                              start timestamp, frame count, dominant app and the
+                              id and timestamp of its representative frame.
+                              Returns an empty list if an error occurs.
+    """
+    seconds = ROLLUP_GRANULARITIES[granularity]
+    buckets: Dict[int, TimelineBucket] = {}
+    shards = get_shards(
+        after=start // seconds * seconds if start is not None else None,
+        before=(end // seconds + 1) * seconds if end is not None else None,
+    )
+    for shard in shards:
+        try:
+            with _connect(shard) as conn:
+                cursor = conn.execute(
+                    """SELECT b.bucket * b.granularity, b.frame_count, b.dominant_app,
+                              b.representative_id, e.timestamp
+                       FROM timeline_buckets b LEFT JOIN entries e ON e.id = b.representative_id
+                       WHERE b.granularity = ? AND b.bucket >= ? AND b.bucket <= ?
+                       ORDER BY b.bucket""",
+                    (
+                        seconds,
+                        start // seconds if start is not None else -(2**63),
+                        end // seconds if end is not None else 2**63 - 1,
+                    ),
+                )
+                for bucket in cursor:
+                    bucket = TimelineBucket(*bucket)
+                    other = buckets.get(bucket.start)
+                    if other is not None:
+                        larger = max(bucket, other, key=lambda b: b.frame_count)
+                        bucket = larger._replace(frame_count=bucket.frame_count + other.frame_count)
+                    buckets[bucket.start] = bucket
+        except sqlite3.Error as e:
+            print(f"Database error while fetching timeline buckets: {e}")
+    return [buckets[bucket_start] for bucket_start in sorted(buckets)]
+
+
+def get_timeline_bounds() -> Tuple[int, Optional[int], Optional[int]]:
+    """
+    Retrieves the number of entries and the oldest and newest timestamps.
+
+    Returns:
+        Tuple[int, Optional[int], Optional[int]]: (count, first, last). The
+                                                  bounds are None if the table
+                                                  is empty or an error occurs.
+    """
+    count, firsts, lasts = 0, [], []
+    for shard in get_shards():
+        try:
+            with _connect(shard) as conn:
+                # Separate subqueries so MIN and MAX are single idx_timestamp lookups
+                shard_count, first, last = conn.execute(
+                    """SELECT (SELECT COUNT(*) FROM entries),
+                              (SELECT MIN(timestamp) FROM entries),
+                              (SELECT MAX(timestamp) FROM entries)"""
+                ).fetchone()
+        except sqlite3.Error as e:
+            print(f"Database error while fetching the timeline bounds: {e}")
+            continue
+        if shard_count:
+            count += shard_count
+            firsts.append(first)
+            lasts.append(last)
+    return count, min(firsts, default=None), max(lasts, default=None)
+
+
+def get_max_entry_id() -> int:
+    """
+    Retrieves the highest entry id, which only grows as entries are inserted.
+
+    Returns:
+        int: The maximum id, or 0 if the table is empty or an error occurs.
+    """
+    try:
+        with get_connection() as conn:
+            # The monthly shards' highest ids are kept in the catalog
+            return conn.execute(
+                """SELECT MAX((SELECT COALESCE(MAX(id), 0) FROM entries),
+                              (SELECT COALESCE(MAX(last_id), 0) FROM shards))"""
+            ).fetchone()[0]
+    except sqlite3.Error as e:
+        print(f"Database error while fetching the maximum entry id: {e}")
+        return 0
+
+
+def get_embedding_store() -> Optional[EmbeddingStore]:
+    """Returns the embedding store attached with `attach_embedding_store`, if any."""
+    return _embedding_store
+
+
+def attach_embedding_store(store: EmbeddingStore) -> None:
+    """
+    Makes `insert_entry` write every new embedding to `store` as well.
+
+    The store is first reconciled with the table: records whose SQL row never
+    committed are dropped, and rows missing from the store (for example when
+    upgrading an existing database) are copied over from the embedding blobs.
+
+    Args:
+        store (EmbeddingStore): The memory-mapped embedding store to attach.
+    """
+    global _embedding_store
+    store.truncate_after(get_max_entry_id())
+    ids, embeddings = get_all_embeddings(after_id=store.last_id)
+    if len(ids):
+        store.write(ids, embeddings)
+        store.commit()
+    _embedding_store = store
+
+
+def get_all_embeddings(after_id: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Retrieves the ids and embeddings of all entries, ordered by id.
+
+    Only the id and embedding columns are read, and the embeddings are packed
+    into a single contiguous array.
+
+    Args:
+        after_id (int): Only return entries with an id greater than this, so
+                        persisted indexes can catch up incrementally.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: An int64 array of ids and a float32
+                                       (n, dim) matrix of embeddings. Rows whose
+                                       embedding size differs from the first
+                                       row are skipped. Both arrays are empty if
+                                       the table is empty or an error occurs.
+    """
+    rows: List[Tuple[int, Optional[bytes]]] = []
+    for shard in get_shards():
+        try:
+            with _connect(shard) as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    "SELECT id, embedding FROM entries WHERE id > ? ORDER BY id", (after_id,)
+                )
+                rows.extend(cursor)
+        except sqlite3.Error as e:
+            print(f"Database error while fetching embeddings: {e}")
+    rows.sort(key=lambda row: row[0])
+    ids: List[int] = []
+    blobs: List[bytes] = []
+    for entry_id, blob in rows:
+        if blob is None or (blobs and len(blob) != len(blobs[0])):
+            continue
+        ids.append(entry_id)
+        blobs.append(blob)
+    if not blobs:
+        return np.empty(0, dtype=np.int64), np.empty((0, 0), dtype=np.float32)
+    matrix = np.frombuffer(b"".join(blobs), dtype=np.float32).reshape(len(blobs), -1)
+    return np.array(ids, dtype=np.int64), matrix
+
+
+def _shards_holding(ids: Sequence[int]) -> List[Shard]:
+    """Returns the shards whose id range in the catalog holds any of the ids, and the base shard."""
+    base = Shard(config.db_path, None, None, None, False)
+    wanted = np.sort(np.asarray(ids, dtype=np.int64))
+    shards = [base]
+    for shard in _catalog():
+        if shard.first_id is None:
+            continue
+        # The first wanted id at or above the start of the range
+        position = np.searchsorted(wanted, shard.first_id)
+        if position < len(wanted) and wanted[position] <= shard.last_id:
+            shards.append(shard)
+    return shards
+
+
+def get_entries_by_ids(ids: Sequence[int]) -> List[Entry]:
+    """
+    Retrieves the entries with the given ids, in the order the ids are given.
+
+    Meant for hydrating one page of search results in a single query per
+    shard, visiting only the shards whose id range in the catalog holds one
+    of the ids; the embedding column is not read, as ranking has already
+    happened.
+
+    Args:
+        ids (Sequence[int]): The ids of the entries to fetch.
+
+    Returns:
+        List[Entry]: The matching entries, with `embedding` set to None. Ids
+                     that do not exist are skipped. Returns an empty list if
+                     an error occurs.
+    """
+    if len(ids) == 0:
+        return []
+    rows_by_id = {}
+    for shard in _shards_holding(ids):
+        try:
+            with _connect(shard) as conn:
+                cursor = conn.cursor()
+                cursor.row_factory = sqlite3.Row
+                placeholders = ",".join("?" * len(ids))
+                cursor.execute(
+                    f"""SELECT id, app, title, text, timestamp, filename, monitor
+                        FROM entries WHERE id IN ({placeholders})""",
+                    [int(i) for i in ids],
+                )
+                for row in cursor:
+                    rows_by_id[row["id"]] = Entry(
+                        id=row["id"],
+                        app=row["app"],
+                        title=row["title"],
+                        text=decode_text(row["text"], shard.path),
+                        timestamp=row["timestamp"],
+                        embedding=None,
+                        filename=row["filename"],
+                        monitor=row["monitor"],
+                    )
+        except sqlite3.Error as e:
+            print(f"Database error while fetching entries by id: {e}")
+    return [rows_by_id[int(i)] for i in ids if int(i) in rows_by_id]
+
+
+def to_fts_query(query: str) -> str:
+    """
+    Turns free text into an FTS5 query matching all of its terms.
+
+    Every whitespace-separated term is quoted, so punctuation in hostnames,
+    ticket numbers and error codes is matched literally instead of being
+    parsed as FTS5 syntax.
+
+    Args:
+        query (str): The user's search string.
+
+    Returns:
+        str: The FTS5 MATCH expression, empty if the query has no terms.
+    """
+    return " ".join('"' + term.replace('"', '""') + '"' for term in query.split())
+
+
+def _filter_clause(filters: SearchFilters, table: str = "entries") -> Tuple[str, List[Any]]:
+    """
+    Builds the SQL condition selecting the rows of `table` that pass `filters`.
+
+    The app, monitor and time bounds are answered by idx_app_timestamp,
+    idx_monitor_timestamp or idx_timestamp, and the title by the title column of the FTS5 index.
+    """
+    conditions: List[str] = []
+    params: List[Any] = []
+    if filters.app is not None:
+        conditions.append(f"{table}.app = ? COLLATE NOCASE")
+        params.append(filters.app)
+    if filters.monitor is not None:
+        conditions.append(f"{table}.monitor = ?")
+        params.append(filters.monitor)
+    if filters.after is not None:
+        conditions.append(f"{table}.timestamp >= ?")
+        params.append(filters.after)
+    if filters.before is not None:
+        conditions.append(f"{table}.timestamp < ?")
+        params.append(filters.before)
+    if filters.title is not None:
+        conditions.append(
+            f"{table}.id IN (SELECT rowid FROM entries_fts WHERE entries_fts MATCH ?)"
+        )
+        params.append(f"title : ({to_fts_query(filters.title)})")
+    return " AND ".join(conditions) or "1", params
+
+
+def filter_entry_ids(filters: SearchFilters) -> np.ndarray:
+    """
+    Retrieves the ids of the entries that pass the search filters.
+
+    The filters are evaluated through indexes, so the cost follows the size
+    of the matching subset rather than the table. Only the shards overlapping
+    the `after`/`before` range are queried, concurrently.
+
+    Args:
+        filters (SearchFilters): The filters to apply.
+
+    Returns:
+        np.ndarray: The matching ids as a sorted int64 array; empty if none
+                    match or an error occurs.
+    """
+    if filters.title is not None and not to_fts_query(filters.title):
+        filters = filters._replace(title=None)
+    where, params = _filter_clause(filters)
+
+    def query(shard: Shard) -> List[int]:
+        try:
+            with _connect(shard) as conn:
+                cursor = conn.execute(f"SELECT id FROM entries WHERE {where} ORDER BY id", params)
+                return [row[0] for row in cursor]
+        except sqlite3.Error as e:
+            print(f"Database error while filtering entries: {e}")
+            return []
+
+    ids = [entry_id for shard_ids in _fan_out(get_shards(filters.after, filters.before), query) for entry_id in shard_ids]
+    return np.sort(np.array(ids, dtype=np.int64))
+
+
+def keyword_search(
+    query: str, limit: int, filters: Optional[SearchFilters] = None
+) -> List[Tuple[int, float]]:
+    """
+    Ranks entries by BM25 relevance of their text, app and title to `query`.
+
+    The search runs entirely inside SQLite's FTS5 index. It fans out to the
+    shards overlapping the filters' time range concurrently and merges each
+    shard's top `limit`; BM25 statistics are per shard, so scores from
+    different months are close to, not exactly, comparable.
+
+    Args:
+        query (str): The user's search string.
+        limit (int): The maximum number of results.
+        filters (Optional[SearchFilters]): Only rank entries passing these.
+
+    Returns:
+        List[Tuple[int, float]]: (entry id, bm25 score) pairs, best first. FTS5
+                                 scores are negative; lower is more relevant.
+                                 Returns an empty list on error or empty query.
+    """
+    match = to_fts_query(query)
+    if not match:
+        return []
+    if filters is None:
+        sql = """SELECT rowid, bm25(entries_fts) FROM entries_fts
+                 WHERE entries_fts MATCH ? ORDER BY rank LIMIT ?"""
+        params: List[Any] = [match, limit]
+        shards = get_shards()
+    else:
+        if filters.title is not None and to_fts_query(filters.title):
+            match = f"({match}) AND title : ({to_fts_query(filters.title)})"
+        where, params = _filter_clause(filters._replace(title=None))
+        sql = f"""SELECT entries_fts.rowid, bm25(entries_fts) FROM entries_fts
+                  JOIN entries ON entries.id = entries_fts.rowid
+                  WHERE entries_fts MATCH ? AND {where} ORDER BY rank LIMIT ?"""
+        params = [match, *params, limit]
+        shards = get_shards(filters.after, filters.before)
+
+    def search(shard: Shard) -> List[Tuple[int, float]]:
+        try:
+            with _connect(shard) as conn:
+                return conn.execute(sql, params).fetchall()
+        except sqlite3.Error as e:
+            print(f"Database error during keyword search: {e}")
+            return []
+
+    results = [result for shard_results in _fan_out(shards, search) for result in shard_results]
+    if len(shards) > 1:
+        results.sort(key=lambda result: result[1])
+    return results[:limit]
+
+
+def get_embedding_codes(mode: str, dim: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Retrieves the persisted quantized embedding codes of one mode, ordered by id.
+
+    The codes of every shard are kept in recall.db.
+
+    Args:
+        mode (str): The quantization mode ("int8" or "float16").
+        dim (int): The embedding dimension.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray]: The ids, a (n, dim) array of
+                                                   codes and the per-row scales.
+    """
+    code_dtype = np.int8 if mode == "int8" else np.float16
+    ids: List[int] = []
+    scales: List[float] = []
+    blobs: List[bytes] = []
     try:
-        with sqlite3.connect(db_path) as conn:
+        with get_connection() as conn:
             cursor = conn.cursor()
-            # Use the index for potentially faster retrieval
-            cursor.execute("SELECT timestamp FROM entries ORDER BY timestamp DESC")
-            results = cursor.fetchall()
-            timestamps = [result[0] for result in results]
+            cursor.execute(
+                "SELECT id, scale, codes FROM embedding_codes WHERE mode = ? ORDER BY id", (mode,)
+            )
+            for entry_id, scale, blob in cursor:
+                ids.append(entry_id)
+                scales.append(scale)
+                blobs.append(blob)
     except sqlite3.Error as e:
-        print(f"Database error while fetching timestamps: {e}")
-    return timestamps
+        print(f"Database error while fetching embedding codes: {e}")
+    codes = np.frombuffer(b"".join(blobs), dtype=code_dtype).reshape(len(blobs), dim)
+    return np.array(ids, dtype=np.int64), codes, np.array(scales, dtype=np.float32)
+
+
+def insert_embedding_codes(
+    mode: str, ids: np.ndarray, codes: np.ndarray, scales: np.ndarray
+) -> None:
+    """
+    Persists quantized embedding codes, replacing any codes of another mode.
+
+    Args:
+        mode (str): The quantization mode the codes were produced with.
+        ids (np.ndarray): The entry ids.
+        codes (np.ndarray): A (n, dim) array of codes.
+        scales (np.ndarray): The per-row scales.
+    """
+    if len(ids) == 0:
+        return
+    try:
+        with get_connection() as conn:
+            conn.execute("DELETE FROM embedding_codes WHERE mode != ?", (mode,))
+            conn.executemany(
+                "INSERT OR REPLACE INTO embedding_codes (id, mode, scale, codes) VALUES (?, ?, ?, ?)",
+                zip(ids.tolist(), [mode] * len(ids), scales.tolist(), (row.tobytes() for row in codes)),
+            )
+            conn.commit()
+    except sqlite3.Error as e:
+        print(f"Database error while storing embedding codes: {e}")
+
+
+def get_compaction_batch(
+    tiers: Sequence[int], before: int, limit: int
+) -> List[Tuple[int, Optional[str]]]:
+    """
+    Retrieves the oldest frames in the given storage tiers older than a cutoff.
+
+    Sealed shards are left out; they are only sealed once fully compacted.
+
+    Args:
+        tiers (Sequence[int]): The storage tiers to select from.
+        before (int): Only frames with a timestamp older than this.
+        limit (int): The maximum number of frames.
+
+    Returns:
+        List[Tuple[int, Optional[str]]]: (entry id, file name) pairs, oldest
+                                         first; empty on error.
+    """
+    placeholders = ",".join("?" * len(tiers))
+    frames: List[Tuple[int, Optional[str]]] = []
+    for shard in reversed(get_shards(before=before, writable_only=True)):
+        if len(frames) >= limit:
+            break
+        try:
+            with _connect(shard) as conn:
+                frames.extend(
+                    conn.execute(
+                        f"""SELECT id, filename FROM entries
+                            WHERE storage_tier IN ({placeholders}) AND timestamp < ?
+                            ORDER BY timestamp LIMIT ?""",
+                        [*tiers, before, limit - len(frames)],
+                    )
+                )
+        except sqlite3.Error as e:
+            print(f"Database error while selecting frames to compact: {e}")
+    return frames
+
+
+def set_storage_tiers(
+    updates: Sequence[Tuple[int, int, Optional[str], Optional[int], Optional[int]]]
+) -> None:
+    """
+    Records the new storage tier, file name and dimensions of compacted frames.
+
+    Args:
+        updates: (entry id, tier, file name, width, height) per frame; the
+                 file name is None once the image has been removed.
+    """
+    if not updates:
+        return
+    # Updating by primary key is a no-op in the shards not holding the id
+    for shard in get_shards(writable_only=True):
+        try:
+            with _connect(shard) as conn:
+                conn.executemany(
+                    """UPDATE entries SET storage_tier = ?, filename = ?,
+                              width = COALESCE(?, width), height = COALESCE(?, height)
+                       WHERE id = ?""",
+                    [(tier, filename, width, height, entry_id) for entry_id, tier, filename, width, height in updates],
+                )
+        except sqlite3.Error as e:
+            print(f"Database error while recording compacted frames: {e}")
+
+
+def delete_entries_before(before: int, limit: int) -> List[Optional[str]]:
+    """
+    Deletes up to `limit` of the oldest entries older than a cutoff, in one transaction per shard.
+
+    The FTS index and timeline rollups follow through their triggers, except
+    for compressed text, which is unindexed here (see _FTS_PLAIN_TEXT_TRIGGERS), and
+    the entries' quantized codes are deleted with them. The embedding store
+    is append-only and keeps their records; search skips ids that no longer
+    exist when it hydrates results, and the quantized index keeps an empty
+    row for them on its next load (see QuantizedIndex.load_codes). A monthly shard entirely older than the
+    cutoff is dropped as a whole by deleting its file, whatever `limit` is;
+    sealed shards are only ever dropped that way.
+
+    Args:
+        before (int): Only entries with a timestamp older than this.
+        limit (int): The maximum number of entries to delete.
+
+    Returns:
+        List[Optional[str]]: The file names of the deleted entries, so their
+                             images can be removed; empty on error.
+    """
+    deleted: List[Tuple[int, Optional[str]]] = []
+    for shard in reversed(get_shards(before=before)):
+        if len(deleted) >= limit:
+            break
+        try:
+            if shard.name is not None and shard.end <= before:
+                with _connect(shard) as conn:
+                    rows = conn.execute("SELECT id, filename FROM entries").fetchall()
+                _drop_shard(shard)
+            elif not shard.read_only:
+                with _connect(shard) as conn:
+                    selected = conn.execute(
+                        """SELECT id, filename, text, app, title FROM entries
+                           WHERE timestamp < ? ORDER BY timestamp LIMIT ?""",
+                        (before, limit - len(deleted)),
+                    ).fetchall()
+                    _unindex_compressed_text(conn, shard, selected)
+                    rows = [(entry_id, filename) for entry_id, filename, *_ in selected]
+                    conn.executemany("DELETE FROM entries WHERE id = ?", [(entry_id,) for entry_id, _ in rows])
+            else:
+                continue
+            deleted.extend(rows)
+        except sqlite3.Error as e:
+            print(f"Database error while deleting old entries: {e}")
+    try:
+        # Codes of every shard are kept in recall.db
+        with get_connection() as conn:
+            conn.executemany("DELETE FROM embedding_codes WHERE id = ?", [(entry_id,) for entry_id, _ in deleted])
+    except sqlite3.Error as e:
+        print(f"Database error while deleting old embedding codes: {e}")
+    return [filename for _, filename in deleted]
+
+
+def _unindex_compressed_text(
+    conn: sqlite3.Connection, shard: Shard, rows: Sequence[Tuple[int, Optional[str], Any, str, str]]
+) -> None:
+    """Removes the FTS rows of entries about to be deleted whose text is compressed."""
+    conn.executemany(
+        """INSERT INTO entries_fts (entries_fts, rowid, text, app, title)
+           VALUES ('delete', ?, ?, ?, ?)""",
+        [
+            (entry_id, decode_text(text, shard.path), app, title)
+            for entry_id, _, text, app, title in rows
+            if isinstance(text, bytes)
+        ],
+    )
+
+
+def rebuild_text_index() -> int:
+    """
+    Rebuilds the FTS index of every writable database file from the plain text.
+
+    Replaces the FTS5 'rebuild' command, which would index compressed
+    values as they are stored rather than their text.
+
+    Returns:
+        int: The number of entries indexed.
+    """
+    indexed = 0
+    for shard in get_shards(writable_only=True):
+        try:
+            with _connect(shard) as conn:
+                conn.execute("INSERT INTO entries_fts (entries_fts) VALUES ('delete-all')")
+                rows = conn.execute("SELECT id, text, app, title FROM entries")
+                conn.executemany(
+                    "INSERT INTO entries_fts (rowid, text, app, title) VALUES (?, ?, ?, ?)",
+                    (
+                        (entry_id, decode_text(text, shard.path), app, title)
+                        for entry_id, text, app, title in rows.fetchall()
+                    ),
+                )
+                indexed += conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        except sqlite3.Error as e:
+            print(f"Database error while rebuilding the text index: {e}")
+    return indexed
+
+
+def incremental_vacuum(pages: int) -> int:
+    """
+    Returns up to `pages` free pages of each database file to the file system.
+
+    Only has an effect on databases in auto_vacuum=INCREMENTAL mode, which
+    new databases are; older ones switch after a full VACUUM.
+
+    Args:
+        pages (int): The maximum number of pages to release per file.
+
+    Returns:
+        int: The number of free pages left in the files.
+    """
+    free_pages = 0
+    for shard in get_shards(writable_only=True):
+        try:
+            conn = _connect(shard)
+            if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:  # INCREMENTAL
+                continue
+            conn.execute(f"PRAGMA incremental_vacuum({int(pages)})").fetchall()
+            free_pages += conn.execute("PRAGMA freelist_count").fetchone()[0]
+        except sqlite3.Error as e:
+            print(f"Database error during incremental vacuum: {e}")
+    return free_pages
+
+
+def _load_text_dictionaries(path: str, reload: bool = False) -> Dict[int, TextDictionary]:
+    """Returns a database file's text dictionaries, reading them on first use."""
+    dictionaries = _text_dictionaries.get(path)
+    if dictionaries is None or reload:
+        dictionaries = {}
+        conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT_SECONDS)
+        try:
+            rows = conn.execute("SELECT id, codec, dictionary FROM text_dictionaries").fetchall()
+        except sqlite3.OperationalError:
+            rows = []  # Not migrated yet
+        finally:
+            conn.close()
+        for dict_id, codec, data in rows:
+            dictionaries[dict_id] = TextDictionary(dict_id, codec, data)
+        _text_dictionaries[path] = dictionaries
+    return dictionaries
+
+
+def decode_text(value: Any, path: Optional[str] = None) -> Optional[str]:
+    """
+    Returns the plain text of an `entries.text` value.
+
+    Text is stored as-is until a dictionary exists, and as a compressed blob
+    tagged with its dictionary id after that; only blobs are decompressed.
+    Each shard keeps its own dictionaries, so it can be read on its own.
+
+    Args:
+        value: The stored value: None, a str or a compressed bytes value.
+        path (Optional[str]): The database file the value was read from;
+                              `config.db_path` by default.
+
+    Returns:
+        Optional[str]: The text.
+
+    Raises:
+        ValueError: If the value's dictionary is not in the database.
+    """
+    if not isinstance(value, bytes):
+        return value
+    path = path or config.db_path
+    dict_id = dictionary_id(value)
+    dictionary = _load_text_dictionaries(path).get(dict_id)
+    if dictionary is None:
+        # Possibly trained by another process since the dictionaries were read
+        dictionary = _load_text_dictionaries(path, reload=True).get(dict_id)
+    if dictionary is None:
+        raise ValueError(f"Text dictionary {dict_id} not found")
+    return dictionary.decompress(value)
+
+
+def current_text_dictionary(path: Optional[str] = None) -> Optional[TextDictionary]:
+    """Returns the newest text dictionary of a database file, which new text is compressed with."""
+    dictionaries = _load_text_dictionaries(path or config.db_path)
+    return dictionaries[max(dictionaries)] if dictionaries else None
+
+
+def encode_text(text: Optional[str], path: Optional[str] = None) -> Any:
+    """
+    Compresses text for storage in `entries.text` with the newest dictionary.
+
+    Args:
+        text (Optional[str]): The plain text.
+        path (Optional[str]): The database file it is stored in;
+                              `config.db_path` by default.
+
+    Returns:
+        The value to store: a compressed bytes value, or the text itself if
+        there is no dictionary yet.
+    """
+    dictionary = current_text_dictionary(path)
+    if text is None or dictionary is None:
+        return text
+    return dictionary.compress(text)
+
+
+def train_text_dictionary(
+    codec: str, min_rows: int, min_new_rows: int, sample_size: int = 2000
+) -> Optional[TextDictionary]:
+    """
+    Trains a new text dictionary on the most recent entries, if enough are new.
+
+    Each writable shard gets its own dictionaries, trained on its own rows,
+    and is held to its own threshold. Older dictionaries are kept, so text
+    compressed with them stays readable.
+
+    Args:
+        codec (str): The codec to train for (see text_codec.CODECS).
+        min_rows (int): Train a shard's first dictionary once it holds at
+                        least this many entries.
+        min_new_rows (int): Train another once at least this many entries
+                            were added since the shard's newest dictionary.
+        sample_size (int): The number of recent entries to train on.
+
+    Returns:
+        Optional[TextDictionary]: The last new dictionary, or None if none was trained.
+    """
+    dictionary = None
+    for shard in get_shards(writable_only=True):
+        try:
+            with _connect(shard) as conn:
+                trained, trained_at = conn.execute(
+                    "SELECT COUNT(*), COALESCE(MAX(max_entry_id), 0) FROM text_dictionaries"
+                ).fetchone()
+                new_rows = conn.execute(
+                    "SELECT COUNT(*) FROM entries WHERE id > ?", (trained_at,)
+                ).fetchone()[0]
+                if new_rows < (min_new_rows if trained else min_rows):
+                    continue
+                max_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM entries").fetchone()[0]
+                samples = [
+                    decode_text(text, shard.path)
+                    for (text,) in conn.execute(
+                        "SELECT text FROM entries WHERE text IS NOT NULL ORDER BY id DESC LIMIT ?",
+                        (sample_size,),
+                    )
+                ]
+                data = train_dictionary(samples, codec)
+                cursor = conn.execute(
+                    """INSERT INTO text_dictionaries (codec, dictionary, max_entry_id, created_at)
+                       VALUES (?, ?, ?, strftime('%s', 'now'))""",
+                    (codec, data, max_id),
+                )
+                dictionary = TextDictionary(cursor.lastrowid, codec, data)
+            _load_text_dictionaries(shard.path)[dictionary.id] = dictionary
+        except sqlite3.Error as e:
+            print(f"Database error while training a text dictionary: {e}")
+    return dictionary
+
+
+def compress_text_batch(limit: int) -> int:
+    """
+    Compresses the plain text of up to `limit` entries, lowest ids first.
+
+    Plain rows are found through the partial index idx_plain_text, so a
+    batch costs the same however much of the table is already compressed,
+    and nothing has to be remembered between batches or restarts. Shards
+    without a dictionary yet are left until one has been trained.
+
+    Args:
+        limit (int): The maximum number of entries to compress.
+
+    Returns:
+        int: The number of entries compressed.
+    """
+    compressed = 0
+    for shard in get_shards(writable_only=True):
+        if compressed >= limit:
+            break
+        dictionary = current_text_dictionary(shard.path)
+        if dictionary is None:
+            continue
+        try:
+            with _connect(shard) as conn:
+                rows = conn.execute(
+                    "SELECT id, text FROM entries WHERE typeof(text) = 'text' ORDER BY id LIMIT ?",
+                    (limit - compressed,),
+                ).fetchall()
+                conn.executemany(
+                    "UPDATE entries SET text = ? WHERE id = ?",
+                    [(dictionary.compress(text), entry_id) for entry_id, text in rows],
+                )
+            compressed += len(rows)
+        except sqlite3.Error as e:
+            print(f"Database error while compressing text: {e}")
+    return compressed
+
+
+class BatchWriter:
+    """
+    A single background thread that performs every entry insert.
+
+    Callers queue rows and wait on a future. The writer takes everything
+    queued while its previous transaction was running, up to `max_batch`
+    rows, and commits it as one transaction (group commit), so concurrent
+    producers share commits and never contend for the write lock.
+    """
+
+    def __init__(self, max_batch: int = WRITE_BATCH_SIZE) -> None:
+        """
+        Args:
+            max_batch (int): The maximum number of rows per transaction.
+        """
+        self.max_batch = max_batch
+        # The next id to hand out by path of recall.db once there are monthly
+        # shards, so the files' sequences are only read again after a failure
+        self._next_ids: Dict[str, int] = {}
+        self._queue: "queue.Queue[Tuple[tuple, Future]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.rows = 0
+
+    def submit(self, row: PendingEntry) -> "Future[Optional[int]]":
+        """
+        Queues one row for insertion, starting the writer thread if needed.
+
+        Args:
+            row (PendingEntry): The entry to insert.
+
+        Returns:
+            Future[Optional[int]]: Resolves to the new entry id, or None if
+                                   the row was a duplicate or failed.
+        """
+        future: "Future[Optional[int]]" = Future()
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="database-writer", daemon=True)
+                self._thread.start()
+        self._queue.put((row, future))
+        return future
+
+    def flush(self) -> None:
+        """Blocks until every row queued so far has been written."""
+        self._queue.join()
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                rows = [row for row, _ in batch]
+                try:
+                    entry_ids = _write_batch(rows, self._next_ids)
+                except Exception as e:
+                    for _, future in batch:
+                        future.set_exception(e)
+                    continue
+                self.batches += 1
+                self.rows += len(rows)
+                # A row's future completes once its listeners have run, so
+                # callers see its effects; a failing listener is only logged,
+                # as the row is committed whatever it does
+                for (row, future), entry_id in zip(batch, entry_ids):
+                    if entry_id is not None:
+                        _notify_listeners(entry_id, row.embedding)
+                    future.set_result(entry_id)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+
+_writer = BatchWriter()
+atexit.register(_writer.flush)
+
+
+def _insert_rows(
+    rows: Sequence[PendingEntry], next_ids: Optional[Dict[str, int]] = None
+) -> List[Optional[int]]:
+    """
+    Inserts rows in a single transaction per shard, together with their embedding store records.
+
+    Args:
+        rows (Sequence[PendingEntry]): The entries to insert.
+        next_ids (Optional[Dict[str, int]]): The writer's cache of the next
+                                             id to hand out (see BatchWriter).
+
+    Raises:
+        sqlite3.Error, OSError, ValueError: If any row fails; nothing is kept.
+    """
+    entry_ids: List[Optional[int]] = [None] * len(rows)
+    inserted: List[Tuple[int, np.ndarray]] = []
+    connections: List[sqlite3.Connection] = []
+    try:
+        groups: Dict[Shard, List[int]] = {}
+        for index, row in enumerate(rows):
+            groups.setdefault(_writable_shard(row.timestamp), []).append(index)
+        # Once there are monthly shards, ids are handed out across all files;
+        # otherwise AUTOINCREMENT picks them
+        next_id = None
+        if _catalog():
+            next_id = next_ids.get(config.db_path) if next_ids is not None else None
+            next_id = next_id or _next_entry_id()
+        for shard, indexes in groups.items():
+            conn = _connect(shard)
+            connections.append(conn)
+            for index in indexes:
+                row = rows[index]
+                embedding_bytes: bytes = row.embedding.astype(np.float32).tobytes() # Ensure consistent dtype
+                stored_text = encode_text(row.text, shard.path)
+                cursor = conn.execute(
+                    """INSERT INTO entries (id, text, timestamp, embedding, app, title, filename,
+                                            monitor, width, height, embedding_model, ocr_model)
+                       VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                       ON CONFLICT(timestamp, monitor) DO NOTHING""", # Avoid duplicate frames
+                    (next_id, *row._replace(text=stored_text, embedding=embedding_bytes)),
+                )
+                if next_id is not None:
+                    next_id += 1
+                if cursor.rowcount > 0: # Check if insert actually happened
+                    entry_ids[index] = cursor.lastrowid
+                    inserted.append((cursor.lastrowid, row.embedding))
+                    if isinstance(stored_text, bytes):
+                        # The FTS triggers only index plain text
+                        conn.execute(
+                            "INSERT INTO entries_fts (rowid, text, app, title) VALUES (?, ?, ?, ?)",
+                            (cursor.lastrowid, row.text, row.app, row.title),
+                        )
+        ranges = []
+        for shard, indexes in groups.items():
+            shard_ids = [entry_ids[index] for index in indexes if entry_ids[index] is not None]
+            if shard.name is not None and shard_ids:
+                ranges.append((min(shard_ids), max(shard_ids), shard.name))
+        if ranges:
+            # Committed ahead of the shards, so a range may be too wide after
+            # a crash but never misses an id
+            catalog = get_connection()
+            if catalog in connections:
+                connections.remove(catalog)
+            connections.insert(0, catalog)
+            catalog.executemany(
+                """UPDATE shards SET first_id = MIN(COALESCE(first_id, ?1), ?1),
+                                     last_id = MAX(COALESCE(last_id, ?2), ?2)
+                   WHERE name = ?3""",
+                ranges,
+            )
+        if inserted and _embedding_store is not None:
+            inserted.sort(key=lambda item: item[0])
+            # Written before the commits so both land or neither does
+            _embedding_store.write(
+                np.array([entry_id for entry_id, _ in inserted]),
+                np.stack([embedding for _, embedding in inserted]),
+            )
+        for conn in connections:
+            conn.commit()
+        if inserted and _embedding_store is not None:
+            _embedding_store.commit()
+    except (sqlite3.Error, OSError, ValueError):
+        if next_ids is not None:
+            # Another client may have taken the ids; read them again next time
+            next_ids.pop(config.db_path, None)
+        for conn in connections:
+            conn.rollback()
+        if _embedding_store is not None:
+            _embedding_store.rollback()
+        raise
+    if next_id is not None and next_ids is not None:
+        next_ids[config.db_path] = next_id
+    return entry_ids
+
+
+def _write_batch(
+    rows: Sequence[PendingEntry], next_ids: Optional[Dict[str, int]] = None
+) -> List[Optional[int]]:
+    """Inserts a batch, falling back to one transaction per row if the batch fails."""
+    cached = next_ids is not None and config.db_path in next_ids
+    try:
+        return _insert_rows(rows, next_ids)
+    except (sqlite3.Error, OSError, ValueError) as e:
+        if cached:
+            # The cached ids may have been taken by another client
+            return _write_batch(rows, next_ids)
+        if len(rows) == 1:
+            print(f"Database error during insertion: {e}")
+            return [None]
+    # Retry one by one so a single bad row does not take the others down
+    return [_write_batch([row], next_ids)[0] for row in rows]
+
+
+def _notify_listeners(entry_id: int, embedding: np.ndarray) -> None:
+    # One failing listener must neither skip the others nor fail the insert
+    for listener in _insert_listeners:
+        try:
+            listener(entry_id, embedding)
+        except Exception as e:
+            print(f"Insert listener failed for entry {entry_id}: {e}")
+
+
+def insert_entry_async(
+    text: str,
+    timestamp: int,
+    embedding: np.ndarray,
+    app: str,
+    title: str,
+    filename: Optional[str] = None,
+    monitor: int = 0,
+    width: Optional[int] = None,
+    height: Optional[int] = None,
+    embedding_model: Optional[str] = None,
+    ocr_model: Optional[str] = None,
+) -> "Future[Optional[int]]":
+    """
+    Queues a new entry for the batched writer without waiting for it.
+
+    Takes the same arguments as `insert_entry`.
+
+    Returns:
+        Future[Optional[int]]: Resolves to the ID of the new row, once its
+                               insert listeners have run, or None if the
+                               frame already exists or insertion fails.
+    """
+    return _writer.submit(
+        PendingEntry(
+            text, timestamp, embedding, app, title, filename, monitor,
+            width, height, embedding_model, ocr_model,
+        )
+    )
 
 
 def insert_entry(
-    text: str, timestamp: int, embedding: np.ndarray, app: str, title: str
+    text: str,
+    timestamp: int,
+    embedding: np.ndarray,
+    app: str,
+    title: str,
+    filename: Optional[str] = None,
+    monitor: int = 0,
+    width: Optional[int] = None,
+    height: Optional[int] = None,
+    embedding_model: Optional[str] = None,
+    ocr_model: Optional[str] = None,
 ) -> Optional[int]:
     """
     Inserts a new entry into the database.
 
+    The row is written by the batched writer thread, possibly in the same
+    transaction as rows queued concurrently by other threads; this call
+    returns once that transaction has committed and the insert listeners
+    have been notified.
+
     Args:
         text (str): The extracted text content.
         timestamp (int): The Unix timestamp of the screenshot.
         embedding (np.ndarray): The embedding vector for the text.
         app (str): The name of the active application.
         title (str): The title of the active window.
+        filename (Optional[str]): The screenshot's file name in the screenshots folder.
+        monitor (int): The index of the captured monitor, 0 being the primary one.
+        width (Optional[int]): The frame width in pixels.
+        height (Optional[int]): The frame height in pixels.
+        embedding_model (Optional[str]): The model that produced the embedding.
+        ocr_model (Optional[str]): The OCR model that extracted the text.
 
     Returns:
-        Optional[int]: The ID of the newly inserted row, or None if insertion fails.
+        Optional[int]: The ID of the newly inserted row, or None if the frame
+                       (timestamp and monitor) already exists or insertion fails.
                        Prints an error message to stderr on failure.
     """
-    embedding_bytes: bytes = embedding.astype(np.float32).tobytes() # Ensure consistent dtype
-    last_row_id: Optional[int] = None
-    try:
-        with sqlite3.connect(db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                """INSERT INTO entries (text, timestamp, embedding, app, title)
-                   VALUES (?, ?, ?, ?, ?)
-                   ON CONFLICT(timestamp) DO NOTHING""", # Avoid duplicates based on timestamp
-                (text, timestamp, embedding_bytes, app, title),
-            )
-            conn.commit()
-            if cursor.rowcount > 0: # Check if insert actually happened
-                last_row_id = cursor.lastrowid
-            # else:
-                # Optionally log that a duplicate timestamp was encountered
-                # print(f"Skipped inserting entry with duplicate timestamp: {timestamp}")
-
-    except sqlite3.Error as e:
-        # More specific error handling can be added (e.g., IntegrityError for UNIQUE constraint)
-        print(f"Database error during insertion: {e}")
-    return last_row_id
+    return insert_entry_async(
+        text, timestamp, embedding, app, title, filename, monitor,
+        width, height, embedding_model, ocr_model,
+    ).result()
@@ -0,0 +1,207 @@
+import os
+import struct
+import threading
+from typing import Optional, Tuple
+
+import numpy as np
+
+from openrecall.vector_index import normalize, top_k
+
+MAGIC: bytes = b"ORECVEC\x00"
+FORMAT_VERSION: int = 1
+# magic, format version, dimension, model name (null padded)
+HEADER_FORMAT: str = "<8sII48s"
+HEADER_SIZE: int = struct.calcsize(HEADER_FORMAT)
+
+
+class EmbeddingStore:
+    """Append-only, memory-mapped file of L2-normalised embeddings.
+
+    The file starts with a small header recording the format version,
+    embedding dimension and model name, followed by fixed-stride records of
+    (int64 entry id, float32[dim] vector) in ascending id order. Searches
+    read the records through `np.memmap`, so the vectors live in the OS page
+    cache rather than on the Python heap and nothing is copied or unpickled.
+
+    Writes are two-phase so they can follow the SQL transaction they belong
+    to: `write` appends records that stay invisible to readers until
+    `commit`, and `rollback` truncates them away.
+    """
+
+    def __init__(self, path: str, dim: int, model_name: str) -> None:
+        """Opens the store at `path`, creating it if it does not exist.
+
+        Args:
+            path: The embedding file.
+            dim: The embedding dimension.
+            model_name: The name of the model producing the embeddings.
+
+        Raises:
+            ValueError: If an existing file was written for another model,
+                        dimension or format version.
+        """
+        self.path = path
+        self.dim = dim
+        self.model_name = model_name
+        self.record_dtype = np.dtype([("id", "<i8"), ("vector", "<f4", (dim,))])
+        self._lock = threading.Lock()
+
+        if not os.path.exists(path) or os.path.getsize(path) < HEADER_SIZE:
+            with open(path, "wb") as f:
+                f.write(
+                    struct.pack(HEADER_FORMAT, MAGIC, FORMAT_VERSION, dim, model_name.encode("utf-8"))
+                )
+        self._file = open(path, "r+b")
+        self._check_header()
+
+        # Drop a partially written trailing record left by a crash
+        size = os.path.getsize(path) - HEADER_SIZE
+        self._count = size // self.record_dtype.itemsize
+        self._pending = 0
+        self._file.truncate(self._offset(self._count))
+        self._view: Optional[np.memmap] = None
+        self._view_count = 0
+
+    def _check_header(self) -> None:
+        self._file.seek(0)
+        magic, version, dim, model_name = struct.unpack(HEADER_FORMAT, self._file.read(HEADER_SIZE))
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError(f"{self.path} is not an embedding store of version {FORMAT_VERSION}")
+        # The header stores the name truncated to its fixed width
+        expected_name = struct.pack("<48s", self.model_name.encode("utf-8"))
+        if dim != self.dim or model_name != expected_name:
+            stored_name = model_name.rstrip(b"\x00").decode("utf-8", errors="replace")
+            raise ValueError(
+                f"{self.path} holds {dim}-dim embeddings from '{stored_name}', "
+                f"expected {self.dim}-dim embeddings from '{self.model_name}'"
+            )
+
+    def _offset(self, record: int) -> int:
+        return HEADER_SIZE + record * self.record_dtype.itemsize
+
+    def __len__(self) -> int:
+        return self._count
+
+    def close(self) -> None:
+        self._view = None
+        self._file.close()
+
+    @property
+    def last_id(self) -> int:
+        """The id of the last committed record, or 0 if the store is empty."""
+        ids, _ = self.arrays()
+        return int(ids[-1]) if len(ids) else 0
+
+    def write(self, ids: np.ndarray, embeddings: np.ndarray) -> None:
+        """Appends records that become visible on the next `commit`.
+
+        Args:
+            ids: Entry ids, increasing and greater than any already stored.
+            embeddings: A (n, dim) array of raw embeddings.
+
+        Raises:
+            ValueError: If the embeddings do not have the store's dimension.
+        """
+        vectors = normalize(embeddings)
+        if vectors.shape[1] != self.dim:
+            raise ValueError(
+                f"Embedding dimension {vectors.shape[1]} does not match store dimension {self.dim}"
+            )
+        records = np.empty(len(ids), dtype=self.record_dtype)
+        records["id"] = ids
+        records["vector"] = vectors
+        with self._lock:
+            self._file.seek(self._offset(self._count + self._pending))
+            self._file.write(records.tobytes())
+            self._pending += len(records)
+
+    def commit(self) -> None:
+        """Makes all written records visible to readers."""
+        with self._lock:
+            self._file.flush()
+            self._count += self._pending
+            self._pending = 0
+
+    def rollback(self) -> None:
+        """Discards records written since the last `commit`."""
+        with self._lock:
+            self._pending = 0
+            self._file.truncate(self._offset(self._count))
+
+    def truncate_after(self, entry_id: int) -> None:
+        """Removes committed records with an id greater than `entry_id`.
+
+        Used at startup to drop records whose SQL transaction never committed.
+        """
+        ids, _ = self.arrays()
+        keep = int(np.searchsorted(ids, entry_id, side="right"))
+        with self._lock:
+            self._view = None
+            self._count = keep
+            self._pending = 0
+            self._file.truncate(self._offset(keep))
+
+    def arrays(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Returns zero-copy views of the committed ids and vectors.
+
+        Returns:
+            A tuple (ids, vectors) backed by the memory-mapped file.
+        """
+        with self._lock:
+            count = self._count
+            if count == 0:
+                return np.empty(0, dtype=np.int64), np.empty((0, self.dim), dtype=np.float32)
+            if self._view is None or self._view_count != count:
+                self._view = np.memmap(
+                    self.path, dtype=self.record_dtype, mode="r", offset=HEADER_SIZE, shape=(count,)
+                )
+                self._view_count = count
+            view = self._view
+        return view["id"], view["vector"]
+
+    def search(self, query: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Finds the `k` stored embeddings most similar to `query`.
+
+        Args:
+            query: The query embedding.
+            k: The maximum number of results to return.
+
+        Returns:
+            A tuple (ids, scores) ordered by descending cosine similarity.
+        """
+        ids, vectors = self.arrays()
+        if len(ids) == 0 or k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        scores = vectors @ normalize(query)[0]
+        order = top_k(scores, k)
+        return np.asarray(ids[order]), scores[order]
+
+    def search_subset(
+        self, query: np.ndarray, candidate_ids: np.ndarray, k: int
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Finds the `k` embeddings most similar to `query` among `candidate_ids`.
+
+        Only the records of the candidates are read and scored, so a narrow
+        candidate set costs proportionally less than a full search.
+
+        Args:
+            query: The query embedding.
+            candidate_ids: The entry ids eligible for the results; ids that
+                           are not in the store are ignored.
+            k: The maximum number of results to return.
+
+        Returns:
+            A tuple (ids, scores) ordered by descending cosine similarity.
+        """
+        ids, vectors = self.arrays()
+        candidate_ids = np.asarray(candidate_ids, dtype=np.int64)
+        # Ids are stored in ascending order, so candidates are found by bisection
+        positions = np.searchsorted(ids, candidate_ids)
+        in_range = positions < len(ids)
+        positions = positions[in_range]
+        positions = np.unique(positions[ids[positions] == candidate_ids[in_range]])
+        if len(positions) == 0 or k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        scores = vectors[positions] @ normalize(query)[0]
+        order = top_k(scores, k)
+        return np.asarray(ids[positions[order]]), scores[order]
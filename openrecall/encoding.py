@@ -0,0 +1,245 @@
+import io
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Callable, Dict, Optional, Tuple
+
+import numpy as np
+
+from openrecall.packs import get_pack_store
+from openrecall.segments import is_segment_frame, read_frame_by_name
+
+# "webp-lossless" is what OpenRecall has always written; "avif" needs a
+# Pillow built with AVIF support or the pillow-avif-plugin package
+IMAGE_FORMATS = ("webp-lossless", "webp", "png", "avif")
+EXTENSIONS = {"webp-lossless": ".webp", "webp": ".webp", "png": ".png", "avif": ".avif"}
+MIME_TYPES = {".webp": "image/webp", ".png": "image/png", ".avif": "image/avif"}
+# Scaled-down copies written next to every frame, so that grids and the
+# timeline never decode a full frame; always lossy WebP
+THUMBNAIL_WIDTH = 320
+PREVIEW_WIDTH = 1280
+DERIVED_QUALITY = 75
+DERIVED_DIRS = {"thumbnail": "thumbnails", "preview": "previews"}
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def avif_available() -> bool:
+    """Checks whether Pillow can write AVIF images here."""
+    from PIL import features
+
+    try:
+        if features.check("avif"):
+            return True
+    except ValueError:  # Pillow versions that do not know the feature
+        pass
+    try:
+        import pillow_avif  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def derived_filename(filename: str, kind: str) -> str:
+    """Returns the path, relative to the screenshots folder, of a frame's thumbnail or preview.
+
+    Args:
+        filename: The frame's file name.
+        kind: "thumbnail" or "preview".
+    """
+    stem = os.path.splitext(filename)[0]
+    return os.path.join(DERIVED_DIRS[kind], stem + ".webp")
+
+
+def _encode(image, image_format: str, quality: int, method: int) -> bytes:
+    buffer = io.BytesIO()
+    if image_format == "webp-lossless":
+        image.save(buffer, format="webp", lossless=True, method=method)
+    elif image_format == "webp":
+        image.save(buffer, format="webp", quality=quality, method=method)
+    elif image_format == "png":
+        image.save(buffer, format="png")
+    else:
+        try:
+            import pillow_avif  # noqa: F401  # registers AVIF with Pillow builds lacking it
+        except ImportError:
+            pass
+        image.save(buffer, format="avif", quality=quality)
+    return buffer.getvalue()
+
+
+def _write_files(directory: str, files: Dict[str, bytes]) -> None:
+    for name, data in files.items():
+        path = os.path.join(directory, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(data)
+
+
+def _scaled(image, width: int):
+    from PIL import Image
+
+    if image.width <= width:
+        return image
+    height = max(1, round(image.height * width / image.width))
+    return image.resize((width, height), Image.BILINEAR)
+
+
+def encode_frame_files(
+    pixels: np.ndarray,
+    stem: str,
+    image_format: str = "webp-lossless",
+    quality: int = 80,
+    method: int = 4,
+) -> Tuple[str, Dict[str, bytes]]:
+    """Encodes a frame with its preview and thumbnail, without writing them.
+
+    Runs in the encoder processes, so it only depends on Pillow and NumPy.
+
+    Args:
+        pixels: The frame as an RGB NumPy array.
+        stem: The file name without extension, e.g. "<timestamp>_<monitor>".
+        image_format: One of IMAGE_FORMATS.
+        quality: The quality of lossy formats (0-100).
+        method: The WebP effort (0 fastest, 6 smallest).
+
+    Returns:
+        The frame's file name, and the encoded files by their path relative
+        to the screenshots folder.
+    """
+    from PIL import Image
+
+    if image_format not in IMAGE_FORMATS:
+        raise ValueError(f"Unknown image format '{image_format}'")
+    image = Image.fromarray(pixels)
+    filename = stem + EXTENSIONS[image_format]
+    files = {filename: _encode(image, image_format, quality, method)}
+    files.update(_encode_previews(image, filename))
+    return filename, files
+
+
+def encode_frame(
+    pixels: np.ndarray,
+    directory: str,
+    stem: str,
+    image_format: str = "webp-lossless",
+    quality: int = 80,
+    method: int = 4,
+) -> str:
+    """Saves a frame with its preview and thumbnail as files in `directory`.
+
+    Takes the arguments of `encode_frame_files`, plus the screenshots folder.
+
+    Returns:
+        The frame's file name in `directory`.
+    """
+    filename, files = encode_frame_files(pixels, stem, image_format, quality, method)
+    _write_files(directory, files)
+    return filename
+
+
+def encode_preview_files(pixels: np.ndarray, filename: str) -> Tuple[str, Dict[str, bytes]]:
+    """Encodes only the preview and thumbnail of a frame stored elsewhere, e.g. in a segment.
+
+    Returns:
+        `filename` and the encoded files, like `encode_frame_files`.
+    """
+    from PIL import Image
+
+    return filename, _encode_previews(Image.fromarray(pixels), filename)
+
+
+def encode_previews(pixels: np.ndarray, directory: str, filename: str) -> str:
+    """Saves only the preview and thumbnail of a frame stored elsewhere, e.g. in a segment.
+
+    Returns:
+        `filename`, for symmetry with `encode_frame`.
+    """
+    _write_files(directory, encode_preview_files(pixels, filename)[1])
+    return filename
+
+
+def _encode_previews(image, filename: str) -> Dict[str, bytes]:
+    # The thumbnail is scaled from the preview, which is much cheaper than
+    # scaling the full frame twice
+    preview = _scaled(image, PREVIEW_WIDTH)
+    files = {}
+    for kind, derived in (("preview", preview), ("thumbnail", _scaled(preview, THUMBNAIL_WIDTH))):
+        buffer = io.BytesIO()
+        derived.save(buffer, format="webp", quality=DERIVED_QUALITY)
+        files[derived_filename(filename, kind)] = buffer.getvalue()
+    return files
+
+
+def load_frame(directory: str, filename: str) -> Optional[np.ndarray]:
+    """Reads a stored frame back as an RGB NumPy array, wherever it is stored.
+
+    Returns:
+        The frame, or None if it does not exist.
+    """
+    if is_segment_frame(filename):
+        return read_frame_by_name(directory, filename)
+    from PIL import Image
+
+    try:
+        with Image.open(os.path.join(directory, filename)) as image:
+            return np.array(image.convert("RGB"))
+    except FileNotFoundError:
+        pass
+    store = get_pack_store(directory, create=False)
+    data = store.read(filename) if store is not None else None
+    if data is None:
+        return None
+    with Image.open(io.BytesIO(data)) as image:
+        return np.array(image.convert("RGB"))
+
+
+def frame_to_png(pixels: np.ndarray) -> bytes:
+    """Encodes a frame as a quickly compressed PNG, for serving rebuilt frames."""
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format="png", compress_level=1)
+    return buffer.getvalue()
+
+
+def get_encoder_pool(processes: int) -> Optional[ProcessPoolExecutor]:
+    """Returns the shared pool of encoder processes, or None if `processes` is 0.
+
+    The processes are spawned rather than forked, as the parent runs model
+    and database threads that must not be copied into them.
+    """
+    global _pool
+    if processes <= 0:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=processes, mp_context=multiprocessing.get_context("spawn")
+            )
+        return _pool
+
+
+def submit_encoding(processes: int, fn: Callable, *args, **kwargs) -> Future:
+    """Runs an encoding function such as `encode_frame` in the encoder pool,
+    or in this thread without processes.
+
+    Args:
+        processes: The size of the encoder pool; 0 encodes in this thread.
+        fn: The encoding function.
+        *args, **kwargs: Its arguments.
+
+    Returns:
+        A future resolving to the result of `fn`.
+    """
+    pool = get_encoder_pool(processes)
+    if pool is not None:
+        return pool.submit(fn, *args, **kwargs)
+    future: Future = Future()
+    try:
+        future.set_result(fn(*args, **kwargs))
+    except Exception as e:
+        future.set_exception(e)
+    return future
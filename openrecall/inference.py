@@ -0,0 +1,83 @@
+import logging
+from typing import Iterable
+
+logger = logging.getLogger(__name__)
+
+# "eager" runs the models as shipped; "int8" applies PyTorch dynamic int8
+# quantization to their Linear and LSTM layers for faster CPU inference
+INFERENCE_BACKENDS = ("eager", "int8")
+OCR_DET_ARCH = "db_mobilenet_v3_large"
+OCR_RECO_ARCH = "crnn_mobilenet_v3_large"
+
+
+def quantize_dynamic_int8(module, layer_types: Iterable[type]):
+    """Returns a copy of `module` with the given layer types quantized to int8.
+
+    Weights are quantized once up front and activations on the fly, so no
+    calibration data is needed and the weights already in the local model
+    cache are used as they are.
+
+    Args:
+        module: A torch.nn.Module.
+        layer_types: The layer classes to quantize, e.g. {torch.nn.Linear}.
+
+    Returns:
+        The quantized module, in eval mode.
+    """
+    import torch
+
+    return torch.quantization.quantize_dynamic(module.eval(), set(layer_types), dtype=torch.qint8)
+
+
+def load_sentence_transformer(model_name: str, backend: str = "eager"):
+    """Loads a SentenceTransformer model for the selected inference backend.
+
+    Args:
+        model_name: The model to load from the local cache or the hub.
+        backend: One of INFERENCE_BACKENDS.
+
+    Returns:
+        A model exposing `encode` like SentenceTransformer.
+    """
+    if backend not in INFERENCE_BACKENDS:
+        raise ValueError(f"Unknown inference backend '{backend}'")
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    model = SentenceTransformer(model_name, device="cpu" if backend == "int8" else None)
+    if backend == "int8":
+        model = quantize_dynamic_int8(model, {torch.nn.Linear})
+        logger.info(f"Quantized '{model_name}' to dynamic int8")
+    return model
+
+
+def load_ocr_predictor(backend: str = "eager"):
+    """Builds the doctr OCR predictor for the selected inference backend.
+
+    With "int8", the recognition model's Linear and LSTM layers are
+    quantized. The detection model is convolutional, which dynamic
+    quantization does not cover, so it keeps running in float32.
+
+    Args:
+        backend: One of INFERENCE_BACKENDS.
+
+    Returns:
+        A callable doctr OCRPredictor.
+    """
+    if backend not in INFERENCE_BACKENDS:
+        raise ValueError(f"Unknown inference backend '{backend}'")
+    from doctr.models import ocr_predictor
+
+    predictor = ocr_predictor(
+        pretrained=True,
+        det_arch=OCR_DET_ARCH,
+        reco_arch=OCR_RECO_ARCH,
+    )
+    if backend == "int8":
+        import torch
+
+        predictor.reco_predictor.model = quantize_dynamic_int8(
+            predictor.reco_predictor.model, {torch.nn.Linear, torch.nn.LSTM}
+        )
+        logger.info("Quantized the OCR recognition model to dynamic int8")
+    return predictor
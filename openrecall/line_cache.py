@@ -0,0 +1,153 @@
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+# Lines kept in memory; at 384 float32 dims each line costs ~1.5 KB
+DEFAULT_MAX_ENTRIES: int = 20_000
+# Lines kept in the on-disk spill before the oldest are pruned
+DEFAULT_MAX_SPILL_ENTRIES: int = 500_000
+
+
+def line_key(line: str, model: str = "") -> bytes:
+    """Returns a compact content hash identifying a line of text embedded by a model.
+
+    Args:
+        line: The line of text.
+        model: The model and backend computing the embedding, e.g. from
+               `nlp.model_version`, so a spill file written with another
+               model or backend never serves its vectors.
+    """
+    return hashlib.blake2b(f"{model}\0{line}".encode("utf-8"), digest_size=16).digest()
+
+
+class LineEmbeddingCache:
+    """Bounded LRU cache of per-line embeddings keyed by content hash.
+
+    Screen text repeats heavily from frame to frame (menu bars, tab strips,
+    IDE chrome), so most lines of a new frame have been embedded before.
+    Entries evicted from memory can optionally be spilled to a small SQLite
+    file and are promoted back on their next hit.
+
+    The cache also measures how long the model takes per line on misses, so
+    it can estimate the encoding time its hits have saved.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        spill_path: Optional[str] = None,
+        max_spill_entries: int = DEFAULT_MAX_SPILL_ENTRIES,
+    ) -> None:
+        """
+        Args:
+            max_entries: The number of line embeddings kept in memory.
+            spill_path: Optional SQLite file receiving evicted embeddings.
+            max_spill_entries: The number of embeddings kept in the spill file.
+        """
+        self.max_entries = max_entries
+        self.max_spill_entries = max_spill_entries
+        self._entries: "OrderedDict[bytes, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._encode_seconds = 0.0
+        self._spill: Optional[sqlite3.Connection] = None
+        if spill_path:
+            self._spill = sqlite3.connect(spill_path, check_same_thread=False)
+            self._spill.execute(
+                "CREATE TABLE IF NOT EXISTS line_embeddings (key BLOB PRIMARY KEY, embedding BLOB NOT NULL)"
+            )
+            self._spill.commit()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _read_spill(self, keys: List[bytes]) -> Dict[bytes, np.ndarray]:
+        placeholders = ",".join("?" * len(keys))
+        rows = self._spill.execute(
+            f"SELECT key, embedding FROM line_embeddings WHERE key IN ({placeholders})", keys
+        ).fetchall()
+        return {key: np.frombuffer(blob, dtype=np.float32) for key, blob in rows}
+
+    def _write_spill(self, evicted: List[Tuple[bytes, np.ndarray]]) -> None:
+        try:
+            self._spill.executemany(
+                "INSERT OR REPLACE INTO line_embeddings (key, embedding) VALUES (?, ?)",
+                [(key, vector.astype(np.float32).tobytes()) for key, vector in evicted],
+            )
+            # Keep the spill bounded by dropping the oldest rows
+            self._spill.execute(
+                """DELETE FROM line_embeddings WHERE rowid <= (
+                       SELECT MAX(rowid) FROM line_embeddings) - ?""",
+                (self.max_spill_entries,),
+            )
+            self._spill.commit()
+        except sqlite3.Error as e:
+            print(f"Line cache spill error: {e}")
+
+    def get_many(self, keys: Iterable[bytes]) -> Dict[bytes, np.ndarray]:
+        """Looks up several lines, counting hits and misses.
+
+        Args:
+            keys: Line keys from `line_key`; duplicates are counted once.
+
+        Returns:
+            The cached embeddings of the keys that were found.
+        """
+        keys = list(dict.fromkeys(keys))
+        found: Dict[bytes, np.ndarray] = {}
+        with self._lock:
+            for key in keys:
+                vector = self._entries.get(key)
+                if vector is not None:
+                    self._entries.move_to_end(key)
+                    found[key] = vector
+            missing = [key for key in keys if key not in found]
+            if missing and self._spill is not None:
+                try:
+                    promoted = self._read_spill(missing)
+                except sqlite3.Error as e:
+                    print(f"Line cache spill error: {e}")
+                    promoted = {}
+                found.update(promoted)
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        if missing and self._spill is not None and promoted:
+            self.put_many(promoted)
+        return found
+
+    def put_many(self, vectors: Dict[bytes, np.ndarray], encode_seconds: float = 0.0) -> None:
+        """Stores freshly computed line embeddings.
+
+        Args:
+            vectors: Embeddings keyed by `line_key`.
+            encode_seconds: The time the model spent computing them, used to
+                            estimate the time saved by later hits.
+        """
+        evicted: List[Tuple[bytes, np.ndarray]] = []
+        with self._lock:
+            self._encode_seconds += encode_seconds
+            for key, vector in vectors.items():
+                self._entries[key] = vector
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                evicted.append(self._entries.popitem(last=False))
+            if evicted and self._spill is not None:
+                self._write_spill(evicted)
+
+    def stats(self) -> Dict[str, float]:
+        """Returns hit counts, the hit rate and the estimated encoding time saved."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            seconds_per_line = self._encode_seconds / self.misses if self.misses else 0.0
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "seconds_saved": self.hits * seconds_per_line,
+            }
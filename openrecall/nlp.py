@@ -1,7 +1,14 @@
+import threading
+import time
+from typing import Optional
 import numpy as np
-from sentence_transformers import SentenceTransformer
 import logging
 
+from openrecall import config
+from openrecall.inference import load_sentence_transformer
+from openrecall.line_cache import LineEmbeddingCache, line_key
+from openrecall.startup import timed_phase
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -10,22 +17,72 @@ logger = logging.getLogger(__name__)
 MODEL_NAME: str = "all-MiniLM-L6-v2"
 EMBEDDING_DIM: int = 384  # Dimension for all-MiniLM-L6-v2
 
-# Load the model globally to avoid reloading it on every call
-try:
-    model = SentenceTransformer(MODEL_NAME)
-    logger.info(f"SentenceTransformer model '{MODEL_NAME}' loaded successfully.")
-except Exception as e:
-    logger.error(f"Failed to load SentenceTransformer model '{MODEL_NAME}': {e}")
-    model = None
+# Created on first use by get_model() so importing this module stays cheap
+_model = None
+_model_failed: bool = False
+_model_lock = threading.Lock()
+
+_line_cache: Optional[LineEmbeddingCache] = None
+_line_cache_lock = threading.Lock()
+
+
+def get_model():
+    """
+    Returns the SentenceTransformer model, loading it on first use.
+
+    The sentence_transformers import (and with it torch) is deferred until
+    here, so processes that never embed text never pay for it. The model
+    runs on the backend chosen with `--inference-backend`.
+
+    Returns:
+        The loaded model, or None if loading failed. A failed load is not
+        retried.
+    """
+    global _model, _model_failed
+    with _model_lock:
+        if _model is None and not _model_failed:
+            try:
+                backend = config.args.inference_backend
+                with timed_phase("embedding_model_load"):
+                    _model = load_sentence_transformer(MODEL_NAME, backend)
+                logger.info(f"SentenceTransformer model '{MODEL_NAME}' ({backend}) loaded successfully.")
+            except Exception as e:
+                logger.error(f"Failed to load SentenceTransformer model '{MODEL_NAME}': {e}")
+                _model_failed = True
+        return _model
+
+
+def model_version() -> str:
+    """
+    Returns an identifier of the embedding model and backend, stored with each entry.
+    """
+    return f"{MODEL_NAME}/{config.args.inference_backend}"
+
+
+def get_line_cache() -> LineEmbeddingCache:
+    """
+    Returns the per-line embedding cache, creating it from the settings on first use.
+
+    Only lines not seen recently reach the model.
+    """
+    global _line_cache
+    with _line_cache_lock:
+        if _line_cache is None:
+            _line_cache = LineEmbeddingCache(
+                max_entries=config.args.line_cache_size,
+                spill_path=config.line_cache_path if config.args.line_cache_spill else None,
+            )
+        return _line_cache
 
 
 def get_embedding(text: str) -> np.ndarray:
     """
     Generates a sentence embedding for the given text.
 
-    Splits the text into lines, encodes each line using the pre-loaded
-    SentenceTransformer model, and returns the mean of the embeddings.
-    Handles empty input text by returning a zero vector.
+    Splits the text into lines, encodes each line using the
+    SentenceTransformer model (loaded on first call), and returns the mean of the embeddings.
+    Lines found in the line cache are not re-encoded. Handles empty input
+    text by returning a zero vector.
 
     Args:
         text: The input string to embed.
@@ -35,6 +92,7 @@ def get_embedding(text: str) -> np.ndarray:
         or a zero vector if the input is empty, whitespace only, or the
         model failed to load. The array type is float32.
     """
+    model = get_model()
     if model is None:
         logger.error("SentenceTransformer model is not loaded. Returning zero vector.")
         return np.zeros(EMBEDDING_DIM, dtype=np.float32)
@@ -51,7 +109,18 @@ def get_embedding(text: str) -> np.ndarray:
         return np.zeros(EMBEDDING_DIM, dtype=np.float32)
 
     try:
-        sentence_embeddings = model.encode(sentences)
+        version = model_version()
+        keys = [line_key(sentence, version) for sentence in sentences]
+        line_cache = get_line_cache()
+        cached = line_cache.get_many(keys)
+        new_lines = {key: sentence for key, sentence in zip(keys, sentences) if key not in cached}
+        if new_lines:
+            start = time.perf_counter()
+            encoded = model.encode(list(new_lines.values()))
+            fresh = dict(zip(new_lines.keys(), np.asarray(encoded, dtype=np.float32)))
+            line_cache.put_many(fresh, encode_seconds=time.perf_counter() - start)
+            cached.update(fresh)
+        sentence_embeddings = np.stack([cached[key] for key in keys])
         # Calculate the mean embedding
         mean_embedding = np.mean(sentence_embeddings, axis=0, dtype=np.float32)
         return mean_embedding
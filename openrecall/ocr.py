@@ -1,14 +1,45 @@
-from doctr.models import ocr_predictor
+import threading
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
 
-ocr = ocr_predictor(
-    pretrained=True,
-    det_arch="db_mobilenet_v3_large",
-    reco_arch="crnn_mobilenet_v3_large",
+import numpy as np
+
+from openrecall import config
+from openrecall.change_detection import (
+    TILE_SIZE,
+    Rect,
+    changed_tiles,
+    merge_rectangles,
+    tile_rectangles,
 )
+from openrecall.inference import OCR_DET_ARCH, OCR_RECO_ARCH, load_ocr_predictor
+from openrecall.startup import timed_phase
+
+# Built on first use by get_ocr() so importing this module stays cheap
+_ocr = None
+_ocr_lock = threading.Lock()
+_dirty_ocr: Optional["DirtyRegionOCR"] = None
+
+# (left, top, right, bottom, value) of a recognized word, in frame pixels
+Word = Tuple[int, int, int, int, str]
+
+
+def get_ocr():
+    """Returns the doctr OCR predictor for `--inference-backend`, building it on first use."""
+    global _ocr
+    with _ocr_lock:
+        if _ocr is None:
+            with timed_phase("ocr_model_load"):
+                _ocr = load_ocr_predictor(config.args.inference_backend)
+        return _ocr
+
+
+def model_version() -> str:
+    """Returns an identifier of the OCR models and backend, stored with each entry."""
+    return f"{OCR_DET_ARCH}+{OCR_RECO_ARCH}/{config.args.inference_backend}"
 
 
 def extract_text_from_image(image):
-    result = ocr([image])
+    result = get_ocr()([image])
     text = ""
     for page in result.pages:
         for block in page.blocks:
@@ -18,3 +49,184 @@ def extract_text_from_image(image):
                 text += "\n"
             text += "\n"
     return text
+
+
+def recognize_words(
+    images: Sequence[np.ndarray], offsets: Optional[Sequence[Tuple[int, int]]] = None
+) -> List[List[Word]]:
+    """Runs OCR on images in one batch and returns their words with boxes.
+
+    Args:
+        images: RGB images, typically crops of one frame.
+        offsets: The (left, top) of each image within its frame, added to
+            the word boxes; defaults to (0, 0).
+
+    Returns:
+        For each image, its words as (left, top, right, bottom, value) in
+        frame pixels.
+    """
+    if not images:
+        return []
+    offsets = offsets or [(0, 0)] * len(images)
+    result = get_ocr()([np.ascontiguousarray(image) for image in images])
+    pages: List[List[Word]] = []
+    for page, image, (left, top) in zip(result.pages, images, offsets):
+        height, width = image.shape[:2]
+        words: List[Word] = []
+        for block in page.blocks:
+            for line in block.lines:
+                for word in line.words:
+                    (x0, y0), (x1, y1) = word.geometry
+                    words.append(
+                        (
+                            left + round(x0 * width),
+                            top + round(y0 * height),
+                            left + round(x1 * width),
+                            top + round(y1 * height),
+                            word.value,
+                        )
+                    )
+        pages.append(words)
+    return pages
+
+
+def words_to_text(words: Iterable[Word]) -> str:
+    """Lays words out as lines of text, top to bottom and left to right.
+
+    A word joins the current line if its vertical center falls within the
+    line, so words recognized in separate crops still share a line.
+    """
+    lines: List[List[Word]] = []
+    bottom = None
+    for word in sorted(words, key=lambda w: (w[1], w[0])):
+        if bottom is not None and (word[1] + word[3]) / 2 < bottom:
+            lines[-1].append(word)
+            bottom = max(bottom, word[3])
+        else:
+            lines.append([word])
+            bottom = word[3]
+    return "".join(
+        "".join(word[4] + " " for word in sorted(line)) + "\n" for line in lines
+    )
+
+
+def _intersects(a: Rect, b: Rect) -> bool:
+    return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+
+
+class DirtyRegionOCR:
+    """OCR that only re-recognizes the parts of a frame that changed.
+
+    The last frame of each monitor and its recognized words are kept. A new
+    frame is compared with it tile by tile; the changed tiles are padded and
+    merged into rectangles, grown to whole words of the previous result, and
+    only those crops go through OCR. Their words replace the old words in
+    the rectangles and the rest are reused.
+
+    A new monitor or resolution, or a change covering more than
+    `max_dirty_fraction` of the frame, is recognized in full.
+    """
+
+    def __init__(
+        self, tile: int = TILE_SIZE, pad_tiles: int = 1, max_dirty_fraction: float = 0.5
+    ) -> None:
+        """
+        Args:
+            tile: The side in pixels of the tiles frames are compared in.
+            pad_tiles: The tiles of context added around each changed tile.
+            max_dirty_fraction: The changed area above which the whole frame
+                is recognized instead.
+        """
+        self.tile = tile
+        self.pad_tiles = pad_tiles
+        self.max_dirty_fraction = max_dirty_fraction
+        self._frames: Dict[int, np.ndarray] = {}
+        self._words: Dict[int, List[Word]] = {}
+        # Frames recognized in full or in parts, and pixels seen and
+        # actually sent to OCR, to measure the saving
+        self.full_passes = 0
+        self.region_passes = 0
+        self.pixels_seen = 0
+        self.pixels_recognized = 0
+
+    def extract_text(self, monitor: int, image: np.ndarray) -> str:
+        """Returns the text of a frame, reusing the previous result where unchanged.
+
+        Args:
+            monitor: The monitor index the frame was captured from.
+            image: The frame as an RGB NumPy array.
+
+        Returns:
+            The text of the frame, laid out by `words_to_text`.
+        """
+        height, width = image.shape[:2]
+        self.pixels_seen += height * width
+        previous = self._frames.get(monitor)
+        rects = None
+        if previous is not None and previous.shape == image.shape:
+            words = self._words[monitor]
+            rects = self._dirty_rectangles(previous, image, words)
+            dirty_area = sum((r[2] - r[0]) * (r[3] - r[1]) for r in rects)
+            if dirty_area > self.max_dirty_fraction * height * width:
+                rects = None
+
+        if rects is None:
+            words = recognize_words([image])[0]
+            self.full_passes += 1
+            self.pixels_recognized += height * width
+        elif rects:
+            kept = [w for w in words if not any(_intersects(w[:4], r) for r in rects)]
+            crops = [image[top:bottom, left:right] for left, top, right, bottom in rects]
+            recognized = recognize_words(crops, [(left, top) for left, top, _, _ in rects])
+            words = kept + [word for page in recognized for word in page]
+            self.region_passes += 1
+            self.pixels_recognized += sum(crop.shape[0] * crop.shape[1] for crop in crops)
+
+        self._frames[monitor] = image
+        self._words[monitor] = words
+        return words_to_text(words)
+
+    def _dirty_rectangles(self, previous: np.ndarray, image: np.ndarray, words: List[Word]) -> List[Rect]:
+        tiles = changed_tiles(previous, image, self.tile)
+        rects = tile_rectangles(tiles, image.shape[:2], self.tile, self.pad_tiles)
+        # Grow the rectangles over the old words they cut, so that no word is
+        # recognized from a partial crop, until they cut none
+        while True:
+            grown = []
+            for left, top, right, bottom in rects:
+                for word in words:
+                    if _intersects(word[:4], (left, top, right, bottom)):
+                        left, top = min(left, word[0]), min(top, word[1])
+                        right, bottom = max(right, word[2]), max(bottom, word[3])
+                grown.append((left, top, right, bottom))
+            grown = merge_rectangles(grown)
+            if grown == rects:
+                return rects
+            rects = grown
+
+    def reset(self) -> None:
+        """Forgets the last frame and words of every monitor."""
+        self._frames.clear()
+        self._words.clear()
+
+    def stats(self) -> Dict[str, float]:
+        """Returns the full and partial OCR passes and the fraction of pixels recognized."""
+        return {
+            "full_passes": self.full_passes,
+            "region_passes": self.region_passes,
+            "recognized_fraction": self.recognized_fraction,
+        }
+
+    @property
+    def recognized_fraction(self) -> float:
+        """The fraction of the pixels seen that went through OCR."""
+        return self.pixels_recognized / self.pixels_seen if self.pixels_seen else 0.0
+
+
+def get_dirty_region_ocr() -> DirtyRegionOCR:
+    """Returns the recorder's dirty-region OCR, creating it on first use."""
+    global _dirty_ocr
+    with _ocr_lock:
+        if _dirty_ocr is None:
+            _dirty_ocr = DirtyRegionOCR()
+        return _dirty_ocr
@@ -0,0 +1,299 @@
+import argparse
+import mmap
+import os
+import sqlite3
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from openrecall import config
+
+# Stored files are appended to numbered pack files, packs/<number>.pack,
+# and located through the SQLite index next to them. A name is the path
+# the file would have in the screenshots folder, e.g. "<timestamp>_<monitor>.webp"
+# or "thumbnails/<timestamp>_<monitor>.webp", so entries keep their file
+# names whichever way their images are stored.
+PACK_DIR = "packs"
+PACK_EXTENSION = ".pack"
+INDEX_NAME = "index.db"
+# A new pack is started once the current one reaches this size, so that a
+# pack can be backed up once and freed as a whole when its files expire
+PACK_SIZE = 256 * 1024 * 1024
+# The migration writes and syncs files in batches of about this many bytes
+MIGRATION_BATCH_BYTES = 64 * 1024 * 1024
+
+_stores: Dict[str, "PackStore"] = {}
+_stores_lock = threading.Lock()
+
+
+def _key(name: str) -> str:
+    return name.replace(os.sep, "/")
+
+
+class PackStore:
+    """Files kept in a few large append-only pack files instead of one file each.
+
+    Files are only ever appended; replacing or deleting one removes its
+    index row, and a pack is deleted once none of its files are left. The
+    bytes of a file are synced before its index row is committed, so a
+    crash in between leaves only unreferenced bytes at the end of a pack.
+    Reads go through a memory map of each pack, so serving a file, or a
+    range of it, is a single copy out of the page cache.
+    """
+
+    def __init__(self, directory: str, pack_size: int = PACK_SIZE) -> None:
+        """
+        Args:
+            directory: The folder holding the packs and their index, created if missing.
+            pack_size: The size at which a new pack is started.
+        """
+        self.directory = directory
+        self.pack_size = pack_size
+        os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(os.path.join(directory, INDEX_NAME), check_same_thread=False)
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._maps: Dict[int, mmap.mmap] = {}
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS files (
+                       name TEXT PRIMARY KEY,
+                       pack INTEGER NOT NULL,
+                       offset INTEGER NOT NULL,
+                       length INTEGER NOT NULL
+                   )"""
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_files_pack ON files (pack)")
+        packs = self.packs()
+        self._current = packs[-1] if packs else 1
+
+    def pack_path(self, pack: int) -> str:
+        """Returns the path of a pack file."""
+        return os.path.join(self.directory, f"{pack:06d}{PACK_EXTENSION}")
+
+    def packs(self) -> List[int]:
+        """Lists the numbers of the pack files on disk, in order."""
+        return sorted(
+            int(name[: -len(PACK_EXTENSION)])
+            for name in os.listdir(self.directory)
+            if name.endswith(PACK_EXTENSION) and name[: -len(PACK_EXTENSION)].isdigit()
+        )
+
+    def put(self, name: str, data: bytes) -> None:
+        """Stores a file, replacing any file of the same name."""
+        self.put_many({name: data})
+
+    def put_many(self, files: Dict[str, bytes]) -> None:
+        """Stores several files with one sync and one index transaction."""
+        if not files:
+            return
+        rows = []
+        with self._write_lock:
+            path = self.pack_path(self._current)
+            if os.path.exists(path) and os.path.getsize(path) >= self.pack_size:
+                self._current += 1
+                path = self.pack_path(self._current)
+            with open(path, "ab") as pack:
+                offset = pack.seek(0, os.SEEK_END)
+                for name, data in files.items():
+                    pack.write(data)
+                    rows.append((_key(name), self._current, offset, len(data)))
+                    offset += len(data)
+                pack.flush()
+                os.fsync(pack.fileno())
+            with self._lock:
+                replaced = self._packs_of([row[0] for row in rows])
+                with self._conn:
+                    self._conn.executemany(
+                        "INSERT OR REPLACE INTO files (name, pack, offset, length) VALUES (?, ?, ?, ?)",
+                        rows,
+                    )
+                self._remove_empty_packs(replaced)
+
+    def locate(self, name: str) -> Optional[Tuple[int, int, int]]:
+        """Returns the (pack, offset, length) of a file, or None if it is not stored."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT pack, offset, length FROM files WHERE name = ?", (_key(name),)
+            ).fetchone()
+
+    def __contains__(self, name: str) -> bool:
+        return self.locate(name) is not None
+
+    def read(self, name: str, start: int = 0, end: Optional[int] = None) -> Optional[bytes]:
+        """Reads a file, or the byte range [start, end) of it.
+
+        Returns:
+            The bytes, or None if the file is not stored.
+        """
+        location = self.locate(name)
+        if location is None:
+            return None
+        return self.read_at(location, start, end)
+
+    def read_at(self, location: Tuple[int, int, int], start: int = 0, end: Optional[int] = None) -> bytes:
+        """Reads the byte range [start, end) of a file found with `locate`."""
+        pack, offset, length = location
+        end = length if end is None else min(end, length)
+        if start >= end:
+            return b""
+        with self._lock:
+            mapped = self._maps.get(pack)
+            if mapped is None or len(mapped) < offset + end:
+                # The current pack grows after it is mapped; map it again
+                if mapped is not None:
+                    mapped.close()
+                with open(self.pack_path(pack), "rb") as f:
+                    mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                self._maps[pack] = mapped
+            return mapped[offset + start : offset + end]
+
+    def delete(self, names: Iterable[str]) -> int:
+        """Removes files from the index and deletes the packs left without any.
+
+        Returns:
+            The number of files removed.
+        """
+        keys = [_key(name) for name in names]
+        with self._write_lock, self._lock:
+            packs = self._packs_of(keys)
+            with self._conn:
+                removed = self._conn.executemany(
+                    "DELETE FROM files WHERE name = ?", [(key,) for key in keys]
+                ).rowcount
+            self._remove_empty_packs(packs)
+        return removed
+
+    def _packs_of(self, keys: List[str]) -> List[int]:
+        packs = set()
+        for key in keys:
+            row = self._conn.execute("SELECT pack FROM files WHERE name = ?", (key,)).fetchone()
+            if row is not None:
+                packs.add(row[0])
+        return sorted(packs)
+
+    def _remove_empty_packs(self, packs: Iterable[int]) -> None:
+        # Called with both locks held; the current pack is kept for appending
+        for pack in packs:
+            if pack == self._current:
+                continue
+            if self._conn.execute("SELECT 1 FROM files WHERE pack = ? LIMIT 1", (pack,)).fetchone():
+                continue
+            mapped = self._maps.pop(pack, None)
+            if mapped is not None:
+                mapped.close()
+            try:
+                os.remove(self.pack_path(pack))
+            except FileNotFoundError:
+                pass
+
+    def stats(self) -> Dict[str, int]:
+        """Returns the number of packs and files, and the bytes in use and on disk."""
+        with self._lock:
+            files, live_bytes = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(length), 0) FROM files"
+            ).fetchone()
+        packs = self.packs()
+        return {
+            "packs": len(packs),
+            "files": files,
+            "live_bytes": live_bytes,
+            "pack_bytes": sum(os.path.getsize(self.pack_path(pack)) for pack in packs),
+        }
+
+    def close(self) -> None:
+        with self._write_lock, self._lock:
+            for mapped in self._maps.values():
+                mapped.close()
+            self._maps.clear()
+            self._conn.close()
+
+
+def get_pack_store(root: str, create: bool = True) -> Optional[PackStore]:
+    """Returns the pack store of a screenshots folder, opening it on first use.
+
+    Args:
+        root: The screenshots folder; packs go in its PACK_DIR.
+        create: Whether to create the store if the folder has none yet.
+
+    Returns:
+        The store, or None if it does not exist and `create` is False.
+    """
+    directory = os.path.join(root, PACK_DIR)
+    with _stores_lock:
+        store = _stores.get(directory)
+        if store is None:
+            if not create and not os.path.exists(os.path.join(directory, INDEX_NAME)):
+                return None
+            store = _stores[directory] = PackStore(directory)
+        return store
+
+
+def migrate_directory(root: str, store: PackStore, keep_files: bool = False) -> Tuple[int, int]:
+    """Moves the screenshots, previews and thumbnails saved as files into packs.
+
+    Files are removed only once their batch is synced and indexed, and
+    files already in the store are skipped, so an interrupted migration
+    can simply be run again.
+
+    Args:
+        root: The screenshots folder.
+        store: The pack store to move the files into.
+        keep_files: Copy the files into packs without removing them.
+
+    Returns:
+        The number of files and bytes moved.
+    """
+    from openrecall.encoding import DERIVED_DIRS, EXTENSIONS
+
+    extensions = tuple(set(EXTENSIONS.values()))
+    names = []
+    for folder in ("", *DERIVED_DIRS.values()):
+        directory = os.path.join(root, folder)
+        if os.path.isdir(directory):
+            names.extend(
+                os.path.join(folder, name)
+                for name in sorted(os.listdir(directory))
+                if name.endswith(extensions) and os.path.isfile(os.path.join(directory, name))
+            )
+
+    moved_files = moved_bytes = 0
+    batch: Dict[str, bytes] = {}
+
+    def flush() -> None:
+        store.put_many(batch)
+        if not keep_files:
+            for name in batch:
+                os.remove(os.path.join(root, name))
+        batch.clear()
+
+    for name in names:
+        if name in store:
+            if not keep_files:
+                os.remove(os.path.join(root, name))
+            continue
+        with open(os.path.join(root, name), "rb") as f:
+            batch[name] = f.read()
+        moved_files += 1
+        moved_bytes += len(batch[name])
+        if sum(len(data) for data in batch.values()) >= MIGRATION_BATCH_BYTES:
+            flush()
+    flush()
+    return moved_files, moved_bytes
+
+
+if __name__ == "__main__":
+    cli = argparse.ArgumentParser(parents=[config.parser], add_help=False)
+    cli.add_argument(
+        "--migrate", action="store_true", help="Move screenshots saved as files into packs and exit"
+    )
+    cli.add_argument(
+        "--keep-files", action="store_true", help="With --migrate, copy the files instead of moving them"
+    )
+    cli_args = cli.parse_args()
+    config.configure(cli_args)
+    store = get_pack_store(config.screenshots_path)
+    if cli_args.migrate:
+        files, size = migrate_directory(config.screenshots_path, store, cli_args.keep_files)
+        print(f"Moved {files} files ({size / 2**20:.1f} MiB) into packs")
+    print(store.stats())
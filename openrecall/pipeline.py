@@ -0,0 +1,204 @@
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Hashable, List, Optional, Sequence
+
+# What a full stage queue does with a new item: "block" waits for room,
+# "drop" discards the new item and "coalesce" discards the oldest queued
+# item with the same key (or the oldest item), keeping the newest state
+OVERFLOW_POLICIES = ("block", "drop", "coalesce")
+DEFAULT_QUEUE_SIZE = 8
+
+
+class BoundedQueue:
+    """A FIFO queue of bounded size with a configurable overflow policy."""
+
+    def __init__(self, maxsize: int = DEFAULT_QUEUE_SIZE, overflow: str = "block") -> None:
+        """
+        Args:
+            maxsize: The number of items held before `overflow` applies.
+            overflow: One of OVERFLOW_POLICIES.
+        """
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy '{overflow}'")
+        self.maxsize = max(1, maxsize)
+        self.overflow = overflow
+        self._items: Deque[tuple] = deque()
+        self._cond = threading.Condition()
+
+    def put(self, item: Any, key: Hashable = None) -> Optional[Any]:
+        """Adds an item, applying the overflow policy if the queue is full.
+
+        Args:
+            item: The item to add.
+            key: Items with equal keys supersede each other when coalescing.
+
+        Returns:
+            The item discarded to make room, or the new item itself if it
+            was dropped; None if nothing was discarded.
+        """
+        with self._cond:
+            discarded = None
+            if len(self._items) >= self.maxsize:
+                if self.overflow == "drop":
+                    return item
+                if self.overflow == "coalesce":
+                    index = next((i for i, (k, _) in enumerate(self._items) if k == key), 0)
+                    discarded = self._items[index][1]
+                    del self._items[index]
+                else:
+                    self._cond.wait_for(lambda: len(self._items) < self.maxsize)
+            self._items.append((key, item))
+            self._cond.notify_all()
+            return discarded
+
+    def get(self) -> Any:
+        """Removes and returns the oldest item, waiting for one if empty."""
+        with self._cond:
+            self._cond.wait_for(lambda: self._items)
+            item = self._items.popleft()[1]
+            self._cond.notify_all()
+            return item
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+
+class Stage:
+    """One step of a pipeline: a bounded queue drained by worker threads.
+
+    `process` returns the item to pass to the next stage, or None to stop
+    it here. With a `key`, each worker owns a queue and items with the same
+    key always go to the same worker, so they are processed one at a time
+    and in order; otherwise all workers share one queue.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        process: Callable[[Any], Optional[Any]],
+        workers: int = 1,
+        maxsize: int = DEFAULT_QUEUE_SIZE,
+        overflow: str = "block",
+        key: Optional[Callable[[Any], int]] = None,
+        on_discard: Optional[Callable[[Any], None]] = None,
+    ) -> None:
+        """
+        Args:
+            name: The stage name, used for its threads and stats.
+            process: Called with each item in a worker thread.
+            workers: The number of worker threads.
+            maxsize: The capacity of each queue.
+            overflow: One of OVERFLOW_POLICIES.
+            key: Maps an item to an int partitioning and coalescing key.
+            on_discard: Called with every item discarded by the overflow policy.
+        """
+        self.name = name
+        self.process = process
+        self.workers = max(1, workers)
+        self.key = key
+        self.on_discard = on_discard
+        queue_count = self.workers if key is not None else 1
+        self.queues = [BoundedQueue(maxsize, overflow) for _ in range(queue_count)]
+        self.next: Optional["Stage"] = None
+        self._lock = threading.Lock()
+        self._threads: List[threading.Thread] = []
+        # Items queued or being processed, for drain()
+        self.in_flight = 0
+        self.processed = 0
+        self.discarded = 0
+        self.errors = 0
+        self.busy_seconds = 0.0
+
+    def start(self) -> None:
+        """Starts the worker threads."""
+        for i in range(self.workers):
+            queue = self.queues[i % len(self.queues)]
+            thread = threading.Thread(
+                target=self._work, args=(queue,), name=f"pipeline-{self.name}-{i}", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def put(self, item: Any) -> None:
+        """Queues an item for this stage."""
+        key = self.key(item) if self.key is not None else None
+        queue = self.queues[key % len(self.queues)] if key is not None else self.queues[0]
+        with self._lock:
+            self.in_flight += 1
+        discarded = queue.put(item, key)
+        if discarded is not None:
+            with self._lock:
+                self.in_flight -= 1
+                self.discarded += 1
+            if self.on_discard is not None:
+                self.on_discard(discarded)
+
+    def _work(self, queue: BoundedQueue) -> None:
+        while True:
+            item = queue.get()
+            start = time.perf_counter()
+            result = None
+            try:
+                result = self.process(item)
+            except Exception as e:
+                self.errors += 1
+                print(f"Error in pipeline stage {self.name}: {e}")
+            if result is not None and self.next is not None:
+                self.next.put(result)
+            with self._lock:
+                self.busy_seconds += time.perf_counter() - start
+                self.processed += 1
+                self.in_flight -= 1
+
+    def stats(self) -> Dict[str, float]:
+        """Returns the queue depth and counters of this stage."""
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "queue_depth": sum(len(queue) for queue in self.queues),
+                "queue_capacity": sum(queue.maxsize for queue in self.queues),
+                "processed": self.processed,
+                "discarded": self.discarded,
+                "errors": self.errors,
+                "busy_seconds": self.busy_seconds,
+            }
+
+
+class Pipeline:
+    """Stages connected in order, each feeding the next through its queue."""
+
+    def __init__(self, stages: Sequence[Stage]) -> None:
+        self.stages = list(stages)
+        for stage, next_stage in zip(self.stages, self.stages[1:]):
+            stage.next = next_stage
+
+    def start(self) -> "Pipeline":
+        """Starts the worker threads of every stage."""
+        for stage in self.stages:
+            stage.start()
+        return self
+
+    def submit(self, item: Any) -> None:
+        """Queues an item for the first stage."""
+        self.stages[0].put(item)
+
+    def drain(self, timeout: Optional[float] = None) -> bool:
+        """Waits until every item submitted so far has left the pipeline.
+
+        Returns:
+            True if the pipeline drained, False on timeout.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            # Items are counted by the next stage before the previous one lets
+            # go of them, so checking in order never misses an item
+            if all(stage.in_flight == 0 for stage in self.stages):
+                return True
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.01)
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """Returns the stats of every stage by name."""
+        return {stage.name: stage.stats() for stage in self.stages}
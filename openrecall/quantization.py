@@ -0,0 +1,312 @@
+import threading
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from openrecall import config
+from openrecall.database import (
+    SearchFilters,
+    attach_embedding_store,
+    create_db,
+    filter_entry_ids,
+    get_embedding_codes,
+    insert_embedding_codes,
+)
+from openrecall.embedding_store import EmbeddingStore
+from openrecall.vector_index import INITIAL_CAPACITY, EmbeddingIndex, normalize, top_k
+
+QUANTIZATION_MODES: Tuple[str, ...] = ("int8", "float16")
+# The first pass keeps this many candidates per requested result for rescoring
+RESCORE_FACTOR: int = 4
+# Rows decoded at once during the first pass, bounding its temporary memory
+SCAN_BLOCK_ROWS: int = 65_536
+
+
+def quantize(vectors: np.ndarray, mode: str) -> Tuple[np.ndarray, np.ndarray]:
+    """Compresses L2-normalised vectors.
+
+    int8 uses a symmetric scale per vector (max |x| maps to 127); float16
+    is a plain cast and ignores the scales.
+
+    Args:
+        vectors: A (n, dim) float32 array.
+        mode: One of QUANTIZATION_MODES.
+
+    Returns:
+        A tuple (codes, scales) with codes of shape (n, dim) and one float32
+        scale per vector.
+
+    Raises:
+        ValueError: If `mode` is not supported.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if mode == "float16":
+        return vectors.astype(np.float16), np.ones(len(vectors), dtype=np.float32)
+    if mode == "int8":
+        scales = np.abs(vectors).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        codes = np.round(vectors / scales[:, None]).astype(np.int8)
+        return codes, scales.astype(np.float32)
+    raise ValueError(f"Unsupported quantization mode '{mode}'")
+
+
+def dequantize(codes: np.ndarray, scales: np.ndarray) -> np.ndarray:
+    """Reconstructs approximate float32 vectors from `quantize` output."""
+    return codes.astype(np.float32) * scales[:, None]
+
+
+class QuantizedIndex:
+    """Two-stage search over quantized codes backed by an EmbeddingStore.
+
+    The compact codes are held in memory and scanned in blocks to build a
+    shortlist of `rescore_factor * k` candidates, which are then rescored
+    against the full-precision vectors of the memory-mapped store. Code rows
+    are aligned with the store's records, so a shortlist position addresses
+    the same row in both.
+    """
+
+    def __init__(self, store: EmbeddingStore, mode: str = "int8", rescore_factor: int = RESCORE_FACTOR) -> None:
+        """
+        Args:
+            store: The full-precision embedding store.
+            mode: One of QUANTIZATION_MODES.
+            rescore_factor: Shortlist size as a multiple of k.
+        """
+        if mode not in QUANTIZATION_MODES:
+            raise ValueError(f"Unsupported quantization mode '{mode}'")
+        self.store = store
+        self.mode = mode
+        self.rescore_factor = rescore_factor
+        self._code_dtype = np.int8 if mode == "int8" else np.float16
+        self._codes = np.empty((0, store.dim), dtype=self._code_dtype)
+        self._scales = np.empty(0, dtype=np.float32)
+        self._ids = np.empty(0, dtype=np.int64)
+        self._size = 0
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def nbytes(self) -> int:
+        """Memory held by the codes, scales and ids of the indexed rows."""
+        per_row = self._codes.itemsize * self.store.dim + self._scales.itemsize + self._ids.itemsize
+        return self._size * per_row
+
+    def _append(self, ids: np.ndarray, codes: np.ndarray, scales: np.ndarray) -> None:
+        """Appends rows, growing the backing arrays geometrically."""
+        with self._lock:
+            end = self._size + len(ids)
+            if end > len(self._ids):
+                capacity = max(end, 2 * len(self._ids), INITIAL_CAPACITY)
+                grown_codes = np.empty((capacity, self.store.dim), dtype=self._code_dtype)
+                grown_scales = np.empty(capacity, dtype=np.float32)
+                grown_ids = np.empty(capacity, dtype=np.int64)
+                grown_codes[: self._size] = self._codes[: self._size]
+                grown_scales[: self._size] = self._scales[: self._size]
+                grown_ids[: self._size] = self._ids[: self._size]
+                self._codes, self._scales, self._ids = grown_codes, grown_scales, grown_ids
+            self._codes[self._size : end] = codes
+            self._scales[self._size : end] = scales
+            self._ids[self._size : end] = ids
+            self._size = end
+
+    def load_codes(
+        self, ids: np.ndarray, codes: np.ndarray, scales: np.ndarray, live_ids: Optional[np.ndarray] = None
+    ) -> None:
+        """Installs previously persisted codes if they match the store's records.
+
+        Codes that do not line up with the store (for example after the store
+        was rebuilt) are discarded and will be recomputed by `sync`. Store
+        records whose entries have expired since their codes were persisted
+        keep an empty row with a zero scale, so positions stay aligned with
+        the store, and are left out of the first pass.
+
+        Args:
+            ids: Entry ids of the persisted codes, in store order.
+            codes: A (n, dim) array of codes.
+            scales: One scale per code row.
+            live_ids: The sorted ids of the entries still in the database; a
+                      store record without a code is only accepted if its
+                      entry is gone from these.
+        """
+        store_ids, _ = self.store.arrays()
+        if self._size or len(ids) == 0 or len(store_ids) == 0:
+            return
+        n = int(np.searchsorted(ids, store_ids[-1], side="right"))
+        ids, codes, scales = ids[:n], codes[:n], scales[:n]
+        end = int(np.searchsorted(store_ids, ids[-1], side="right")) if n else 0
+        prefix = np.asarray(store_ids[:end])
+        has_code = np.isin(prefix, ids)
+        if not np.array_equal(prefix[has_code], ids):
+            return
+        expired = prefix[~has_code]
+        if len(expired) and (live_ids is None or np.isin(expired, live_ids).any()):
+            return
+        all_codes = np.zeros((end, self.store.dim), dtype=self._code_dtype)
+        all_scales = np.zeros(end, dtype=np.float32)
+        all_codes[has_code] = codes
+        all_scales[has_code] = scales
+        self._append(prefix, all_codes, all_scales)
+
+    def sync(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Quantizes store records that have no codes yet.
+
+        Returns:
+            The (ids, codes, scales) that were added, so callers can persist them.
+        """
+        with self._sync_lock:
+            store_ids, store_vectors = self.store.arrays()
+            start = self._size
+            ids = np.array(store_ids[start:], dtype=np.int64)
+            codes, scales = quantize(store_vectors[start:], self.mode)
+            if len(ids):
+                self._append(ids, codes, scales)
+        return ids, codes, scales
+
+    def add(self, entry_id: int, embedding: np.ndarray) -> None:
+        """Quantizes newly inserted embeddings.
+
+        Intended as a database insert listener: the store has already
+        committed the full-precision record, so its codes are taken from there.
+        """
+        self.sync()
+
+    def shortlist(self, query: np.ndarray, n: int) -> np.ndarray:
+        """Runs the first pass over the codes.
+
+        The codes are decoded in blocks of SCAN_BLOCK_ROWS so the temporary
+        float32 copy stays small however large the index grows.
+
+        Args:
+            query: The L2-normalised query embedding.
+            n: The number of candidates to keep.
+
+        Returns:
+            Row positions of the `n` best approximate scores, best first,
+            leaving out the rows of expired entries.
+        """
+        with self._lock:
+            size = self._size
+            codes, scales = self._codes, self._scales
+        approximate = np.empty(size, dtype=np.float32)
+        for start in range(0, size, SCAN_BLOCK_ROWS):
+            end = min(start + SCAN_BLOCK_ROWS, size)
+            approximate[start:end] = codes[start:end].astype(np.float32) @ query
+        approximate *= scales[:size]
+        # Rows of expired entries have a zero scale and are left out
+        approximate[scales[:size] == 0] = -np.inf
+        positions = top_k(approximate, n)
+        return positions[np.isfinite(approximate[positions])]
+
+    def search(self, query: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Finds the `k` entries most similar to `query`.
+
+        Args:
+            query: The query embedding.
+            k: The maximum number of results to return.
+
+        Returns:
+            A tuple (ids, scores) ordered by descending exact cosine similarity.
+        """
+        if self._size == 0 or k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        query = normalize(query)[0]
+        # Sorted positions keep the reads from the memory-mapped store sequential
+        positions = np.sort(self.shortlist(query, k * self.rescore_factor))
+        _, vectors = self.store.arrays()
+        exact = np.asarray(vectors[positions]) @ query
+        order = top_k(exact, k)
+        return self._ids[positions[order]], exact[order]
+
+
+def measure_recall(
+    index: QuantizedIndex, n_queries: int = 200, k: int = 10, seed: int = 0
+) -> Dict[str, float]:
+    """Compares quantized search against exact search on the same store.
+
+    Queries are stored vectors perturbed with noise, so every query has
+    close neighbours as real searches do.
+
+    Returns:
+        A dict with recall@k of the first pass alone and after rescoring.
+    """
+    ids, vectors = index.store.arrays()
+    if len(ids) == 0:
+        return {"first_pass_recall": 1.0, "rescored_recall": 1.0}
+    exact = EmbeddingIndex()
+    exact.add_batch(np.asarray(ids), np.asarray(vectors))
+    rng = np.random.default_rng(seed)
+    queries = np.asarray(vectors[rng.choice(len(ids), n_queries)])
+    queries = queries + rng.normal(scale=0.05, size=queries.shape).astype(np.float32)
+
+    first_hits = rescored_hits = 0
+    for query in queries:
+        truth = set(exact.search(query, k)[0].tolist())
+        first_pass = index._ids[index.shortlist(normalize(query)[0], k)]
+        first_hits += len(truth & set(first_pass.tolist()))
+        rescored_hits += len(truth & set(index.search(query, k)[0].tolist()))
+    total = len(queries) * min(k, len(ids))
+    return {"first_pass_recall": first_hits / total, "rescored_recall": rescored_hits / total}
+
+
+def load_quantized_index(store: EmbeddingStore, mode: str) -> QuantizedIndex:
+    """Restores the codes persisted in the database and quantizes any new rows.
+
+    Args:
+        store: The full-precision embedding store, already attached.
+        mode: One of QUANTIZATION_MODES.
+
+    Returns:
+        A QuantizedIndex covering every record of the store.
+    """
+    index = QuantizedIndex(store, mode)
+    index.load_codes(*get_embedding_codes(mode, store.dim), live_ids=filter_entry_ids(SearchFilters()))
+    new_ids, new_codes, new_scales = index.sync()
+    insert_embedding_codes(mode, new_ids, new_codes, new_scales)
+    return index
+
+
+def migrate(mode: str) -> Dict[str, float]:
+    """Converts the configured recall.db to quantized search in place.
+
+    Copies any embedding blobs missing from the embedding store, writes the
+    codes for every entry to the database and measures the effect.
+
+    Args:
+        mode: One of QUANTIZATION_MODES.
+
+    Returns:
+        A report with the resident memory of the float32 and quantized
+        indexes and the recall@10 before and after rescoring.
+    """
+    from openrecall.nlp import EMBEDDING_DIM, MODEL_NAME
+
+    create_db()
+    store = EmbeddingStore(config.embeddings_path, EMBEDDING_DIM, MODEL_NAME)
+    attach_embedding_store(store)
+    index = load_quantized_index(store, mode)
+    report = {
+        "entries": float(len(index)),
+        "float32_bytes": float(len(store) * store.dim * 4),
+        "quantized_bytes": float(index.nbytes),
+    }
+    report.update(measure_recall(index))
+    return report
+
+
+if __name__ == "__main__":
+    args = config.parse_args()
+    if args.quantization == "none":
+        raise SystemExit("Pass --quantization int8 or --quantization float16 to migrate.")
+    report = migrate(args.quantization)
+    saved = report["float32_bytes"] - report["quantized_bytes"]
+    print(f"Quantized {int(report['entries'])} embeddings to {args.quantization}")
+    print(
+        f"Resident index: {report['float32_bytes'] / 2**20:.1f} MiB -> "
+        f"{report['quantized_bytes'] / 2**20:.1f} MiB ({saved / 2**20:.1f} MiB saved)"
+    )
+    print(f"recall@10 first pass: {report['first_pass_recall']:.3f}")
+    print(f"recall@10 after rescoring: {report['rescored_recall']:.3f}")
@@ -0,0 +1,341 @@
+import argparse
+import io
+import os
+import sqlite3
+import time
+from typing import List, Optional, Tuple
+
+from openrecall import config
+from openrecall.database import (
+    TIER_LOSSLESS,
+    TIER_LOSSY,
+    TIER_TEXT_ONLY,
+    compress_text_batch,
+    create_db,
+    delete_entries_before,
+    get_compaction_batch,
+    get_connection,
+    get_shards,
+    incremental_vacuum,
+    rebuild_text_index,
+    seal_shard,
+    set_storage_tiers,
+    train_text_dictionary,
+)
+from openrecall.encoding import DERIVED_DIRS, derived_filename
+from openrecall.packs import PackStore, get_pack_store
+from openrecall.segments import is_segment_frame, remove_segments_before
+from openrecall.text_codec import default_codec
+from openrecall.utils import is_user_active
+
+DAY_SECONDS = 86400
+# Work is done in slices of at most this long, so that compaction never
+# competes with recording for long once the user comes back
+SLICE_SECONDS = 2.0
+COMPACTION_INTERVAL = 60
+BATCH_SIZE = 200
+VACUUM_PAGES = 2000
+# The first text dictionary is trained once this many entries exist, and
+# a new version after this many more have been added
+DICTIONARY_MIN_ENTRIES = 1000
+DICTIONARY_RETRAIN_ENTRIES = 100_000
+
+
+def recompress_data(data: bytes, quality: int, max_width: int) -> Tuple[bytes, Tuple[int, int]]:
+    """Re-encodes an encoded screenshot as lossy WebP, downscaling wide images.
+
+    Args:
+        data: The encoded screenshot.
+        quality: The WebP quality (0-100).
+        max_width: Images wider than this are scaled down to it; 0 disables.
+
+    Returns:
+        The WebP bytes and the new (width, height).
+    """
+    from PIL import Image
+
+    with Image.open(io.BytesIO(data)) as image:
+        image.load()
+    if max_width and image.width > max_width:
+        height = max(1, round(image.height * max_width / image.width))
+        image = image.resize((max_width, height), Image.LANCZOS)
+    buffer = io.BytesIO()
+    image.save(buffer, format="webp", quality=quality)
+    return buffer.getvalue(), (image.width, image.height)
+
+
+def recompress_image(
+    path: str, quality: int, max_width: int, output_path: Optional[str] = None
+) -> Optional[Tuple[int, int]]:
+    """Re-encodes a screenshot file as lossy WebP, downscaling wide images.
+
+    The new image is written next to the original and renamed over it, so
+    the file is never left half written.
+
+    Args:
+        path: The screenshot file.
+        quality: The WebP quality (0-100).
+        max_width: Images wider than this are scaled down to it; 0 disables.
+        output_path: Where to write the WebP, replacing `path`; defaults to
+            `path` itself.
+
+    Returns:
+        The new (width, height), or None if the file does not exist.
+    """
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as f:
+        data, size = recompress_data(f.read(), quality, max_width)
+    output_path = output_path or path
+    tmp_path = output_path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, output_path)
+    if output_path != path:
+        os.remove(path)
+    return size
+
+
+def recompress_packed(
+    store: PackStore, name: str, quality: int, max_width: int, output_name: Optional[str] = None
+) -> Optional[Tuple[int, int]]:
+    """Re-encodes a screenshot kept in packs, like `recompress_image`.
+
+    The new image is appended before the old one is removed.
+
+    Returns:
+        The new (width, height), or None if the pack store does not hold `name`.
+    """
+    data = store.read(name)
+    if data is None:
+        return None
+    data, size = recompress_data(data, quality, max_width)
+    output_name = output_name or name
+    store.put(output_name, data)
+    if output_name != name:
+        store.delete([name])
+    return size
+
+
+def remove_image(filename: Optional[str]) -> None:
+    """Deletes a screenshot with its preview and thumbnail, ignoring files that are already gone.
+
+    Frames kept in segments only lose their preview and thumbnail; the
+    segments themselves are deleted whole once their hour has expired.
+    Files kept in packs are removed from the pack index.
+    """
+    if not filename:
+        return
+    names = [derived_filename(filename, kind) for kind in DERIVED_DIRS]
+    if not is_segment_frame(filename):
+        names.append(filename)
+    for name in names:
+        try:
+            os.remove(os.path.join(config.screenshots_path, name))
+        except FileNotFoundError:
+            pass
+    store = get_pack_store(config.screenshots_path, create=False)
+    if store is not None:
+        store.delete(names)
+
+
+class Compactor:
+    """Applies the retention tiers in bounded-time slices.
+
+    If set, frames move from lossless to lossy after `--keep-lossless-days`,
+    lose their image after `--keep-images-days` and are deleted after
+    `--retention-days`; each tier is disabled at 0, the default. Their OCR text is compressed with a
+    dictionary trained on the history (`--text-compression`). Each step
+    works on the oldest frames first in batches of `BATCH_SIZE`, one
+    transaction per batch, and the slice stops at the first batch boundary
+    past its time budget. Monthly shards (`--shard-by-month`) whose frames
+    have all reached their final tier are sealed read-only, and expired
+    ones are deleted as a whole.
+    """
+
+    def __init__(self, batch_size: int = BATCH_SIZE, vacuum_pages: int = VACUUM_PAGES):
+        self.batch_size = batch_size
+        self.vacuum_pages = vacuum_pages
+        self.recompressed = 0
+        self.stripped = 0
+        self.deleted = 0
+        self.sealed = 0
+        self.text_compressed = 0
+
+    def run_slice(self, budget_seconds: float = SLICE_SECONDS, now: Optional[float] = None) -> bool:
+        """Runs retention work until it is done or the time budget is spent.
+
+        Args:
+            budget_seconds: The time budget of the slice.
+            now: The current time as a Unix timestamp; defaults to time.time().
+
+        Returns:
+            True if there is no retention work left, False if the slice ran
+            out of time.
+        """
+        now = time.time() if now is None else now
+        deadline = time.monotonic() + budget_seconds
+        args = config.args
+        steps = []
+        if args.retention_days > 0:
+            steps.append(lambda: self._delete(now - args.retention_days * DAY_SECONDS))
+        if args.keep_images_days > 0:
+            steps.append(lambda: self._strip(now - args.keep_images_days * DAY_SECONDS))
+        if args.keep_lossless_days > 0:
+            steps.append(lambda: self._recompress(now - args.keep_lossless_days * DAY_SECONDS))
+        if args.text_compression != "none":
+            self._train_text_dictionary(args.text_compression)
+            steps.append(self._compress_text)
+
+        for step in steps:
+            while True:
+                if time.monotonic() >= deadline:
+                    return False
+                if step() < self.batch_size:
+                    break
+        if args.keep_images_days > 0:
+            remove_segments_before(config.screenshots_path, now - args.keep_images_days * DAY_SECONDS)
+        incremental_vacuum(self.vacuum_pages)
+        if args.keep_lossless_days > 0 or args.keep_images_days > 0:
+            # Without image tiers there is no final tier to wait for, and a
+            # sealed shard would be skipped if one were turned on later
+            self._seal(now - max(args.keep_lossless_days, args.keep_images_days) * DAY_SECONDS)
+        return True
+
+    def _seal(self, before: float) -> None:
+        # Monthly shards whose frames have all reached their final tier no
+        # longer change, so they are made read-only for cheap archiving
+        for shard in get_shards(before=int(before), writable_only=True):
+            if shard.name is not None and shard.end <= before and seal_shard(shard):
+                self.sealed += 1
+
+    def _delete(self, before: float) -> int:
+        filenames = delete_entries_before(int(before), self.batch_size)
+        for filename in filenames:
+            remove_image(filename)
+        self.deleted += len(filenames)
+        return len(filenames)
+
+    def _strip(self, before: float) -> int:
+        frames = get_compaction_batch((TIER_LOSSLESS, TIER_LOSSY), int(before), self.batch_size)
+        for _, filename in frames:
+            remove_image(filename)
+        set_storage_tiers([(entry_id, TIER_TEXT_ONLY, None, None, None) for entry_id, _ in frames])
+        self.stripped += len(frames)
+        return len(frames)
+
+    def _recompress(self, before: float) -> int:
+        frames = get_compaction_batch((TIER_LOSSLESS,), int(before), self.batch_size)
+        updates: List[Tuple[int, int, Optional[str], Optional[int], Optional[int]]] = []
+        for entry_id, filename in frames:
+            if is_segment_frame(filename):
+                # Segments stay lossless until their hour expires as a whole
+                updates.append((entry_id, TIER_LOSSY, filename, None, None))
+                continue
+            size = None
+            if filename:
+                # Frames saved as PNG or AVIF become .webp files
+                webp_filename = os.path.splitext(filename)[0] + ".webp"
+                path = os.path.join(config.screenshots_path, filename)
+                store = get_pack_store(config.screenshots_path, create=False)
+                try:
+                    if store is not None and not os.path.exists(path):
+                        size = recompress_packed(
+                            store,
+                            filename,
+                            config.args.compact_quality,
+                            config.args.compact_max_width,
+                            webp_filename,
+                        )
+                    else:
+                        size = recompress_image(
+                            path,
+                            config.args.compact_quality,
+                            config.args.compact_max_width,
+                            os.path.join(config.screenshots_path, webp_filename),
+                        )
+                except OSError as e:
+                    print(f"Error re-encoding {filename}: {e}")
+            if size is None:
+                # The image is gone or unreadable; keep the text only
+                updates.append((entry_id, TIER_TEXT_ONLY, None, None, None))
+            else:
+                updates.append((entry_id, TIER_LOSSY, webp_filename, *size))
+        set_storage_tiers(updates)
+        self.recompressed += len(frames)
+        return len(frames)
+
+    def _train_text_dictionary(self, codec: str) -> None:
+        if codec == "auto":
+            codec = default_codec()
+        train_text_dictionary(codec, DICTIONARY_MIN_ENTRIES, DICTIONARY_RETRAIN_ENTRIES)
+
+    def _compress_text(self) -> int:
+        compressed = compress_text_batch(self.batch_size)
+        self.text_compressed += compressed
+        return compressed
+
+
+def compaction_enabled() -> bool:
+    """Checks whether any retention tier or text compression is turned on."""
+    args = config.args
+    return (
+        args.keep_lossless_days > 0
+        or args.keep_images_days > 0
+        or args.retention_days > 0
+        or args.text_compression != "none"
+    )
+
+
+def compaction_thread() -> None:
+    """
+    Runs retention slices while the user is idle, forever.
+
+    Intended to be executed in a separate daemon thread.
+    """
+    compactor = Compactor()
+    while True:
+        done = True
+        if not is_user_active():
+            done = compactor.run_slice()
+        # Keep going while idle and behind; otherwise check back later
+        time.sleep(1 if not done else COMPACTION_INTERVAL)
+
+
+def vacuum() -> None:
+    """Rebuilds the database with a full VACUUM.
+
+    Databases created before retention existed are not in incremental
+    auto-vacuum mode; this switches them over so that space freed by
+    compaction is returned to the file system.
+    """
+    conn = get_connection()
+    try:
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM")
+    except sqlite3.Error as e:
+        print(f"Database error during VACUUM: {e}")
+
+
+if __name__ == "__main__":
+    cli = argparse.ArgumentParser(parents=[config.parser], add_help=False)
+    cli.add_argument("--vacuum", action="store_true", help="Run a full VACUUM and exit")
+    cli.add_argument(
+        "--rebuild-text-index", action="store_true", help="Rebuild the full-text search index and exit"
+    )
+    cli_args = cli.parse_args()
+    config.configure(cli_args)
+    create_db()
+    if cli_args.vacuum:
+        vacuum()
+    elif cli_args.rebuild_text_index:
+        print(f"Indexed the text of {rebuild_text_index()} entries")
+    else:
+        compactor = Compactor()
+        while not compactor.run_slice(budget_seconds=60):
+            pass
+        print(
+            f"Recompressed {compactor.recompressed}, stripped {compactor.stripped}, "
+            f"deleted {compactor.deleted} frames; compressed the text of {compactor.text_compressed}; "
+            f"sealed {compactor.sealed} shards"
+        )
@@ -1,70 +1,53 @@
 import os
 import time
-from typing import List, Tuple
+from collections import namedtuple
+from typing import Dict, List, Optional
 
 import mss
 import numpy as np
-from PIL import Image
 
-from openrecall.config import screenshots_path, args
-from openrecall.database import insert_entry
+from openrecall import config
+from openrecall.change_detection import ChangeDetector
+from openrecall.database import insert_entry, insert_entry_async
+from openrecall.encoding import (
+    avif_available,
+    encode_frame,
+    encode_frame_files,
+    encode_previews,
+    load_frame,
+    submit_encoding,
+)
 from openrecall.nlp import get_embedding
-from openrecall.ocr import extract_text_from_image
+from openrecall.nlp import model_version as embedding_model_version
+from openrecall.ocr import DirtyRegionOCR, extract_text_from_image, get_dirty_region_ocr
+from openrecall.ocr import model_version as ocr_model_version
+from openrecall.packs import get_pack_store
+from openrecall.pipeline import Pipeline, Stage
+from openrecall.retention import remove_image
+from openrecall.segments import SegmentWriter
+from openrecall.spool import SpooledFrame, get_spool, load_is_low
 from openrecall.utils import (
     get_active_app_name,
     get_active_window_title,
     is_user_active,
 )
 
+# Seconds between screenshots
+CAPTURE_INTERVAL = 3
+# The spool is drained while the user is idle, or while the 1-minute load
+# average per CPU is below DRAIN_MAX_LOAD, a few frames at a time
+DRAIN_MAX_LOAD = 0.5
+DRAIN_BATCH = 8
+DRAIN_INTERVAL = 5
+# A changed frame on its way through the pipeline; text and embedding are
+# filled in by the stages
+CapturedFrame = namedtuple(
+    "CapturedFrame",
+    ["monitor", "timestamp", "image", "app", "title", "text", "embedding"],
+    defaults=(None, None),
+)
 
-def mean_structured_similarity_index(
-    img1: np.ndarray, img2: np.ndarray, L: int = 255
-) -> float:
-    """Calculates the Mean Structural Similarity Index (MSSIM) between two images.
-
-    Args:
-        img1: The first image as a NumPy array (RGB).
-        img2: The second image as a NumPy array (RGB).
-        L: The dynamic range of the pixel values (default is 255).
-
-    Returns:
-        The MSSIM value between the two images (float between -1 and 1).
-    """
-    K1, K2 = 0.01, 0.03
-    C1, C2 = (K1 * L) ** 2, (K2 * L) ** 2
-
-    def rgb2gray(img: np.ndarray) -> np.ndarray:
-        """Converts an RGB image to grayscale."""
-        return 0.2989 * img[..., 0] + 0.5870 * img[..., 1] + 0.1140 * img[..., 2]
-
-    img1_gray: np.ndarray = rgb2gray(img1)
-    img2_gray: np.ndarray = rgb2gray(img2)
-    mu1: float = np.mean(img1_gray)
-    mu2: float = np.mean(img2_gray)
-    sigma1_sq = np.var(img1_gray)
-    sigma2_sq = np.var(img2_gray)
-    sigma12 = np.mean((img1_gray - mu1) * (img2_gray - mu2))
-    ssim_index = ((2 * mu1 * mu2 + C1) * (2 * sigma12 + C2)) / (
-        (mu1**2 + mu2**2 + C1) * (sigma1_sq + sigma2_sq + C2)
-    )
-    return ssim_index
-
-
-def is_similar(
-    img1: np.ndarray, img2: np.ndarray, similarity_threshold: float = 0.9
-) -> bool:
-    """Checks if two images are similar based on MSSIM.
-
-    Args:
-        img1: The first image as a NumPy array.
-        img2: The second image as a NumPy array.
-        similarity_threshold: The threshold above which images are considered similar.
-
-    Returns:
-        True if the images are similar, False otherwise.
-    """
-    similarity: float = mean_structured_similarity_index(img1, img2)
-    return similarity >= similarity_threshold
+_pipeline: Optional[Pipeline] = None
 
 
 def take_screenshots() -> List[np.ndarray]:
@@ -83,7 +66,7 @@ def take_screenshots() -> List[np.ndarray]:
         # sct.monitors[2:] are other monitors
         monitor_indices = range(1, len(sct.monitors))  # Skip the 'all monitors' entry
 
-        if args.primary_monitor_only:
+        if config.args.primary_monitor_only:
             monitor_indices = [1]  # Only index 1 corresponds to the primary monitor
 
         for i in monitor_indices:
@@ -104,102 +87,254 @@ def take_screenshots() -> List[np.ndarray]:
     return screenshots
 
 
+def build_pipeline() -> Pipeline:
+    """Builds the stages frames go through once captured.
+
+    OCR keeps the frames of each monitor in order on one worker, as the
+    dirty-region OCR diffs each frame against the previous one. When it
+    falls behind, `--ocr-overflow` decides what happens to new frames; by
+    default a queued frame is replaced by the newer frame of its monitor.
+
+    With `--deferred-processing`, frames are only saved and added to the
+    spool, for `drain_spool_thread` to OCR and embed later. With
+    `--frame-store segments`, each monitor's frames are embedded and saved
+    in order on one worker of each stage; with `--frame-store packs`, frames and their previews are
+    appended to pack files instead of being saved as files.
+    """
+    args = config.args
+    dirty_ocr = None if args.full_frame_ocr else get_dirty_region_ocr()
+    queue_size = args.pipeline_queue_size
+    if args.image_format == "avif" and not avif_available():
+        print("Warning: this Pillow cannot write AVIF; saving screenshots as lossy WebP")
+        args.image_format = "webp"
+    segment_writer = pack_store = None
+    if args.frame_store == "segments":
+        segment_writer = SegmentWriter(config.screenshots_path, args.keyframe_interval)
+    elif args.frame_store == "packs":
+        pack_store = get_pack_store(config.screenshots_path)
+
+    def save_image(frame: CapturedFrame) -> str:
+        # The encoding runs in the encoder processes; this waits for it.
+        # Segments are written here, as each delta depends on the last frame.
+        if segment_writer is not None:
+            filename = segment_writer.append(frame.monitor, frame.timestamp, frame.image)
+            return submit_encoding(
+                args.encode_processes, encode_previews, frame.image, config.screenshots_path, filename
+            ).result()
+        stem = f"{frame.timestamp}_{frame.monitor}"  # Add monitor index to filename for uniqueness
+        if pack_store is not None:
+            filename, files = submit_encoding(
+                args.encode_processes,
+                encode_frame_files,
+                frame.image,
+                stem,
+                image_format=args.image_format,
+                quality=args.image_quality,
+                method=args.webp_method,
+            ).result()
+            pack_store.put_many(files)
+            return filename
+        return submit_encoding(
+            args.encode_processes,
+            encode_frame,
+            frame.image,
+            config.screenshots_path,
+            stem,
+            image_format=args.image_format,
+            quality=args.image_quality,
+            method=args.webp_method,
+        ).result()
+
+    def ocr(frame: CapturedFrame) -> Optional[CapturedFrame]:
+        if dirty_ocr is not None:
+            text: str = dirty_ocr.extract_text(frame.monitor, frame.image)
+        else:
+            text = extract_text_from_image(frame.image)
+        # Only proceed if OCR actually extracts text
+        return frame._replace(text=text) if text.strip() else None
+
+    def embed(frame: CapturedFrame) -> CapturedFrame:
+        return frame._replace(embedding=get_embedding(frame.text))
+
+    def save(frame: CapturedFrame) -> None:
+        height, width = frame.image.shape[:2]
+        insert_entry_async(
+            frame.text,
+            frame.timestamp,
+            frame.embedding,
+            frame.app,
+            frame.title,
+            filename=save_image(frame),
+            monitor=frame.monitor,
+            width=width,
+            height=height,
+            embedding_model=embedding_model_version(),
+            ocr_model=ocr_model_version(),
+        )
+
+    def spool(frame: CapturedFrame) -> None:
+        height, width = frame.image.shape[:2]
+        get_spool().append(
+            frame.timestamp, frame.monitor, save_image(frame), frame.app, frame.title, width, height
+        )
+
+    # Segments need each monitor's frames in capture order, so from OCR on
+    # they stay on one worker per stage
+    save_key = (lambda frame: frame.monitor) if segment_writer is not None else None
+    if args.deferred_processing:
+        return Pipeline(
+            [Stage("spool", spool, workers=args.save_workers, maxsize=queue_size, key=save_key)]
+        )
+    return Pipeline(
+        [
+            Stage(
+                "ocr",
+                ocr,
+                workers=args.ocr_workers,
+                maxsize=queue_size,
+                overflow=args.ocr_overflow,
+                key=lambda frame: frame.monitor,
+            ),
+            Stage("embed", embed, workers=args.embed_workers, maxsize=queue_size, key=save_key),
+            Stage("save", save, workers=args.save_workers, maxsize=queue_size, key=save_key),
+        ]
+    )
+
+
+def pipeline_stats() -> Dict[str, Dict[str, float]]:
+    """Returns the queue depths and counters of the recorder's pipeline stages."""
+    return _pipeline.stats() if _pipeline is not None else {}
+
+
 def record_screenshots_thread() -> None:
     """
-    Continuously records screenshots, processes them, and stores relevant data.
+    Continuously records screenshots and feeds the changed ones to the pipeline.
 
-    Checks for user activity and image similarity before processing and saving
-    screenshots, associated OCR text, embeddings, and active application info.
+    Checks for user activity and image similarity before handing a frame,
+    with the active application info at capture time, to the OCR, embedding
+    and save stages, which run in their own threads. Capture keeps its
+    cadence however far behind they are.
     Runs in an infinite loop, intended to be executed in a separate thread.
     """
+    global _pipeline
     # TODO: Move this environment variable setting to the application's entry point.
     # HACK: Prevents a warning/error from the huggingface/tokenizers library
     # when used in environments where multiprocessing fork safety is a concern.
     os.environ["TOKENIZERS_PARALLELISM"] = "false"
 
+    _pipeline = build_pipeline().start()
+    # Holds a small signature of the last kept frame of each monitor
+    detector = ChangeDetector()
     last_screenshots: List[np.ndarray] = take_screenshots()
+    for i, screenshot in enumerate(last_screenshots):
+        detector.has_changed(i, screenshot)
+    monitor_count = len(last_screenshots)
+    del last_screenshots
 
+    next_capture = time.monotonic()
     while True:
+        # Wait before taking the next screenshot, on a fixed schedule
+        next_capture = max(next_capture + CAPTURE_INTERVAL, time.monotonic())
+        time.sleep(next_capture - time.monotonic())
+
         if not is_user_active():
-            time.sleep(3)  # Wait longer if user is inactive
             continue
 
         current_screenshots: List[np.ndarray] = take_screenshots()
 
-        # Ensure we have a last_screenshot for each current_screenshot
         # This handles cases where monitor setup might change (though unlikely mid-run)
-        if len(last_screenshots) != len(current_screenshots):
-             # If monitor count changes, reset last_screenshots and continue
-             last_screenshots = current_screenshots
-             time.sleep(3)
-             continue
-
+        if len(current_screenshots) != monitor_count:
+            # If monitor count changes, compare against the new frames from now on
+            monitor_count = len(current_screenshots)
+            detector.reset()
+            if not config.args.full_frame_ocr:
+                get_dirty_region_ocr().reset()
+            for i, screenshot in enumerate(current_screenshots):
+                detector.has_changed(i, screenshot)
+            continue
 
+        timestamp = int(time.time())
         for i, current_screenshot in enumerate(current_screenshots):
-            last_screenshot = last_screenshots[i]
-
-            if not is_similar(current_screenshot, last_screenshot):
-                last_screenshots[i] = current_screenshot  # Update the last screenshot for this monitor
-                image = Image.fromarray(current_screenshot)
-                timestamp = int(time.time())
-                filename = f"{timestamp}_{i}.webp" # Add monitor index to filename for uniqueness
-                filepath = os.path.join(screenshots_path, filename)
-                image.save(
-                    filepath,
-                    format="webp",
-                    lossless=True,
-                )
-                text: str = extract_text_from_image(current_screenshot)
-                # Only proceed if OCR actually extracts text
-                if text.strip():
-                    embedding: np.ndarray = get_embedding(text)
-                    active_app_name: str = get_active_app_name() or "Unknown App"
-                    active_window_title: str = get_active_window_title() or "Unknown Title"
-                    insert_entry(
-                        text, timestamp, embedding, active_app_name, active_window_title, filename # Pass filename
+            if detector.has_changed(i, current_screenshot):
+                _pipeline.submit(
+                    CapturedFrame(
+                        monitor=i,
+                        timestamp=timestamp,
+                        image=current_screenshot,
+                        app=get_active_app_name() or "Unknown App",
+                        title=get_active_window_title() or "Unknown Title",
                     )
+                )
 
-        time.sleep(3) # Wait before taking the next screenshot
 
-    return screenshots
+def process_spooled_frame(frame: SpooledFrame, ocr: Optional[DirtyRegionOCR]) -> None:
+    """Runs OCR and embedding on a spooled frame and stores the entry.
 
+    Returns once the entry is committed, so the frame can then be removed
+    from the spool. A frame without text has its image deleted, as the live
+    pipeline never saves one.
 
-def record_screenshots_thread():
-    # TODO: fix the error from huggingface tokenizers
-    import os
+    Args:
+        frame: The spooled frame.
+        ocr: The dirty-region OCR to use, or None to OCR the frame in full.
+    """
+    try:
+        pixels = load_frame(config.screenshots_path, frame.filename)
+    except OSError as e:
+        pixels = None
+        print(f"Skipping spooled frame {frame.filename}: {e}")
+    if pixels is None:
+        return
+    if ocr is not None:
+        text: str = ocr.extract_text(frame.monitor, pixels)
+    else:
+        text = extract_text_from_image(pixels)
+    if not text.strip():
+        remove_image(frame.filename)
+        return
+    insert_entry(
+        text,
+        frame.timestamp,
+        get_embedding(text),
+        frame.app,
+        frame.title,
+        filename=frame.filename,
+        monitor=frame.monitor,
+        width=frame.width,
+        height=frame.height,
+        embedding_model=embedding_model_version(),
+        ocr_model=ocr_model_version(),
+    )
 
-    os.environ["TOKENIZERS_PARALLELISM"] = "false"
 
-    last_screenshots = take_screenshots()
+def drain_spool_thread() -> None:
+    """
+    Processes spooled frames in capture order whenever the user is idle or
+    the load is low, forever.
 
+    Frames are removed from the spool only once stored, so a crash at any
+    point processes the frame again, and its duplicate insert is ignored.
+    Intended to be executed in a separate daemon thread.
+    """
+    spool = get_spool()
+    # Its own instance, as the live pipeline may OCR the same monitors
+    ocr = None if config.args.full_frame_ocr else DirtyRegionOCR()
     while True:
-        if not is_user_active():
-            time.sleep(3)
+        if is_user_active() and not load_is_low(DRAIN_MAX_LOAD):
+            time.sleep(DRAIN_INTERVAL)
             continue
-
-        screenshots = take_screenshots()
-
-        for i, screenshot in enumerate(screenshots):
-
-            last_screenshot = last_screenshots[i]
-
-            if not is_similar(screenshot, last_screenshot):
-                last_screenshots[i] = screenshot
-                image = Image.fromarray(screenshot)
-                timestamp = int(time.time())
-                image.save(
-                    os.path.join(screenshots_path, f"{timestamp}.webp"),
-                    format="webp",
-                    lossless=True,
-                )
-                text: str = extract_text_from_image(current_screenshot)
-                # Only proceed if OCR actually extracts text
-                if text.strip():
-                    embedding: np.ndarray = get_embedding(text)
-                    active_app_name: str = get_active_app_name() or "Unknown App"
-                    active_window_title: str = get_active_window_title() or "Unknown Title"
-                    insert_entry(
-                        text, timestamp, embedding, active_app_name, active_window_title, filename # Pass filename
-                    )
-
-        time.sleep(3) # Wait before taking the next screenshot
+        frames = spool.peek(DRAIN_BATCH)
+        if not frames:
+            time.sleep(DRAIN_INTERVAL)
+            continue
+        for frame in frames:
+            try:
+                process_spooled_frame(frame, ocr)
+            except Exception as e:
+                # Most likely a model failing to load; retry later
+                print(f"Error processing spooled frame {frame.filename}: {e}")
+                time.sleep(DRAIN_INTERVAL)
+                break
+            spool.remove(frame.id)
+            if is_user_active() and not load_is_low(DRAIN_MAX_LOAD):
+                break
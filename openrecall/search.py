@@ -0,0 +1,240 @@
+import re
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Callable, Dict, Hashable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from openrecall.database import (
+    SearchFilters,
+    filter_entry_ids,
+    get_embedding_store,
+    get_max_entry_id,
+    keyword_search,
+)
+
+# Damping constant of reciprocal-rank fusion; 60 is the value from the
+# original RRF paper and keeps single top ranks from dominating
+RRF_K: int = 60
+# Candidates taken from each ranking before fusion, per requested result
+CANDIDATE_FACTOR: int = 2
+QUERY_CACHE_SIZE: int = 256
+RESULT_CACHE_SIZE: int = 256
+# Results ranked per query and filters; pages are slices of this one
+# ranking, so the candidate pools do not change from page to page
+RANKING_SIZE: int = 480
+
+# `name:value` or `name:"quoted value"` filter terms in a query
+FILTER_PATTERN = re.compile(r'\b(app|title|before|after|monitor):(?:"([^"]*)"|(\S+))', re.IGNORECASE)
+
+
+def parse_time(value: str) -> Optional[int]:
+    """Parses a Unix timestamp or an ISO date/datetime in local time.
+
+    Returns:
+        The Unix timestamp, or None if `value` is neither.
+    """
+    if value.isdigit():
+        return int(value)
+    try:
+        return int(datetime.fromisoformat(value).timestamp())
+    except ValueError:
+        return None
+
+
+def parse_query(query: str) -> Tuple[str, SearchFilters]:
+    """Splits filter terms such as `app:Slack` or `after:2024-05-01` off a query.
+
+    Supported filters are `app:` (exact application name, case-insensitive),
+    `title:` (words in the window title), `after:` / `before:` (a date,
+    datetime or Unix timestamp) and `monitor:` (the monitor index, 0 being
+    the primary one). Terms with an unparseable value are left in the query
+    text.
+
+    Args:
+        query: The search string typed by the user.
+
+    Returns:
+        The remaining free text and the parsed filters.
+    """
+    filters: Dict[str, Any] = {}
+
+    def take(match: "re.Match") -> str:
+        name = match.group(1).lower()
+        value = match.group(2) if match.group(2) is not None else match.group(3)
+        if name in ("after", "before"):
+            timestamp = parse_time(value)
+            if timestamp is None:
+                return match.group(0)
+            filters[name] = timestamp
+        elif name == "monitor":
+            if not value.isdigit():
+                return match.group(0)
+            filters[name] = int(value)
+        else:
+            filters[name] = value
+        return " "
+
+    text = FILTER_PATTERN.sub(take, query)
+    return " ".join(text.split()), SearchFilters(**filters)
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[int]], k: int = RRF_K) -> List[int]:
+    """Merges several rankings of entry ids into one.
+
+    Each id scores the sum of 1 / (k + rank) over the rankings it appears in,
+    so ids ranked well by both keyword and semantic search rise to the top
+    without having to calibrate BM25 against cosine similarity.
+
+    Args:
+        rankings: Lists of ids, each ordered best first.
+        k: The RRF damping constant.
+
+    Returns:
+        The fused list of ids, best first.
+    """
+    scores: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, entry_id in enumerate(ranking, start=1):
+            scores[int(entry_id)] = scores.get(int(entry_id), 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=lambda entry_id: scores[entry_id], reverse=True)
+
+
+def hybrid_search(
+    query: str,
+    query_embedding: np.ndarray,
+    vector_index,
+    limit: int,
+    filters: Optional[SearchFilters] = None,
+) -> List[int]:
+    """Ranks entries by fusing BM25 keyword and cosine semantic rankings.
+
+    With filters, the matching entries are selected through the database
+    indexes first and only their embeddings are scored, exactly, from the
+    embedding store; the keyword ranking is restricted the same way.
+
+    Args:
+        query: The user's search string, matched against the FTS5 index.
+        query_embedding: The embedding of `query`.
+        vector_index: Any index with a `search(query, k)` method returning
+                      (ids, scores).
+        limit: The maximum number of ids to return.
+        filters: Optional filters from `parse_query`.
+
+    Returns:
+        Entry ids, best first. With filters but no query text, the matching
+        entries newest first.
+    """
+    candidates = limit * CANDIDATE_FACTOR
+    if filters is None or filters == SearchFilters():
+        semantic_ids, _ = vector_index.search(query_embedding, candidates)
+        keyword_ids = [entry_id for entry_id, _ in keyword_search(query, candidates)]
+        return reciprocal_rank_fusion([keyword_ids, semantic_ids.tolist()])[:limit]
+
+    allowed_ids = filter_entry_ids(filters)
+    if not query.strip():
+        return allowed_ids[::-1][:limit].tolist()
+    store = get_embedding_store()
+    if store is not None:
+        semantic_ids, _ = store.search_subset(query_embedding, allowed_ids, candidates)
+    else:
+        semantic_ids = np.empty(0, dtype=np.int64)
+    keyword_ids = [entry_id for entry_id, _ in keyword_search(query, candidates, filters)]
+    return reciprocal_rank_fusion([keyword_ids, semantic_ids.tolist()])[:limit]
+
+
+class SearchCache:
+    """LRU caches for query embeddings and search rankings.
+
+    Query embeddings never go stale, as the model is fixed. Rankings are
+    tagged with the highest entry id at the time they were computed. A new
+    search recomputes a ranking once a newer entry has been inserted, while
+    paging through one keeps serving the ranking the first page came from,
+    so no result moves between pages.
+    """
+
+    def __init__(self, max_queries: int = QUERY_CACHE_SIZE, max_results: int = RESULT_CACHE_SIZE) -> None:
+        """
+        Args:
+            max_queries: The number of query embeddings kept.
+            max_results: The number of rankings kept.
+        """
+        self.max_queries = max_queries
+        self.max_results = max_results
+        self._embeddings: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        # Each result with the highest entry id when it was computed
+        self._results: "OrderedDict[Hashable, Tuple[int, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.embedding_hits = 0
+        self.result_hits = 0
+        self.lookups = 0
+
+    @staticmethod
+    def _get(cache: OrderedDict, key: Hashable) -> Any:
+        value = cache.get(key)
+        if value is not None:
+            cache.move_to_end(key)
+        return value
+
+    @staticmethod
+    def _put(cache: OrderedDict, key: Hashable, value: Any, max_size: int) -> None:
+        cache[key] = value
+        cache.move_to_end(key)
+        while len(cache) > max_size:
+            cache.popitem(last=False)
+
+    def embedding(self, query: str, compute: Callable[[str], np.ndarray]) -> np.ndarray:
+        """Returns the cached embedding of `query`, computing it on a miss.
+
+        Args:
+            query: The search string.
+            compute: The embedding function, e.g. `nlp.get_embedding`.
+
+        Returns:
+            A read-only embedding array.
+        """
+        with self._lock:
+            embedding = self._get(self._embeddings, query)
+            self.embedding_hits += embedding is not None
+        if embedding is None:
+            embedding = np.array(compute(query), dtype=np.float32)
+            embedding.flags.writeable = False
+            with self._lock:
+                self._put(self._embeddings, query, embedding, self.max_queries)
+        return embedding
+
+    def results(self, key: Hashable, compute: Callable[[], Any], refresh: bool = True) -> Any:
+        """Returns the cached result for `key`, computing it on a miss.
+
+        Args:
+            key: Identifies the request, e.g. (query, filters).
+            compute: Produces the result when it is not cached or stale.
+            refresh: Recompute a result cached before the newest entry was
+                     inserted; False serves it as long as it is cached.
+
+        Returns:
+            The cached or freshly computed result.
+        """
+        generation = get_max_entry_id()
+        with self._lock:
+            cached = self._get(self._results, key)
+            self.lookups += 1
+            if cached is not None and (cached[0] == generation or not refresh):
+                self.result_hits += 1
+                return cached[1]
+        result = compute()
+        with self._lock:
+            self._put(self._results, key, (generation, result), self.max_results)
+        return result
+
+    def stats(self) -> Dict[str, int]:
+        """Returns the cache sizes and hit counts."""
+        with self._lock:
+            return {
+                "queries": len(self._embeddings),
+                "results": len(self._results),
+                "lookups": self.lookups,
+                "result_hits": self.result_hits,
+                "embedding_hits": self.embedding_hits,
+            }
@@ -0,0 +1,315 @@
+import calendar
+import io
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from openrecall.change_detection import TILE_SIZE, changed_tiles
+
+# Frames of each monitor are appended to one segment file per UTC hour,
+# segments/<monitor>/<YYYYMMDDHH>.seg, with a fixed-size record per frame
+# in the .idx file next to it
+SEGMENT_DIR = "segments"
+SEGMENT_EXTENSION = ".seg"
+INDEX_EXTENSION = ".idx"
+# A reader applies at most KEYFRAME_INTERVAL - 1 deltas to a keyframe
+KEYFRAME_INTERVAL = 30
+# Deltas changing more than this share of the tiles are stored as keyframes
+MAX_DELTA_FRACTION = 0.5
+# Changed tiles of a delta are packed this many to a row of one image
+MOSAIC_COLUMNS = 16
+KEYFRAME, DELTA = 0, 1
+INDEX_DTYPE = np.dtype(
+    [("timestamp", "<i8"), ("offset", "<u8"), ("length", "<u4"), ("kind", "u1"), ("pad", "V3")]
+)
+# Delta payload: width, height, tile size and tile count, then the (row,
+# column) of every tile as uint16 pairs, then the mosaic image
+DELTA_HEADER = np.dtype([("width", "<u2"), ("height", "<u2"), ("tile", "<u2"), ("count", "<u4")])
+
+
+def frame_name(timestamp: int, monitor: int) -> str:
+    """Returns the file name stored for a frame kept in a segment."""
+    return f"{timestamp}_{monitor}{SEGMENT_EXTENSION}"
+
+
+def is_segment_frame(filename: Optional[str]) -> bool:
+    """Checks whether a stored file name refers to a frame in a segment."""
+    return bool(filename) and filename.endswith(SEGMENT_EXTENSION)
+
+
+def parse_frame_name(filename: str) -> Tuple[int, int]:
+    """Returns the (timestamp, monitor) of a segment frame name."""
+    timestamp, monitor = filename[: -len(SEGMENT_EXTENSION)].split("_")
+    return int(timestamp), int(monitor)
+
+
+def segment_path(root: str, monitor: int, timestamp: int) -> str:
+    """Returns the segment file holding a monitor's frames of the hour of `timestamp`."""
+    hour = time.strftime("%Y%m%d%H", time.gmtime(timestamp))
+    return os.path.join(root, SEGMENT_DIR, str(monitor), hour + SEGMENT_EXTENSION)
+
+
+def _index_path(path: str) -> str:
+    return path[: -len(SEGMENT_EXTENSION)] + INDEX_EXTENSION
+
+
+def _encode_image(pixels: np.ndarray) -> bytes:
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format="webp", lossless=True)
+    return buffer.getvalue()
+
+
+def _decode_image(data: bytes) -> np.ndarray:
+    from PIL import Image
+
+    with Image.open(io.BytesIO(data)) as image:
+        return np.array(image.convert("RGB"))
+
+
+def _padded(pixels: np.ndarray, tile: int) -> np.ndarray:
+    height, width = pixels.shape[:2]
+    pad_height, pad_width = -height % tile, -width % tile
+    if not pad_height and not pad_width:
+        return pixels
+    return np.pad(pixels, ((0, pad_height), (0, pad_width), (0, 0)))
+
+
+def encode_delta(previous: np.ndarray, current: np.ndarray, tile: int = TILE_SIZE) -> Optional[bytes]:
+    """Encodes the tiles of a frame that differ from the previous frame.
+
+    Args:
+        previous: The previous frame, of the same shape.
+        current: The frame to encode.
+        tile: The side of the tiles in pixels.
+
+    Returns:
+        The delta payload, or None if more than MAX_DELTA_FRACTION of the
+        tiles changed and a keyframe is the better choice.
+    """
+    mask = changed_tiles(previous, current, tile)
+    positions = np.argwhere(mask).astype(np.uint16)
+    if len(positions) > MAX_DELTA_FRACTION * mask.size:
+        return None
+    height, width = current.shape[:2]
+    header = np.array([(width, height, tile, len(positions))], dtype=DELTA_HEADER).tobytes()
+    if not len(positions):
+        return header
+    padded = _padded(current, tile)
+    rows = -(-len(positions) // MOSAIC_COLUMNS)
+    columns = min(len(positions), MOSAIC_COLUMNS)
+    mosaic = np.zeros((rows * tile, columns * tile, 3), dtype=np.uint8)
+    for i, (row, col) in enumerate(positions):
+        r, c = divmod(i, MOSAIC_COLUMNS)
+        mosaic[r * tile : (r + 1) * tile, c * tile : (c + 1) * tile] = padded[
+            row * tile : (row + 1) * tile, col * tile : (col + 1) * tile
+        ]
+    return header + positions.tobytes() + _encode_image(mosaic)
+
+
+def apply_delta(frame: np.ndarray, payload: bytes) -> np.ndarray:
+    """Applies a delta from `encode_delta` to the previous frame, in place when possible.
+
+    Returns:
+        The reconstructed frame.
+    """
+    header = np.frombuffer(payload, dtype=DELTA_HEADER, count=1)[0]
+    count, tile = int(header["count"]), int(header["tile"])
+    if not count:
+        return frame
+    height, width = frame.shape[:2]
+    positions = np.frombuffer(payload, dtype=np.uint16, count=2 * count, offset=DELTA_HEADER.itemsize)
+    mosaic = _decode_image(payload[DELTA_HEADER.itemsize + positions.nbytes :])
+    for i, (row, col) in enumerate(positions.reshape(-1, 2)):
+        r, c = divmod(i, MOSAIC_COLUMNS)
+        top, left = int(row) * tile, int(col) * tile
+        patch = mosaic[r * tile : (r + 1) * tile, c * tile : (c + 1) * tile]
+        bottom, right = min(top + tile, height), min(left + tile, width)
+        frame[top:bottom, left:right] = patch[: bottom - top, : right - left]
+    return frame
+
+
+class SegmentWriter:
+    """Appends frames to per-monitor, per-hour segment files.
+
+    Each segment starts with a keyframe, a lossless WebP of the whole
+    frame. The next frames are stored as deltas: only the tiles that differ
+    from the previous frame, packed into one lossless WebP. A new keyframe
+    is written every `keyframe_interval` frames, when most tiles changed or
+    when the resolution changed, so any frame is rebuilt from one keyframe
+    and a bounded number of deltas.
+
+    Frames of one monitor must be appended in order, from one thread at a
+    time; frames of different monitors may be appended concurrently.
+    """
+
+    def __init__(self, root: str, keyframe_interval: int = KEYFRAME_INTERVAL, tile: int = TILE_SIZE) -> None:
+        """
+        Args:
+            root: The screenshots folder; segments go in its SEGMENT_DIR.
+            keyframe_interval: The maximum distance between keyframes, in frames.
+            tile: The side in pixels of the tiles deltas are made of.
+        """
+        self.root = root
+        self.keyframe_interval = max(1, keyframe_interval)
+        self.tile = tile
+        # Per monitor: the segment written last, its last frame and the
+        # number of deltas written since its keyframe
+        self._last: Dict[int, Tuple[str, np.ndarray, int]] = {}
+        self._lock = threading.Lock()
+
+    def append(self, monitor: int, timestamp: int, pixels: np.ndarray) -> str:
+        """Appends a frame and returns the file name to store for it.
+
+        The frame's bytes are synced to disk before its index record is
+        written, so a crash in between leaves only unreferenced bytes at
+        the end of the segment. A segment left by an earlier run has its
+        index repaired before anything is appended to it.
+        """
+        path = segment_path(self.root, monitor, timestamp)
+        with self._lock:
+            last = self._last.get(monitor)
+        if last is None or last[0] != path:
+            _repair_index(path)
+        payload = None
+        if (
+            last is not None
+            and last[0] == path
+            and last[1].shape == pixels.shape
+            and last[2] < self.keyframe_interval - 1
+        ):
+            payload = encode_delta(last[1], pixels, self.tile)
+        if payload is None:
+            kind, payload, deltas = KEYFRAME, _encode_image(pixels), 0
+        else:
+            kind, deltas = DELTA, last[2] + 1
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "ab") as segment:
+            offset = segment.seek(0, os.SEEK_END)
+            segment.write(payload)
+            segment.flush()
+            os.fsync(segment.fileno())
+        record = np.array([(timestamp, offset, len(payload), kind, b"")], dtype=INDEX_DTYPE)
+        with open(_index_path(path), "ab") as index:
+            index.write(record.tobytes())
+        with self._lock:
+            self._last[monitor] = (path, pixels, deltas)
+        return frame_name(timestamp, monitor)
+
+
+def read_index(path: str) -> np.ndarray:
+    """Reads the index records of a segment, in append order.
+
+    A partial record left by a torn write, and records pointing past the
+    end of the segment after a crash, are ignored along with any after them.
+    """
+    try:
+        data = np.fromfile(_index_path(path), dtype=np.uint8)
+    except FileNotFoundError:
+        return np.empty(0, dtype=INDEX_DTYPE)
+    count = len(data) // INDEX_DTYPE.itemsize
+    records = data[: count * INDEX_DTYPE.itemsize].view(INDEX_DTYPE)
+    try:
+        size = os.path.getsize(path)
+    except FileNotFoundError:
+        size = 0
+    beyond = np.flatnonzero(records["offset"] + records["length"] > size)
+    return records[: beyond[0]] if len(beyond) else records
+
+
+def _repair_index(path: str) -> None:
+    # Cuts an index back to its valid records, so that new records are
+    # appended right after them rather than after a torn one
+    index_path = _index_path(path)
+    try:
+        size = os.path.getsize(index_path)
+    except FileNotFoundError:
+        return
+    valid = read_index(path).nbytes
+    if valid != size:
+        with open(index_path, "r+b") as index:
+            index.truncate(valid)
+
+
+def read_frame(root: str, monitor: int, timestamp: int) -> Optional[np.ndarray]:
+    """Rebuilds a frame from its segment.
+
+    Reads the nearest keyframe at or before the frame and applies the
+    deltas after it, at most `keyframe_interval - 1` of them.
+
+    Args:
+        root: The screenshots folder.
+        monitor: The monitor the frame was captured from.
+        timestamp: The capture time of the frame.
+
+    Returns:
+        The frame as an RGB NumPy array, or None if it is not in a segment.
+    """
+    path = segment_path(root, monitor, timestamp)
+    index = read_index(path)
+    matches = np.flatnonzero(index["timestamp"] == timestamp)
+    if not len(matches):
+        return None
+    position = int(matches[-1])
+    keyframes = np.flatnonzero(index["kind"][: position + 1] == KEYFRAME)
+    if not len(keyframes):
+        return None
+    frame = None
+    with open(path, "rb") as segment:
+        for record in index[int(keyframes[-1]) : position + 1]:
+            segment.seek(int(record["offset"]))
+            payload = segment.read(int(record["length"]))
+            if record["kind"] == KEYFRAME:
+                frame = _decode_image(payload)
+            else:
+                frame = apply_delta(frame, payload)
+    return frame
+
+
+def read_frame_by_name(root: str, filename: str) -> Optional[np.ndarray]:
+    """Rebuilds a frame from the file name stored for it (see `frame_name`)."""
+    timestamp, monitor = parse_frame_name(filename)
+    return read_frame(root, monitor, timestamp)
+
+
+def remove_segments_before(root: str, before: float) -> int:
+    """Deletes the segments of every hour that ended at or before `before`.
+
+    Returns:
+        The number of segments deleted.
+    """
+    removed = 0
+    directory = os.path.join(root, SEGMENT_DIR)
+    if not os.path.isdir(directory):
+        return 0
+    for monitor in os.listdir(directory):
+        for name in os.listdir(os.path.join(directory, monitor)):
+            if not name.endswith(SEGMENT_EXTENSION):
+                continue
+            start = calendar.timegm(time.strptime(name[:10], "%Y%m%d%H"))
+            if start + 3600 <= before:
+                path = os.path.join(directory, monitor, name)
+                for file_path in (path, _index_path(path)):
+                    try:
+                        os.remove(file_path)
+                    except FileNotFoundError:
+                        pass
+                removed += 1
+    return removed
+
+
+def segment_files(root: str) -> List[str]:
+    """Lists every segment and index file under the screenshots folder."""
+    directory = os.path.join(root, SEGMENT_DIR)
+    if not os.path.isdir(directory):
+        return []
+    return [
+        os.path.join(directory, monitor, name)
+        for monitor in sorted(os.listdir(directory))
+        for name in sorted(os.listdir(os.path.join(directory, monitor)))
+    ]
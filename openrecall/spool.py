@@ -0,0 +1,127 @@
+import os
+import sqlite3
+import threading
+from collections import namedtuple
+from typing import Dict, List, Optional
+
+from openrecall import config
+
+# A captured frame waiting for OCR and embedding; its image is already saved
+# as `filename` in the screenshots folder
+SpooledFrame = namedtuple(
+    "SpooledFrame",
+    ["id", "timestamp", "monitor", "filename", "app", "title", "width", "height"],
+)
+
+_spool: Optional["FrameSpool"] = None
+_spool_lock = threading.Lock()
+
+
+class FrameSpool:
+    """A durable queue of captured frames waiting to be processed.
+
+    Frames live in a small SQLite file next to the database, so a backlog
+    built up while the user is active survives restarts. They are handed
+    out in capture order and only removed once processed.
+    """
+
+    def __init__(self, path: str) -> None:
+        """
+        Args:
+            path: The SQLite file holding the spool, created if missing.
+        """
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS frames (
+                       id INTEGER PRIMARY KEY AUTOINCREMENT,
+                       timestamp INTEGER NOT NULL,
+                       monitor INTEGER NOT NULL,
+                       filename TEXT NOT NULL,
+                       app TEXT,
+                       title TEXT,
+                       width INTEGER,
+                       height INTEGER
+                   )"""
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_frames_order ON frames (timestamp, monitor)"
+            )
+
+    def append(
+        self,
+        timestamp: int,
+        monitor: int,
+        filename: str,
+        app: str,
+        title: str,
+        width: Optional[int] = None,
+        height: Optional[int] = None,
+    ) -> int:
+        """Adds a captured frame; it is on disk once this returns.
+
+        Returns:
+            The spool id of the frame.
+        """
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                """INSERT INTO frames (timestamp, monitor, filename, app, title, width, height)
+                   VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                (timestamp, monitor, filename, app, title, width, height),
+            )
+            return cursor.lastrowid
+
+    def peek(self, limit: int = 1) -> List[SpooledFrame]:
+        """Returns the oldest frames without removing them, oldest first."""
+        with self._lock:
+            rows = self._conn.execute(
+                """SELECT id, timestamp, monitor, filename, app, title, width, height
+                   FROM frames ORDER BY timestamp, monitor, id LIMIT ?""",
+                (limit,),
+            ).fetchall()
+        return [SpooledFrame(*row) for row in rows]
+
+    def remove(self, frame_id: int) -> None:
+        """Removes a processed frame."""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM frames WHERE id = ?", (frame_id,))
+
+    def backlog(self) -> int:
+        """Returns the number of frames waiting to be processed."""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM frames").fetchone()[0]
+
+    def stats(self) -> Dict[str, Optional[int]]:
+        """Returns the backlog size and the capture time of its oldest frame."""
+        with self._lock:
+            count, oldest = self._conn.execute(
+                "SELECT COUNT(*), MIN(timestamp) FROM frames"
+            ).fetchone()
+        return {"backlog": count, "oldest_timestamp": oldest}
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def load_is_low(max_load: float) -> bool:
+    """Checks whether the 1-minute load average per CPU is below `max_load`.
+
+    Always False where the load average is not available (Windows).
+    """
+    try:
+        load = os.getloadavg()[0]
+    except (AttributeError, OSError):
+        return False
+    return load / (os.cpu_count() or 1) < max_load
+
+
+def get_spool() -> FrameSpool:
+    """Returns the frame spool in the storage path, opening it on first use."""
+    global _spool
+    with _spool_lock:
+        if _spool is None:
+            _spool = FrameSpool(config.spool_path)
+        return _spool
@@ -0,0 +1,41 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator
+
+logger = logging.getLogger(__name__)
+
+# Reference point for the import phase; this module is imported first
+PROCESS_START: float = time.perf_counter()
+
+_phases: Dict[str, float] = {}
+_lock = threading.Lock()
+
+
+def record_phase(name: str, seconds: float) -> None:
+    """Records the duration of a startup phase and logs it.
+
+    Args:
+        name: The phase name, e.g. "embedding_model_load".
+        seconds: How long the phase took.
+    """
+    with _lock:
+        _phases[name] = seconds
+    logger.info(f"Startup phase '{name}' took {seconds:.2f} s")
+
+
+@contextmanager
+def timed_phase(name: str) -> Iterator[None]:
+    """Times the enclosed block as a startup phase."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_phase(name, time.perf_counter() - start)
+
+
+def startup_report() -> Dict[str, float]:
+    """Returns the recorded phase durations in seconds."""
+    with _lock:
+        return dict(_phases)
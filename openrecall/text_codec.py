@@ -0,0 +1,112 @@
+import struct
+import threading
+import zlib
+from collections import Counter
+from typing import Sequence
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# "zstd" needs the optional zstandard package; "zlib" is the standard
+# library's deflate with a preset dictionary and is always available
+CODECS = ("zstd", "zlib")
+# zlib only looks back 32 KiB, so a larger dictionary would not help it
+DICTIONARY_SIZE = 32 * 1024
+COMPRESSION_LEVEL = 6
+# Compressed values start with the id of the dictionary they were made with
+HEADER = struct.Struct("<I")
+
+
+def default_codec() -> str:
+    """Returns the best codec available in this environment."""
+    return "zstd" if zstandard is not None else "zlib"
+
+
+def train_dictionary(samples: Sequence[str], codec: str, size: int = DICTIONARY_SIZE) -> bytes:
+    """Builds a compression dictionary from sample texts.
+
+    zstd trains a proper dictionary. zlib has no trainer, so its dictionary
+    is the most frequent lines of the samples, with the most frequent last
+    where deflate finds them at the shortest distance. zstd falls back to
+    the same raw-content dictionary when there is too little sample text
+    for its trainer.
+
+    Args:
+        samples: Texts representative of what will be compressed.
+        codec: One of CODECS.
+        size: The maximum dictionary size in bytes.
+
+    Returns:
+        The dictionary.
+    """
+    if codec not in CODECS:
+        raise ValueError(f"Unknown text codec '{codec}'")
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("The zstd text codec requires the zstandard package")
+        try:
+            return zstandard.train_dictionary(size, [s.encode("utf-8") for s in samples]).as_bytes()
+        except zstandard.ZstdError:
+            pass
+
+    counts = Counter(line for text in samples for line in set(text.splitlines()) if line.strip())
+    lines = []
+    total = 0
+    for line, count in counts.most_common():
+        if count < 2:
+            break
+        encoded = line.encode("utf-8") + b"\n"
+        if total + len(encoded) > size:
+            continue
+        lines.append(encoded)
+        total += len(encoded)
+    return b"".join(reversed(lines))
+
+
+class TextDictionary:
+    """A versioned compression dictionary and the codec it belongs to.
+
+    Compressed values carry the dictionary id in a 4-byte header, so values
+    written with older dictionaries stay readable after retraining.
+    """
+
+    def __init__(self, dictionary_id: int, codec: str, data: bytes):
+        if codec not in CODECS:
+            raise ValueError(f"Unknown text codec '{codec}'")
+        if codec == "zstd" and zstandard is None:
+            raise RuntimeError("The zstd text codec requires the zstandard package")
+        self.id = dictionary_id
+        self.codec = codec
+        self.data = data
+        self._header = HEADER.pack(dictionary_id)
+        # zstandard compressors may not be used from two threads at once
+        self._lock = threading.Lock()
+        if codec == "zstd":
+            zstd_dict = zstandard.ZstdCompressionDict(data)
+            self._compressor = zstandard.ZstdCompressor(level=COMPRESSION_LEVEL, dict_data=zstd_dict)
+            self._decompressor = zstandard.ZstdDecompressor(dict_data=zstd_dict)
+
+    def compress(self, text: str) -> bytes:
+        """Compresses text into a value carrying this dictionary's id."""
+        raw = text.encode("utf-8")
+        if self.codec == "zstd":
+            with self._lock:
+                return self._header + self._compressor.compress(raw)
+        compressor = zlib.compressobj(COMPRESSION_LEVEL, zdict=self.data)
+        return self._header + compressor.compress(raw) + compressor.flush()
+
+    def decompress(self, value: bytes) -> str:
+        """Decompresses a value produced by `compress`."""
+        payload = memoryview(value)[HEADER.size:]
+        if self.codec == "zstd":
+            with self._lock:
+                return self._decompressor.decompress(payload).decode("utf-8")
+        decompressor = zlib.decompressobj(zdict=self.data)
+        return (decompressor.decompress(payload) + decompressor.flush()).decode("utf-8")
+
+
+def dictionary_id(value: bytes) -> int:
+    """Returns the id of the dictionary a compressed value was made with."""
+    return HEADER.unpack_from(value)[0]
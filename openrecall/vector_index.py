@@ -0,0 +1,147 @@
+import threading
+from typing import Optional, Tuple
+
+import numpy as np
+
+INITIAL_CAPACITY: int = 1024
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """Returns a float32 copy of `vectors` with every row scaled to unit length.
+
+    Zero rows are left as zeros so they score 0 against any query, matching
+    `nlp.cosine_similarity`.
+
+    Args:
+        vectors: A vector or a (n, dim) array of vectors.
+
+    Returns:
+        A (n, dim) float32 array.
+    """
+    vectors = np.array(vectors, dtype=np.float32, ndmin=2)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Returns the positions of the `k` highest scores, best first.
+
+    Uses `argpartition` so only the selected scores are fully sorted.
+
+    Args:
+        scores: A 1-D array of scores.
+        k: The number of positions to return.
+
+    Returns:
+        An int64 array of at most `k` positions into `scores`.
+    """
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    if k < len(scores):
+        top = np.argpartition(-scores, k - 1)[:k]
+    else:
+        top = np.arange(len(scores))
+    return top[np.argsort(-scores[top], kind="stable")]
+
+
+class EmbeddingIndex:
+    """Resident, contiguous matrix of L2-normalised embeddings.
+
+    Rows are stored pre-normalised as float32 so that cosine similarity
+    against every entry is a single matrix-vector product. A parallel array
+    holds the entry id of each row. The matrix grows geometrically, so
+    appending a row is amortised O(1) and never rebuilds the index.
+    """
+
+    def __init__(self, dim: Optional[int] = None) -> None:
+        """
+        Args:
+            dim: Embedding dimension. If None, it is taken from the first
+                 vector added to the index.
+        """
+        self.dim: Optional[int] = dim
+        self._matrix: np.ndarray = np.empty((0, dim or 0), dtype=np.float32)
+        self._ids: np.ndarray = np.empty(0, dtype=np.int64)
+        self._size: int = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _reserve(self, capacity: int) -> None:
+        """Grows the backing arrays to hold at least `capacity` rows."""
+        if capacity <= len(self._ids):
+            return
+        new_capacity = max(capacity, 2 * len(self._ids), INITIAL_CAPACITY)
+        matrix = np.empty((new_capacity, self.dim), dtype=np.float32)
+        ids = np.empty(new_capacity, dtype=np.int64)
+        matrix[: self._size] = self._matrix[: self._size]
+        ids[: self._size] = self._ids[: self._size]
+        self._matrix, self._ids = matrix, ids
+
+    def add_batch(self, ids: np.ndarray, embeddings: np.ndarray) -> None:
+        """Appends several embeddings to the index.
+
+        Args:
+            ids: Entry ids, one per embedding.
+            embeddings: A (n, dim) array of raw (unnormalised) embeddings.
+        """
+        if len(ids) == 0:
+            return
+        vectors = normalize(embeddings)
+        with self._lock:
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+                self._matrix = np.empty((0, self.dim), dtype=np.float32)
+            if vectors.shape[1] != self.dim:
+                raise ValueError(
+                    f"Embedding dimension {vectors.shape[1]} does not match index dimension {self.dim}"
+                )
+            end = self._size + len(vectors)
+            self._reserve(end)
+            self._matrix[self._size : end] = vectors
+            self._ids[self._size : end] = ids
+            self._size = end
+
+    def add(self, entry_id: int, embedding: np.ndarray) -> None:
+        """Appends a single embedding to the index.
+
+        Args:
+            entry_id: The id of the database entry the embedding belongs to.
+            embedding: The raw embedding vector.
+        """
+        self.add_batch(np.array([entry_id], dtype=np.int64), embedding)
+
+    def search(self, query: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Finds the `k` entries most similar to `query`.
+
+        Args:
+            query: The query embedding (need not be normalised).
+            k: The maximum number of results to return.
+
+        Returns:
+            A tuple (ids, scores) of arrays ordered by descending cosine
+            similarity. Both are empty if the index is empty.
+        """
+        with self._lock:
+            size = self._size
+            matrix = self._matrix[:size]
+            ids = self._ids[:size]
+
+        if size == 0 or k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        scores = matrix @ normalize(query)[0]
+        order = top_k(scores, k)
+        return ids[order], scores[order]
+
+    def export(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Returns copies of the ids and normalised vectors currently indexed.
+
+        Returns:
+            A tuple (ids, vectors) with vectors of shape (n, dim).
+        """
+        with self._lock:
+            return self._ids[: self._size].copy(), self._matrix[: self._size].copy()
@@ -28,6 +28,8 @@ extras_require = {
     "python-doctr": [
         "python-doctr @ git+https://github.com/koenvaneijk/doctr.git@af711bc04eb8876a7189923fb51ec44481ee18cd"
     ],
+    # Optional: compress stored OCR text with zstd instead of zlib
+    "zstd": ["zstandard"],
 }
 
 # Determine the current OS
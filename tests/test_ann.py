@@ -0,0 +1,89 @@
+import numpy as np
+from openrecall.ann import IVFIndex, spherical_kmeans
+from openrecall.vector_index import EmbeddingIndex, normalize
+
+
+def clustered_vectors(n=2000, dim=16, n_topics=20, seed=0):
+    rng = np.random.default_rng(seed)
+    topics = rng.normal(size=(n_topics, dim))
+    return (topics[rng.integers(0, n_topics, n)] + rng.normal(scale=0.3, size=(n, dim))).astype(np.float32)
+
+
+def test_spherical_kmeans_returns_unit_centroids():
+    vectors = normalize(clustered_vectors())
+    centroids = spherical_kmeans(vectors, 10)
+    assert centroids.shape == (10, 16)
+    np.testing.assert_allclose(np.linalg.norm(centroids, axis=1), 1.0, rtol=1e-5)
+
+
+def test_untrained_index_searches_exactly():
+    index = IVFIndex(min_train_size=100)
+    index.add(1, np.array([1.0, 0.0]))
+    index.add(2, np.array([0.0, 1.0]))
+    assert not index.is_trained
+    ids, _ = index.search(np.array([0.1, 1.0]), k=1)
+    assert ids.tolist() == [2]
+
+
+def test_index_trains_once_threshold_reached():
+    vectors = clustered_vectors()
+    index = IVFIndex(nlist=20, min_train_size=1000)
+    index.add_batch(np.arange(999), vectors[:999])
+    assert not index.is_trained
+    index.add_batch(np.arange(999, 2000), vectors[999:])
+    assert index.is_trained
+    assert len(index) == 2000
+    assert index.last_id == 1999
+
+
+def test_full_probe_matches_exact_search():
+    vectors = clustered_vectors()
+    index = IVFIndex(nlist=20, min_train_size=1)
+    index.add_batch(np.arange(len(vectors)), vectors)
+    exact = EmbeddingIndex()
+    exact.add_batch(np.arange(len(vectors)), vectors)
+
+    query = vectors[123]
+    ivf_ids, _ = index.search(query, k=10, nprobe=20)
+    exact_ids, _ = exact.search(query, k=10)
+    assert ivf_ids.tolist() == exact_ids.tolist()
+
+
+def test_recall_with_few_probes():
+    vectors = clustered_vectors()
+    index = IVFIndex(nlist=20, nprobe=3, min_train_size=1)
+    index.add_batch(np.arange(len(vectors)), vectors)
+    exact = EmbeddingIndex()
+    exact.add_batch(np.arange(len(vectors)), vectors)
+
+    hits = 0
+    for query in vectors[:50]:
+        hits += len(set(index.search(query, 10)[0]) & set(exact.search(query, 10)[0]))
+    assert hits / 500 >= 0.9
+
+
+def test_save_and_load_round_trip(tmp_path):
+    vectors = clustered_vectors()
+    index = IVFIndex(nlist=20, min_train_size=1)
+    index.add_batch(np.arange(len(vectors)), vectors)
+    path = str(tmp_path / "index.npz")
+    index.save(path)
+
+    restored = IVFIndex.load(path, nprobe=5)
+    assert len(restored) == len(index)
+    assert restored.last_id == index.last_id
+    assert restored.nprobe == 5
+    query = vectors[7]
+    assert restored.search(query, 10)[0].tolist() == index.search(query, 10, nprobe=5)[0].tolist()
+
+
+def test_save_and_load_untrained(tmp_path):
+    index = IVFIndex(min_train_size=100)
+    index.add_batch(np.array([5, 6]), np.eye(2))
+    path = str(tmp_path / "index.npz")
+    index.save(path)
+
+    restored = IVFIndex.load(path)
+    assert not restored.is_trained
+    assert restored.last_id == 6
+    assert restored.search(np.array([0.0, 1.0]), 1)[0].tolist() == [6]
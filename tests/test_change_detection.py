@@ -0,0 +1,97 @@
+import numpy as np
+import pytest
+
+from openrecall.change_detection import (
+    ChangeDetector,
+    changed_tiles,
+    frame_signature,
+    mean_structured_similarity_index,
+    merge_rectangles,
+    signature_similarity,
+    tile_rectangles,
+)
+
+
+def blocky_frame(seed, rows=9, cols=16, block=8):
+    """A frame made of uniform gray blocks, which signatures represent exactly."""
+    gray = np.random.default_rng(seed).integers(0, 256, (rows, cols), dtype=np.uint8)
+    return np.repeat(np.repeat(gray, block, axis=0), block, axis=1)[..., None].repeat(3, axis=2)
+
+
+def test_signature_is_block_mean_of_grayscale():
+    image = np.random.default_rng(0).integers(0, 256, (37, 50, 3), dtype=np.uint8)
+    gray = 0.2989 * image[..., 0] + 0.5870 * image[..., 1] + 0.1140 * image[..., 2]
+    expected = gray[:32, :48].reshape(4, 8, 6, 8).mean(axis=(1, 3))
+
+    signature = frame_signature(image, block=8)
+
+    assert signature.dtype == np.uint8
+    assert signature.shape == (4, 6)
+    assert np.abs(signature - expected).max() <= 1
+
+
+def test_signature_spans_several_bands_and_ignores_alpha():
+    image = np.random.default_rng(1).integers(0, 256, (8 * 40 + 5, 64, 4), dtype=np.uint8)
+    gray = 0.2989 * image[..., 0] + 0.5870 * image[..., 1] + 0.1140 * image[..., 2]
+    expected = gray[:320].reshape(40, 8, 8, 8).mean(axis=(1, 3))
+
+    signature = frame_signature(image, block=8)
+
+    assert signature.shape == (40, 8)
+    assert np.abs(signature - expected).max() <= 1
+
+
+def test_signature_of_frame_smaller_than_a_block():
+    assert frame_signature(np.zeros((4, 3, 3), dtype=np.uint8), block=8).shape == (1, 1)
+
+
+def test_signature_similarity_matches_mssim_on_blocky_frames():
+    first, second = blocky_frame(1), blocky_frame(2)
+    blended = (first // 2 + second // 2).astype(np.uint8)
+
+    for other in (first, second, blended):
+        expected = mean_structured_similarity_index(other, first)
+        actual = signature_similarity(frame_signature(other), frame_signature(first))
+        assert actual == pytest.approx(expected, abs=0.01)
+
+
+def test_detector_keeps_only_changed_frames_per_monitor():
+    detector = ChangeDetector()
+    first, second = blocky_frame(1), blocky_frame(2)
+    nudged = first.copy()
+    nudged[:8, :8] ^= 1
+
+    assert detector.has_changed(0, first)
+    assert not detector.has_changed(0, first)
+    assert not detector.has_changed(0, nudged)
+    assert detector.has_changed(1, first)
+    assert detector.has_changed(0, second)
+    assert not detector.has_changed(0, second)
+    assert detector.has_changed(0, blocky_frame(2, rows=10))
+
+
+def test_detector_reset_forgets_monitors():
+    detector = ChangeDetector()
+    frame = blocky_frame(1)
+    detector.has_changed(0, frame)
+    detector.reset()
+    assert detector.has_changed(0, frame)
+
+
+def test_changed_tiles_and_rectangles():
+    previous = np.zeros((100, 130, 3), dtype=np.uint8)
+    current = previous.copy()
+    current[5, 5] = 1
+    current[99, 129] = 1
+
+    tiles = changed_tiles(previous, current, tile=32)
+
+    assert tiles.shape == (4, 5)
+    assert tiles.sum() == 2 and tiles[0, 0] and tiles[3, 4]
+    assert tile_rectangles(tiles, (100, 130), tile=32, pad=0) == [(0, 0, 32, 32), (128, 96, 130, 100)]
+    assert tile_rectangles(tiles, (100, 130), tile=32, pad=1) == [(0, 0, 64, 64), (96, 64, 130, 100)]
+
+
+def test_merge_rectangles_merges_chains():
+    rects = [(0, 0, 10, 10), (20, 0, 30, 10), (10, 5, 20, 6), (50, 50, 60, 60)]
+    assert merge_rectangles(rects) == [(0, 0, 30, 10), (50, 50, 60, 60)]
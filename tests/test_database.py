@@ -2,6 +2,7 @@ import unittest
 import sqlite3
 import os
 import tempfile
+import threading
 import time
 import numpy as np
 from unittest.mock import patch
@@ -22,11 +23,44 @@ with patch('openrecall.config.db_path', mock_db_path):
         insert_entry,
         get_all_entries,
         get_timestamps,
+        get_all_embeddings,
+        get_entries_by_ids,
+        add_insert_listener,
+        attach_embedding_store,
+        get_embedding_codes,
+        insert_embedding_codes,
+        keyword_search,
+        to_fts_query,
+        get_max_entry_id,
+        get_frames_window,
+        get_monitors,
+        SCHEMA_VERSION,
+        get_timeline_bounds,
+        get_timeline_buckets,
+        filter_entry_ids,
+        SearchFilters,
+        get_connection,
+        insert_entry_async,
+        BatchWriter,
+        PendingEntry,
         Entry,
+        TIER_LOSSLESS,
+        TIER_TEXT_ONLY,
+        get_compaction_batch,
+        set_storage_tiers,
+        delete_entries_before,
+        incremental_vacuum,
+        rebuild_text_index,
+        close_connections,
+        train_text_dictionary,
+        compress_text_batch,
+        current_text_dictionary,
+        get_shards,
+        seal_shard,
     )
-    # Also patch db_path within the database module itself if it was imported directly there
+    from openrecall import config
+    from openrecall.embedding_store import EmbeddingStore
     import openrecall.database
-    openrecall.database.db_path = mock_db_path
 
 
 class TestDatabase(unittest.TestCase):
@@ -34,7 +68,9 @@ class TestDatabase(unittest.TestCase):
     @classmethod
     def setUpClass(cls):
         """Set up a temporary database file for all tests in this class."""
-        # The database path is already patched by the module-level patch
+        # The database module reads config.db_path on every connect
+        cls.db_path_patcher = patch('openrecall.config.db_path', mock_db_path)
+        cls.db_path_patcher.start()
         cls.db_path = mock_db_path
         # Ensure the database and table are created once
         create_db()
@@ -48,6 +84,7 @@ class TestDatabase(unittest.TestCase):
                 cls.conn.close()
         except Exception:
             pass # Ignore errors during cleanup
+        cls.db_path_patcher.stop()
         os.remove(cls.db_path)
         # Clean up sys.path modification
         sys.path.pop(0)
@@ -58,6 +95,8 @@ class TestDatabase(unittest.TestCase):
         self.conn = sqlite3.connect(self.db_path)
         cursor = self.conn.cursor()
         cursor.execute("DELETE FROM entries")
+        cursor.execute("DELETE FROM timeline_buckets")
+        cursor.execute("DELETE FROM timeline_app_counts")
         self.conn.commit()
         # No need to close here, will be handled by tearDown or next setUp potentially
 
@@ -184,6 +223,633 @@ class TestDatabase(unittest.TestCase):
         # Timestamps should be ordered DESC
         self.assertEqual(timestamps, [ts2, ts1, ts3])
 
+    def test_get_frames_window_keyset_pagination(self):
+        """Test frame windows page through the timeline by cursor."""
+        emb = np.array([0.1] * 5, dtype=np.float32)
+        for i in range(10):
+            insert_entry(f"T{i}", 100 + i, emb, "A", "T", filename=f"{100 + i}_0.webp")
+        window = lambda **kwargs: [frame.timestamp for frame in get_frames_window(**kwargs)]
+        self.assertEqual(window(limit=3), [109, 108, 107])
+        self.assertEqual(window(before=107, limit=3), [106, 105, 104])
+        self.assertEqual(window(after=101, limit=3), [104, 103, 102])
+        self.assertEqual(window(before=105, after=101, limit=10), [104, 103, 102])
+        self.assertEqual(window(before=100), [])
+        self.assertEqual(get_frames_window(limit=1)[0].filename, "109_0.webp")
+
+    def test_frames_of_several_monitors(self):
+        """Test frames of different monitors may share a timestamp and are told apart."""
+        emb = np.array([0.1] * 5, dtype=np.float32)
+        self.assertIsNotNone(insert_entry("T", 100, emb, "A", "T", filename="100_0.webp", monitor=0))
+        self.assertIsNotNone(insert_entry("T", 100, emb, "A", "T", filename="100_1.webp", monitor=1))
+        self.assertIsNone(insert_entry("T", 100, emb, "A", "T", filename="100_1.webp", monitor=1))
+        insert_entry("T", 105, emb, "A", "T", filename="105_1.webp", monitor=1)
+        self.assertEqual(get_monitors(), [0, 1])
+        self.assertEqual([f.filename for f in get_frames_window(monitor=1)], ["105_1.webp", "100_1.webp"])
+        self.assertEqual(len(get_frames_window()), 3)
+        self.assertEqual(filter_entry_ids(SearchFilters(monitor=0)).tolist(), [get_frames_window(monitor=0)[0].id])
+
+    def test_get_timeline_bounds(self):
+        """Test the count and bounds of the timeline."""
+        self.assertEqual(tuple(get_timeline_bounds()), (0, None, None))
+        emb = np.array([0.1] * 5, dtype=np.float32)
+        for ts in (300, 100, 200):
+            insert_entry("T", ts, emb, "A", "T")
+        self.assertEqual(tuple(get_timeline_bounds()), (3, 100, 300))
+
+    def _insert_frames(self, frames):
+        emb = np.array([0.1] * 5, dtype=np.float32)
+        return [insert_entry("T", ts, emb, app, "T") for ts, app in frames]
+
+    def test_timeline_buckets_follow_inserts(self):
+        """Test rollups count frames and pick the latest frame of the dominant app."""
+        ids = self._insert_frames(
+            [(3600, "Editor"), (3610, "Browser"), (3620, "Editor"), (3700, "Browser"), (7200, "Mail")]
+        )
+        minutes = get_timeline_buckets("minute")
+        self.assertEqual([(b.start, b.frame_count, b.dominant_app) for b in minutes],
+                         [(3600, 3, "Editor"), (3660, 1, "Browser"), (7200, 1, "Mail")])
+        self.assertEqual(minutes[0].representative_id, ids[2])
+        self.assertEqual(minutes[0].representative_timestamp, 3620)
+
+        hours = get_timeline_buckets("hour")
+        self.assertEqual([(b.start, b.frame_count) for b in hours], [(3600, 4), (7200, 1)])
+        # A tie goes to the app seen most recently
+        self.assertEqual((hours[0].dominant_app, hours[0].representative_id), ("Browser", ids[3]))
+        self.assertEqual(len(get_timeline_buckets("day")), 1)
+        self.assertEqual([b.start for b in get_timeline_buckets("hour", start=7000, end=8000)], [3600, 7200])
+
+    def test_timeline_buckets_follow_deletes(self):
+        """Test rollups are corrected when their entries are deleted."""
+        ids = self._insert_frames(
+            [(3600, "Editor"), (3610, "Editor"), (3620, "Browser"), (3630, "Browser"), (7200, "Mail")]
+        )
+        self.assertEqual(get_timeline_buckets("minute")[0].representative_id, ids[3])
+        cursor = self.conn.cursor()
+        cursor.execute("DELETE FROM entries WHERE id IN (?, ?)", (ids[3], ids[4]))
+        self.conn.commit()
+        minutes = get_timeline_buckets("minute")
+        self.assertEqual(len(minutes), 1)
+        self.assertEqual((minutes[0].frame_count, minutes[0].dominant_app), (3, "Editor"))
+        self.assertEqual(minutes[0].representative_id, ids[1])
+
+    def test_timeline_buckets_backfilled_for_existing_rows(self):
+        """Test create_db rolls up entries recorded before the rollup tables existed."""
+        ids = self._insert_frames([(60, "A"), (70, "B"), (80, "B"), (200, "A")])
+        expected = get_timeline_buckets("minute")
+        cursor = self.conn.cursor()
+        cursor.executescript(
+            "DROP TABLE timeline_buckets; DROP TABLE timeline_app_counts;"
+            + "".join(f"DROP TRIGGER entries_rollup_{s}_insert; DROP TRIGGER entries_rollup_{s}_delete;"
+                      for s in (60, 3600, 86400))
+            + "UPDATE schema_version SET version = 0;"
+        )
+        create_db()
+        self.assertEqual(get_timeline_buckets("minute"), expected)
+        self.assertEqual(expected[0].representative_id, ids[2])
+
+    def test_get_all_embeddings(self):
+        """Test retrieving all embeddings as one contiguous matrix ordered by id."""
+        ts = int(time.time())
+        emb1 = np.array([0.1, 0.2, 0.3], dtype=np.float32)
+        emb2 = np.array([0.4, 0.5, 0.6], dtype=np.float32)
+        id1 = insert_entry("T1", ts, emb1, "A1", "T1")
+        id2 = insert_entry("T2", ts - 10, emb2, "A2", "T2")
+
+        ids, matrix = get_all_embeddings()
+        self.assertEqual(ids.tolist(), [id1, id2])
+        self.assertEqual(matrix.shape, (2, 3))
+        np.testing.assert_array_almost_equal(matrix[0], emb1)
+        np.testing.assert_array_almost_equal(matrix[1], emb2)
+
+    def test_get_all_embeddings_empty(self):
+        """Test retrieving embeddings from an empty database."""
+        ids, matrix = get_all_embeddings()
+        self.assertEqual(len(ids), 0)
+        self.assertEqual(len(matrix), 0)
+
+    def test_get_entries_by_ids_preserves_order(self):
+        """Test fetching entries by id returns them in the requested order."""
+        ts = int(time.time())
+        emb = np.array([0.1] * 5, dtype=np.float32)
+        id1 = insert_entry("T1", ts, emb, "A1", "T1")
+        id2 = insert_entry("T2", ts + 1, emb, "A2", "T2")
+        id3 = insert_entry("T3", ts + 2, emb, "A3", "T3")
+
+        entries = get_entries_by_ids([id3, id1, 999999, id2])
+        self.assertEqual([e.id for e in entries], [id3, id1, id2])
+        self.assertEqual(entries[0].text, "T3")
+        self.assertIsNone(entries[0].embedding)
+        self.assertEqual(get_entries_by_ids([]), [])
+
+    def test_insert_listener_called_on_commit(self):
+        """Test insert listeners are notified of new rows but not duplicates."""
+        seen = []
+        add_insert_listener(lambda entry_id, embedding: seen.append(entry_id))
+        try:
+            ts = int(time.time())
+            emb = np.array([0.1] * 5, dtype=np.float32)
+            new_id = insert_entry("T1", ts, emb, "A1", "T1")
+            insert_entry("T1 again", ts, emb, "A1", "T1")
+            self.assertEqual(seen, [new_id])
+        finally:
+            openrecall.database._insert_listeners.pop()
+
+    def test_failing_listener_does_not_fail_committed_rows(self):
+        """Test a raising listener is logged while the row and other listeners succeed before the insert returns."""
+        seen = []
+
+        def failing(entry_id, embedding):
+            raise RuntimeError("index full")
+
+        add_insert_listener(failing)
+        add_insert_listener(lambda entry_id, embedding: seen.append(entry_id))
+        try:
+            emb = np.array([0.1] * 5, dtype=np.float32)
+            future = insert_entry_async("T1", int(time.time()), emb, "A1", "T1")
+            new_id = future.result()
+            self.assertIsNotNone(new_id)
+            self.assertEqual(seen, [new_id])
+            self.assertEqual(get_entries_by_ids([new_id])[0].text, "T1")
+
+            # A synchronous insert waits for its own row only, not the whole queue
+            with patch.object(openrecall.database._writer, 'flush', side_effect=AssertionError):
+                other_id = insert_entry("T2", int(time.time()) + 1, emb, "A1", "T1")
+            self.assertEqual(seen, [new_id, other_id])
+        finally:
+            del openrecall.database._insert_listeners[-2:]
+
+    def test_embedding_store_written_with_insert(self):
+        """Test an attached embedding store is backfilled and kept in step with inserts."""
+        ts = int(time.time())
+        existing_id = insert_entry("T1", ts, np.array([1.0, 0.0, 0.0], dtype=np.float32), "A1", "T1")
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            store = EmbeddingStore(os.path.join(tmp_dir, "embeddings.f32"), 3, "test-model")
+            try:
+                attach_embedding_store(store)
+                self.assertEqual(store.arrays()[0].tolist(), [existing_id])
+
+                new_id = insert_entry("T2", ts + 1, np.array([0.0, 2.0, 0.0], dtype=np.float32), "A2", "T2")
+                insert_entry("T2 again", ts + 1, np.array([0.0, 0.0, 1.0], dtype=np.float32), "A2", "T2")
+                ids, vectors = store.arrays()
+                self.assertEqual(ids.tolist(), [existing_id, new_id])
+                np.testing.assert_array_almost_equal(vectors[1], [0.0, 1.0, 0.0])
+
+                # A failed store write must not leave the SQL row behind
+                self.assertIsNone(insert_entry("T3", ts + 2, np.zeros(5, dtype=np.float32), "A3", "T3"))
+                cursor = self.conn.cursor()
+                cursor.execute("SELECT COUNT(*) FROM entries WHERE timestamp = ?", (ts + 2,))
+                self.assertEqual(cursor.fetchone()[0], 0)
+                self.assertEqual(len(store), 2)
+            finally:
+                openrecall.database._embedding_store = None
+                store.close()
+
+    def test_embedding_codes_round_trip(self):
+        """Test quantized codes are persisted per mode and replace other modes."""
+        self.conn.execute("DELETE FROM embedding_codes")
+        self.conn.commit()
+        codes = np.array([[1, -2, 3], [4, 5, -6]], dtype=np.int8)
+        scales = np.array([0.5, 0.25], dtype=np.float32)
+        insert_embedding_codes("int8", np.array([3, 7]), codes, scales)
+
+        ids, loaded_codes, loaded_scales = get_embedding_codes("int8", 3)
+        self.assertEqual(ids.tolist(), [3, 7])
+        np.testing.assert_array_equal(loaded_codes, codes)
+        np.testing.assert_array_almost_equal(loaded_scales, scales)
+
+        insert_embedding_codes("float16", np.array([3]), codes[:1].astype(np.float16), scales[:1])
+        self.assertEqual(len(get_embedding_codes("int8", 3)[0]), 0)
+        self.assertEqual(get_embedding_codes("float16", 3)[0].tolist(), [3])
+
+    def test_keyword_search_matches_text_app_and_title(self):
+        """Test the FTS index is filled by the insert trigger and ranks matches."""
+        ts = int(time.time())
+        emb = np.array([0.1] * 5, dtype=np.float32)
+        id1 = insert_entry("ssh build-42.example.com\nerror E1234", ts, emb, "Terminal", "bash")
+        id2 = insert_entry("weekly report draft", ts + 1, emb, "Writer", "report.odt")
+        id3 = insert_entry("nothing here", ts + 2, emb, "Browser", "E1234 lookup")
+
+        self.assertEqual([r[0] for r in keyword_search("build-42.example.com", 10)], [id1])
+        self.assertEqual({r[0] for r in keyword_search("E1234", 10)}, {id1, id3})
+        self.assertEqual([r[0] for r in keyword_search("writer", 10)], [id2])
+        self.assertEqual(keyword_search("   ", 10), [])
+        self.assertEqual(keyword_search('unbalanced "quote', 10), [])
+
+    def test_keyword_index_follows_deletes_and_updates(self):
+        """Test the delete and update triggers keep the FTS index in sync."""
+        ts = int(time.time())
+        emb = np.array([0.1] * 5, dtype=np.float32)
+        entry_id = insert_entry("alpha", ts, emb, "App", "Title")
+        self.conn.execute("UPDATE entries SET text = 'beta' WHERE id = ?", (entry_id,))
+        self.conn.commit()
+        self.assertEqual(keyword_search("alpha", 10), [])
+        self.assertEqual([r[0] for r in keyword_search("beta", 10)], [entry_id])
+
+        self.conn.execute("DELETE FROM entries WHERE id = ?", (entry_id,))
+        self.conn.commit()
+        self.assertEqual(keyword_search("beta", 10), [])
+
+    def test_filter_entry_ids(self):
+        """Test filters select entries by app, title words and time range."""
+        emb = np.array([0.1] * 5, dtype=np.float32)
+        id1 = insert_entry("a", 100, emb, "Firefox", "Q3 report - Docs")
+        id2 = insert_entry("b", 200, emb, "firefox", "Inbox")
+        id3 = insert_entry("c", 300, emb, "Slack", "Q3 planning")
+        self.assertEqual(filter_entry_ids(SearchFilters(app="FIREFOX")).tolist(), [id1, id2])
+        self.assertEqual(filter_entry_ids(SearchFilters(app="Firefox", after=150)).tolist(), [id2])
+        self.assertEqual(filter_entry_ids(SearchFilters(title="q3")).tolist(), [id1, id3])
+        self.assertEqual(filter_entry_ids(SearchFilters(after=100, before=300)).tolist(), [id1, id2])
+        self.assertEqual(filter_entry_ids(SearchFilters(app="Mail")).tolist(), [])
+
+    def test_filter_uses_app_timestamp_index(self):
+        """Test the app and time filters are answered from idx_app_timestamp."""
+        plan = self.conn.execute(
+            "EXPLAIN QUERY PLAN SELECT id FROM entries "
+            "WHERE entries.app = ? COLLATE NOCASE AND entries.timestamp >= ?",
+            ("Firefox", 0),
+        ).fetchall()
+        self.assertIn("idx_app_timestamp", " ".join(str(row) for row in plan))
+
+    def test_plain_text_is_found_through_its_partial_index(self):
+        """Test text compression finds uncompressed rows without scanning the table."""
+        plan = self.conn.execute(
+            "EXPLAIN QUERY PLAN SELECT id, text FROM entries "
+            "WHERE typeof(text) = 'text' ORDER BY id LIMIT 10"
+        ).fetchall()
+        self.assertIn("idx_plain_text", " ".join(str(row) for row in plan))
+
+    def test_keyword_search_with_filters(self):
+        """Test keyword search only ranks entries passing the filters."""
+        emb = np.array([0.1] * 5, dtype=np.float32)
+        insert_entry("quarterly invoice", 100, emb, "Mail", "Inbox")
+        id2 = insert_entry("invoice draft", 200, emb, "Docs", "Invoice template")
+        insert_entry("invoice paid", 300, emb, "Docs", "Receipts")
+        self.assertEqual([i for i, _ in keyword_search("invoice", 10, SearchFilters(app="docs", before=250))], [id2])
+        self.assertEqual([i for i, _ in keyword_search("invoice", 10, SearchFilters(title="template"))], [id2])
+
+    def test_to_fts_query_quotes_terms(self):
+        """Test user input is quoted term by term."""
+        self.assertEqual(to_fts_query('host-1 say "hi"'), '"host-1" "say" """hi"""')
+        self.assertEqual(to_fts_query(""), "")
+
+    def test_entries_carry_filename_and_monitor(self):
+        """Test the frame metadata is stored and returned with entries."""
+        emb = np.array([0.1] * 5, dtype=np.float32)
+        entry_id = insert_entry(
+            "T", 100, emb, "A", "T", filename="100_1.webp", monitor=1, width=1920, height=1080,
+            embedding_model="m/eager", ocr_model="o/eager",
+        )
+        entry = get_entries_by_ids([entry_id])[0]
+        self.assertEqual((entry.filename, entry.monitor), ("100_1.webp", 1))
+        row = self.conn.execute(
+            "SELECT width, height, embedding_model, ocr_model FROM entries WHERE id = ?", (entry_id,)
+        ).fetchone()
+        self.assertEqual(row, (1920, 1080, "m/eager", "o/eager"))
+
+    def test_migrates_legacy_database(self):
+        """Test a database from before schema versioning is upgraded in place."""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            legacy_path = os.path.join(tmp_dir, "recall.db")
+            with sqlite3.connect(legacy_path) as legacy:
+                legacy.execute(
+                    """CREATE TABLE entries (id INTEGER PRIMARY KEY AUTOINCREMENT, app TEXT,
+                       title TEXT, text TEXT, timestamp INTEGER UNIQUE, embedding BLOB)"""
+                )
+                legacy.execute("CREATE INDEX idx_timestamp ON entries (timestamp)")
+                legacy.executemany(
+                    "INSERT INTO entries (app, title, text, timestamp, embedding) VALUES (?, ?, ?, ?, ?)",
+                    [("Mail", "Inbox", "quarterly invoice", 100, b"\0" * 12),
+                     ("Docs", "Draft", "meeting notes", 200, b"\0" * 12)],
+                )
+                legacy.execute("DELETE FROM entries WHERE timestamp = 200")
+            legacy.close()
+
+            with patch('openrecall.config.db_path', legacy_path):
+                create_db()
+                conn = get_connection()
+                self.assertEqual(conn.execute("SELECT version FROM schema_version").fetchone()[0], SCHEMA_VERSION)
+                self.assertEqual(
+                    conn.execute("SELECT id, filename, monitor FROM entries").fetchall(), [(1, "100.webp", 0)]
+                )
+                self.assertEqual([i for i, _ in keyword_search("invoice", 5)], [1])
+                self.assertEqual(get_timeline_buckets("minute")[0].frame_count, 1)
+                # The id of the deleted row is not handed out again
+                self.assertEqual(insert_entry("new", 300, np.zeros(3, dtype=np.float32), "A", "T"), 3)
+                # Running again is a no-op
+                create_db()
+                self.assertEqual(conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0], 2)
+                openrecall.database.close_connections()
+
+    def test_text_compression_is_transparent(self):
+        """Test compressed text reads back, stays searchable and new rows are compressed."""
+        emb = np.zeros(3, dtype=np.float32)
+        with tempfile.TemporaryDirectory() as tmp_dir, \
+                patch('openrecall.config.db_path', os.path.join(tmp_dir, "recall.db")):
+            create_db()
+            texts = [f"File Edit View Help\nInvoice {i} for quarterly review" for i in range(5)]
+            ids = [insert_entry(text, 100 + i, emb, "A", "T") for i, text in enumerate(texts)]
+            self.assertIsNone(train_text_dictionary("zlib", min_rows=10, min_new_rows=1))
+            dictionary = train_text_dictionary("zlib", min_rows=5, min_new_rows=10)
+            self.assertEqual(current_text_dictionary().id, dictionary.id)
+
+            self.assertEqual(compress_text_batch(3), 3)
+            self.assertEqual(compress_text_batch(3), 2)
+            self.assertEqual(compress_text_batch(3), 0)
+            conn = get_connection()
+            self.assertEqual({t for (t,) in conn.execute("SELECT typeof(text) FROM entries")}, {"blob"})
+            self.assertEqual([e.text for e in get_entries_by_ids(ids)], texts)
+
+            self.assertEqual(len(keyword_search("invoice", 10)), 5)
+            self.assertEqual(len(delete_entries_before(101, 10)), 1)
+            self.assertEqual(len(keyword_search("invoice", 10)), 4)
+
+            # Other SQLite clients can still write; plain text is indexed by the triggers
+            plain = sqlite3.connect(config.db_path)
+            with plain:
+                plain.execute("INSERT INTO entries (text, timestamp, app, title) VALUES ('replaced', 300, 'A', 'T')")
+                plain.execute("UPDATE entries SET title = 'Renamed' WHERE id = ?", (ids[1],))
+                plain.execute("UPDATE entries SET text = 'replaced again' WHERE text = 'replaced'")
+            plain.close()
+            self.assertEqual(len(keyword_search("replaced", 10)), 1)
+
+            # Rebuilding indexes the plain text of compressed rows, not their blobs
+            self.assertEqual(rebuild_text_index(), 5)
+            self.assertEqual(len(keyword_search("invoice", 10)), 4)
+            self.assertEqual(len(keyword_search("renamed", 10)), 1)
+
+            new_id = insert_entry("Invoice 9", 200, emb, "A", "T")
+            self.assertIsInstance(conn.execute("SELECT text FROM entries WHERE id = ?", (new_id,)).fetchone()[0], bytes)
+            self.assertEqual(get_entries_by_ids([new_id])[0].text, "Invoice 9")
+            close_connections()
+
+    def test_get_max_entry_id(self):
+        """Test the maximum id tracks inserts and is 0 for an empty table."""
+        self.assertEqual(get_max_entry_id(), 0)
+        emb = np.array([0.1] * 5, dtype=np.float32)
+        ts = int(time.time())
+        insert_entry("T1", ts, emb, "A1", "T1")
+        id2 = insert_entry("T2", ts + 1, emb, "A2", "T2")
+        self.assertEqual(get_max_entry_id(), id2)
+
+    def test_connection_is_pooled_in_wal_mode(self):
+        """Test each thread reuses one connection with the tuned pragmas."""
+        conn = get_connection()
+        self.assertIs(get_connection(), conn)
+        self.assertEqual(conn.execute("PRAGMA journal_mode").fetchone()[0], "wal")
+        self.assertEqual(conn.execute("PRAGMA synchronous").fetchone()[0], 1)  # NORMAL
+
+        other = []
+        thread = threading.Thread(target=lambda: other.append(get_connection()))
+        thread.start()
+        thread.join()
+        self.assertIsNot(other[0], conn)
+
+    def test_queued_inserts_are_group_committed(self):
+        """Test inserts queued together share a transaction and all get their ids."""
+        writer = BatchWriter(max_batch=8)
+        emb = np.array([0.1] * 5, dtype=np.float32)
+        ts = int(time.time())
+        futures = [writer.submit(PendingEntry(f"T{i}", ts + i, emb, "A", "T")) for i in range(20)]
+        ids = [future.result() for future in futures]
+        writer.flush()
+        self.assertEqual(ids, sorted(ids))
+        self.assertEqual(len(set(ids)), 20)
+        self.assertEqual(writer.rows, 20)
+        self.assertLess(writer.batches, 20)
+        self.assertEqual(len(get_timestamps()), 20)
+
+    def test_failed_row_does_not_fail_its_batch(self):
+        """Test a row rejected by the embedding store only fails itself."""
+        ts = int(time.time())
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            store = EmbeddingStore(os.path.join(tmp_dir, "embeddings.f32"), 3, "test-model")
+            try:
+                attach_embedding_store(store)
+                good = insert_entry_async("ok", ts, np.ones(3, dtype=np.float32), "A", "T")
+                bad = insert_entry_async("bad", ts + 1, np.ones(5, dtype=np.float32), "A", "T")
+                also_good = insert_entry_async("ok", ts + 2, np.ones(3, dtype=np.float32), "A", "T")
+                self.assertIsNotNone(good.result())
+                self.assertIsNone(bad.result())
+                self.assertIsNotNone(also_good.result())
+                self.assertEqual(store.arrays()[0].tolist(), [good.result(), also_good.result()])
+                self.assertEqual(get_timestamps(), [ts + 2, ts])
+            finally:
+                openrecall.database._embedding_store = None
+                store.close()
+
+    def test_compaction_batch_and_tiers(self):
+        """Test frames are selected oldest first by tier and cutoff, and re-tiered."""
+        emb = np.ones(3, dtype=np.float32)
+        ids = [insert_entry("t", ts, emb, "A", "T", filename=f"{ts}_0.webp") for ts in (300, 100, 200)]
+        self.assertEqual(get_compaction_batch((TIER_LOSSLESS,), 250, 10), [(ids[1], "100_0.webp"), (ids[2], "200_0.webp")])
+        self.assertEqual(get_compaction_batch((TIER_LOSSLESS,), 250, 1), [(ids[1], "100_0.webp")])
+
+        set_storage_tiers([(ids[1], TIER_TEXT_ONLY, None, None, None)])
+        self.assertEqual(get_compaction_batch((TIER_LOSSLESS,), 250, 10), [(ids[2], "200_0.webp")])
+        entry = get_entries_by_ids([ids[1]])[0]
+        self.assertIsNone(entry.filename)
+        self.assertEqual(entry.text, "t")
+
+    def test_delete_entries_before(self):
+        """Test old entries are deleted in batches with their codes and index rows."""
+        emb = np.ones(3, dtype=np.float32)
+        ids = [insert_entry("needle", ts, emb, "A", "T", filename=f"{ts}_0.webp") for ts in (100, 200, 300)]
+        self.conn.execute("DELETE FROM embedding_codes")
+        self.conn.commit()
+        insert_embedding_codes("int8", np.array(ids), np.ones((3, 3), dtype=np.int8), np.ones(3))
+        self.assertEqual(delete_entries_before(250, 1), ["100_0.webp"])
+        self.assertEqual(delete_entries_before(250, 10), ["200_0.webp"])
+        self.assertEqual(delete_entries_before(250, 10), [])
+        self.assertEqual(get_timestamps(), [300])
+        self.assertEqual([entry_id for entry_id, _ in keyword_search("needle", 10)], [ids[2]])
+        self.assertEqual(get_embedding_codes("int8", 3)[0].tolist(), [ids[2]])
+
+    def test_expired_entries_do_not_rebuild_codes_on_restart(self):
+        """Test quantized codes persisted before an expiry are reused on the next start."""
+        from openrecall.quantization import load_quantized_index
+
+        self.conn.execute("DELETE FROM embedding_codes")
+        self.conn.commit()
+        vectors = np.eye(3, dtype=np.float32)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "embeddings.f32")
+            store = EmbeddingStore(path, 3, "test-model")
+            try:
+                attach_embedding_store(store)
+                ids = [insert_entry("t", ts, vectors[i], "A", "T") for i, ts in enumerate((100, 200, 300))]
+                load_quantized_index(store, "int8")
+                delete_entries_before(150, 10)
+                store.close()
+
+                store = EmbeddingStore(path, 3, "test-model")
+                attach_embedding_store(store)
+                with patch('openrecall.quantization.insert_embedding_codes') as persist:
+                    index = load_quantized_index(store, "int8")
+                self.assertEqual(persist.call_args[0][1].tolist(), [])
+                self.assertEqual(len(index), 3)
+                self.assertEqual(sorted(index.search(vectors[0], k=3)[0].tolist()), ids[1:])
+            finally:
+                openrecall.database._embedding_store = None
+                store.close()
+
+    def test_new_database_uses_incremental_vacuum(self):
+        """Test a new database is created in incremental auto-vacuum mode."""
+        self.assertEqual(self.conn.execute("PRAGMA auto_vacuum").fetchone()[0], 2)
+        self.assertIsInstance(incremental_vacuum(100), int)
+
+
+
+# 2024-01-15, 2024-02-15 and 2024-03-15 at noon UTC
+JAN, FEB, MAR = 1705320000, 1707998400, 1710504000
+
+
+class TestShards(unittest.TestCase):
+
+    def setUp(self):
+        """Record into monthly shards under a fresh storage folder."""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.patchers = [
+            patch('openrecall.config.db_path', os.path.join(self.tmp_dir.name, "recall.db")),
+            patch('openrecall.config.shards_path', os.path.join(self.tmp_dir.name, "shards")),
+            patch('openrecall.config.args', config.parser.parse_args(["--shard-by-month"])),
+        ]
+        for patcher in self.patchers:
+            patcher.start()
+        create_db()
+        self.emb = np.ones(3, dtype=np.float32)
+
+    def tearDown(self):
+        close_connections()
+        for patcher in self.patchers:
+            patcher.stop()
+        self.tmp_dir.cleanup()
+
+    def shard_files(self):
+        return sorted(name for name in os.listdir(config.shards_path) if name.endswith(".db"))
+
+    def insert(self, text, timestamp, app="A"):
+        return insert_entry(text, timestamp, self.emb, app, "T", filename=f"{timestamp}_0.webp")
+
+    def test_frames_are_written_to_monthly_shards(self):
+        """Test each month gets its own file and ids stay unique across them."""
+        ids = [self.insert("jan", JAN), self.insert("feb", FEB), self.insert("jan later", JAN + 60)]
+        self.assertEqual(ids, [1, 2, 3])
+        self.assertEqual(self.shard_files(), ["2024-01.db", "2024-02.db"])
+        self.assertEqual([shard.name for shard in get_shards()], ["2024-02", "2024-01"])
+        self.assertEqual(get_timestamps(), [FEB, JAN + 60, JAN])
+        self.assertEqual([e.text for e in get_entries_by_ids([3, 2, 1])], ["jan later", "feb", "jan"])
+        self.assertEqual(get_timeline_bounds(), (3, JAN, FEB))
+        self.assertEqual(get_max_entry_id(), 3)
+        self.assertEqual(get_all_embeddings()[0].tolist(), [1, 2, 3])
+
+    def test_id_lookups_route_through_catalog_ranges(self):
+        """Test lookups by id only open the shards whose id range holds one of the ids."""
+        jan, feb, mar = self.insert("jan", JAN), self.insert("feb", FEB), self.insert("mar", MAR)
+        jan_later = self.insert("jan later", JAN + 60)
+        self.assertEqual(
+            [(shard.name, shard.first_id, shard.last_id) for shard in get_shards()],
+            [("2024-03", mar, mar), ("2024-02", feb, feb), ("2024-01", jan, jan_later)],
+        )
+        opened = []
+        connect = openrecall.database._connect
+
+        def record(shard):
+            opened.append(shard.name)
+            return connect(shard)
+
+        with patch('openrecall.database._connect', side_effect=record):
+            self.assertEqual([e.text for e in get_entries_by_ids([jan_later, mar])], ["jan later", "mar"])
+            self.assertEqual(get_max_entry_id(), jan_later)
+        # The base shard, named None, is always visited
+        self.assertEqual(sorted(opened, key=str), ["2024-01", "2024-03", None])
+
+    def test_text_dictionaries_are_trained_per_shard(self):
+        """Test each shard is held to the first or the retraining threshold on its own."""
+        for i in range(3):
+            self.insert(f"invoice {i}", JAN + i)
+        self.assertIsNotNone(train_text_dictionary("zlib", min_rows=3, min_new_rows=5))
+        for i in range(2):
+            self.insert(f"invoice {i}", JAN + 10 + i)
+        for i in range(3):
+            self.insert(f"invoice {i}", FEB + i)
+        train_text_dictionary("zlib", min_rows=3, min_new_rows=5)
+
+        def dictionaries(shard):
+            return get_connection(shard.path).execute("SELECT COUNT(*) FROM text_dictionaries").fetchone()[0]
+
+        self.assertEqual({shard.name: dictionaries(shard) for shard in get_shards()}, {"2024-01": 1, "2024-02": 1})
+
+    def test_queries_route_to_overlapping_shards(self):
+        """Test time-bounded queries only visit the shards of their range."""
+        jan, feb, mar = self.insert("invoice", JAN), self.insert("invoice", FEB), self.insert("invoice", MAR)
+        self.assertEqual([shard.name for shard in get_shards(after=FEB, before=FEB + 86400)], ["2024-02"])
+        self.assertEqual(filter_entry_ids(SearchFilters(after=FEB, before=MAR)).tolist(), [feb])
+        self.assertEqual(
+            sorted(i for i, _ in keyword_search("invoice", 10, SearchFilters(after=FEB))), [feb, mar]
+        )
+        self.assertEqual(sorted(i for i, _ in keyword_search("invoice", 10)), [jan, feb, mar])
+        self.assertEqual(len(keyword_search("invoice", 2)), 2)
+        self.assertEqual([b.start for b in get_timeline_buckets("day", start=FEB)], [FEB // 86400 * 86400, MAR // 86400 * 86400])
+
+    def test_frames_window_spans_shards(self):
+        """Test a window is filled from consecutive shards in timestamp order."""
+        timestamps = [JAN, JAN + 1, FEB, FEB + 1, MAR]
+        for ts in timestamps:
+            self.insert("t", ts)
+        self.assertEqual([f.timestamp for f in get_frames_window(before=MAR, limit=3)], [FEB + 1, FEB, JAN + 1])
+        self.assertEqual([f.timestamp for f in get_frames_window(after=JAN, limit=3)], [FEB + 1, FEB, JAN + 1])
+        self.assertEqual([f.timestamp for f in get_frames_window(limit=10)], timestamps[::-1])
+
+    def test_sealed_shard_is_read_only(self):
+        """Test a sealed shard stays readable but takes no new frames."""
+        jan = self.insert("jan", JAN)
+        shard = get_shards(before=FEB)[0]
+        self.assertTrue(seal_shard(shard))
+        self.assertTrue(get_shards(before=FEB)[0].read_only)
+        self.assertEqual(os.path.getsize(shard.path + "-wal"), 0)
+        self.assertIsNone(self.insert("late", JAN + 5))
+        self.assertEqual(self.insert("feb", FEB), jan + 1)
+        self.assertEqual([e.text for e in get_entries_by_ids([jan])], ["jan"])
+        self.assertEqual(filter_entry_ids(SearchFilters(before=FEB)).tolist(), [jan])
+
+    def test_writer_reads_sequences_once_and_skips_sealed_shards(self):
+        """Test new ids come from the writer's cache, seeded without opening sealed shards."""
+        jan = self.insert("jan", JAN)
+        self.assertTrue(seal_shard(get_shards(before=FEB)[0]))
+        openrecall.database._writer._next_ids.clear()
+        opened = []
+        connect = openrecall.database._connect
+
+        def record(shard):
+            opened.append(shard.name)
+            return connect(shard)
+
+        with patch('openrecall.database._connect', side_effect=record):
+            self.assertEqual(self.insert("feb", FEB), jan + 1)
+            self.assertNotIn("2024-01", opened)
+            opened.clear()
+            self.assertEqual(self.insert("feb later", FEB + 1), jan + 2)
+        self.assertEqual(opened, ["2024-02"])
+
+        # An id taken by another client makes the writer read the sequences again
+        with sqlite3.connect(get_shards(after=FEB)[0].path) as other:
+            other.execute(
+                "INSERT INTO entries (text, timestamp, embedding, app, title) VALUES ('x', ?, x'', 'A', 'T')",
+                (FEB + 2,),
+            )
+        other.close()
+        self.assertEqual(self.insert("feb last", FEB + 3), jan + 4)
+
+    def test_expired_shard_is_dropped_whole(self):
+        """Test deleting past a month's end removes its shard file."""
+        self.insert("jan", JAN)
+        self.insert("jan", JAN + 1)
+        self.insert("feb", FEB)
+        self.assertEqual(sorted(delete_entries_before(FEB, 1)), [f"{JAN}_0.webp", f"{JAN + 1}_0.webp"])
+        self.assertEqual(self.shard_files(), ["2024-02.db"])
+        self.assertEqual([shard.name for shard in get_shards()], ["2024-02"])
+        self.assertEqual(get_timestamps(), [FEB])
+
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,105 @@
+import numpy as np
+import pytest
+from openrecall.embedding_store import HEADER_SIZE, EmbeddingStore
+
+
+def make_store(tmp_path, dim=3, model_name="test-model"):
+    return EmbeddingStore(str(tmp_path / "embeddings.f32"), dim, model_name)
+
+
+def test_new_store_is_empty(tmp_path):
+    store = make_store(tmp_path)
+    assert len(store) == 0
+    assert store.last_id == 0
+    ids, scores = store.search(np.array([1.0, 0.0, 0.0]), k=5)
+    assert len(ids) == 0
+
+
+def test_written_records_invisible_until_commit(tmp_path):
+    store = make_store(tmp_path)
+    store.write(np.array([1]), np.array([1.0, 0.0, 0.0]))
+    assert len(store) == 0
+    store.commit()
+    assert len(store) == 1
+    assert store.last_id == 1
+
+
+def test_rollback_discards_pending_records(tmp_path):
+    store = make_store(tmp_path)
+    store.write(np.array([1]), np.array([1.0, 0.0, 0.0]))
+    store.commit()
+    store.write(np.array([2]), np.array([0.0, 1.0, 0.0]))
+    store.rollback()
+    assert len(store) == 1
+    store.close()
+    assert len(make_store(tmp_path)) == 1
+
+
+def test_search_reads_normalized_vectors(tmp_path):
+    store = make_store(tmp_path)
+    store.write(np.array([1, 2, 3]), np.array([[0.0, 2.0, 0.0], [5.0, 0.0, 0.0], [1.0, 1.0, 0.0]]))
+    store.commit()
+    ids, scores = store.search(np.array([1.0, 0.0, 0.0]), k=2)
+    assert ids.tolist() == [2, 3]
+    assert scores[0] == pytest.approx(1.0)
+    _, vectors = store.arrays()
+    assert isinstance(vectors.base, np.memmap) or isinstance(vectors, np.memmap)
+    np.testing.assert_allclose(np.linalg.norm(vectors, axis=1), 1.0, rtol=1e-6)
+
+
+def test_search_subset_scores_only_candidates(tmp_path):
+    store = make_store(tmp_path)
+    store.write(np.array([1, 2, 3, 5]), np.array([[1.0, 0, 0], [0.9, 0.1, 0], [0, 1.0, 0], [0.5, 0.5, 0]]))
+    store.commit()
+    ids, scores = store.search_subset(np.array([1.0, 0.0, 0.0]), np.array([5, 3, 4, 9]), k=5)
+    assert ids.tolist() == [5, 3]
+    assert scores[0] > scores[1]
+    ids, _ = store.search_subset(np.array([1.0, 0.0, 0.0]), np.array([], dtype=np.int64), k=5)
+    assert len(ids) == 0
+
+
+def test_reopen_persists_records(tmp_path):
+    store = make_store(tmp_path)
+    store.write(np.array([4, 9]), np.eye(3)[:2])
+    store.commit()
+    store.close()
+
+    reopened = make_store(tmp_path)
+    ids, vectors = reopened.arrays()
+    assert ids.tolist() == [4, 9]
+    np.testing.assert_allclose(vectors, np.eye(3)[:2])
+
+
+def test_reopen_drops_partial_trailing_record(tmp_path):
+    store = make_store(tmp_path)
+    store.write(np.array([1]), np.eye(3)[:1])
+    store.commit()
+    store.close()
+    with open(tmp_path / "embeddings.f32", "ab") as f:
+        f.write(b"\x01\x02\x03")
+
+    reopened = make_store(tmp_path)
+    assert len(reopened) == 1
+    assert (tmp_path / "embeddings.f32").stat().st_size == HEADER_SIZE + reopened.record_dtype.itemsize
+
+
+def test_truncate_after(tmp_path):
+    store = make_store(tmp_path)
+    store.write(np.array([1, 2, 3]), np.eye(3))
+    store.commit()
+    store.truncate_after(2)
+    assert store.arrays()[0].tolist() == [1, 2]
+
+
+def test_header_mismatch_raises(tmp_path):
+    make_store(tmp_path).close()
+    with pytest.raises(ValueError):
+        make_store(tmp_path, dim=4)
+    with pytest.raises(ValueError):
+        make_store(tmp_path, model_name="other-model")
+
+
+def test_write_wrong_dimension_raises(tmp_path):
+    store = make_store(tmp_path)
+    with pytest.raises(ValueError):
+        store.write(np.array([1]), np.zeros(4))
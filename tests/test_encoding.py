@@ -0,0 +1,52 @@
+import os
+
+import numpy as np
+import pytest
+
+from openrecall.encoding import derived_filename, encode_frame, load_frame, submit_encoding
+
+
+def frame(width=2000, height=1000):
+    rng = np.random.default_rng(0)
+    return rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+
+
+def test_derived_filenames():
+    assert derived_filename("100_0.png", "thumbnail") == os.path.join("thumbnails", "100_0.webp")
+    assert derived_filename("100_0.webp", "preview") == os.path.join("previews", "100_0.webp")
+
+
+@pytest.mark.parametrize(
+    "image_format, extension", [("webp-lossless", ".webp"), ("webp", ".webp"), ("png", ".png")]
+)
+def test_frame_is_saved_with_preview_and_thumbnail(tmp_path, image_format, extension):
+    Image = pytest.importorskip("PIL.Image")
+
+    filename = encode_frame(frame(), str(tmp_path), "100_0", image_format=image_format, quality=50, method=0)
+
+    assert filename == "100_0" + extension
+    with Image.open(tmp_path / filename) as image:
+        assert image.size == (2000, 1000)
+    with Image.open(tmp_path / "previews" / "100_0.webp") as image:
+        assert image.size == (1280, 640)
+    with Image.open(tmp_path / "thumbnails" / "100_0.webp") as image:
+        assert image.size == (320, 160)
+
+
+def test_lossless_frames_round_trip(tmp_path):
+    Image = pytest.importorskip("PIL.Image")
+    pixels = frame(64, 32)
+
+    filename = submit_encoding(0, encode_frame, pixels, str(tmp_path), "1_0").result()
+
+    np.testing.assert_array_equal(load_frame(str(tmp_path), filename), pixels)
+    assert load_frame(str(tmp_path), "2_0.webp") is None
+    with Image.open(tmp_path / "thumbnails" / "1_0.webp") as image:
+        assert image.size == (64, 32)
+
+
+def test_unknown_format_is_an_error(tmp_path):
+    pytest.importorskip("PIL.Image")
+    future = submit_encoding(0, encode_frame, frame(8, 8), str(tmp_path), "1_0", image_format="gif")
+    with pytest.raises(ValueError):
+        future.result()
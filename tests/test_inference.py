@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+
+from openrecall.inference import (
+    load_ocr_predictor,
+    load_sentence_transformer,
+    quantize_dynamic_int8,
+)
+from openrecall.nlp import MODEL_NAME
+
+SAMPLE_LINES = [
+    "File Edit View Selection Go Run Terminal Help",
+    "def get_embedding(text: str) -> np.ndarray:",
+    "Inbox (3) - Quarterly planning meeting moved to Thursday",
+    "Search results for cheap flights to Lisbon in October",
+]
+
+
+def test_unknown_backend_rejected():
+    with pytest.raises(ValueError):
+        load_sentence_transformer(MODEL_NAME, "tensorrt")
+    with pytest.raises(ValueError):
+        load_ocr_predictor("tensorrt")
+
+
+def test_quantize_dynamic_int8_matches_float_model():
+    torch = pytest.importorskip("torch")
+    torch.manual_seed(0)
+    model = torch.nn.Sequential(
+        torch.nn.Linear(64, 128), torch.nn.ReLU(), torch.nn.Linear(128, 32)
+    )
+    inputs = torch.randn(16, 64)
+    expected = model(inputs)
+
+    quantized = quantize_dynamic_int8(model, {torch.nn.Linear})
+    actual = quantized(inputs)
+
+    assert isinstance(quantized[0], torch.nn.quantized.dynamic.Linear)
+    cosine = torch.nn.functional.cosine_similarity(expected, actual, dim=1)
+    assert cosine.min().item() > 0.99
+
+
+def test_int8_sentence_embeddings_match_eager():
+    pytest.importorskip("sentence_transformers")
+    try:
+        eager = load_sentence_transformer(MODEL_NAME, "eager")
+    except OSError:
+        pytest.skip(f"{MODEL_NAME} is not available in the local model cache")
+    int8 = load_sentence_transformer(MODEL_NAME, "int8")
+
+    expected = eager.encode(SAMPLE_LINES, normalize_embeddings=True)
+    actual = int8.encode(SAMPLE_LINES, normalize_embeddings=True)
+
+    assert actual.shape == expected.shape
+    assert np.min(np.sum(expected * actual, axis=1)) > 0.98
+    # Quantization must not change each line's nearest neighbour
+    expected_sim = expected @ expected.T - 2 * np.eye(len(SAMPLE_LINES))
+    actual_sim = actual @ actual.T - 2 * np.eye(len(SAMPLE_LINES))
+    assert np.array_equal(expected_sim.argmax(axis=1), actual_sim.argmax(axis=1))
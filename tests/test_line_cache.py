@@ -0,0 +1,56 @@
+import numpy as np
+from openrecall.line_cache import LineEmbeddingCache, line_key
+
+
+def test_line_key_is_content_based():
+    assert line_key("File Edit View") == line_key("File Edit View")
+    assert line_key("File Edit View") != line_key("File Edit View ")
+
+
+def test_line_key_depends_on_model():
+    line = "File Edit View"
+    assert line_key(line, "all-MiniLM-L6-v2/eager") != line_key(line, "all-MiniLM-L6-v2/int8")
+    assert line_key(line, "all-MiniLM-L6-v2/int8") == line_key(line, "all-MiniLM-L6-v2/int8")
+
+
+def test_hits_and_misses_are_counted():
+    cache = LineEmbeddingCache(max_entries=10)
+    a, b = line_key("a"), line_key("b")
+    assert cache.get_many([a, b]) == {}
+    cache.put_many({a: np.ones(3, dtype=np.float32)}, encode_seconds=0.5)
+    found = cache.get_many([a, b, a])
+    assert list(found) == [a]
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 3
+    assert stats["hit_rate"] == 0.25
+    assert stats["seconds_saved"] > 0
+
+
+def test_least_recently_used_line_is_evicted():
+    cache = LineEmbeddingCache(max_entries=2)
+    keys = [line_key(str(i)) for i in range(3)]
+    cache.put_many({keys[0]: np.zeros(3), keys[1]: np.zeros(3)})
+    cache.get_many([keys[0]])
+    cache.put_many({keys[2]: np.zeros(3)})
+    assert len(cache) == 2
+    assert set(cache.get_many(keys)) == {keys[0], keys[2]}
+
+
+def test_evicted_lines_are_spilled_and_promoted(tmp_path):
+    cache = LineEmbeddingCache(max_entries=1, spill_path=str(tmp_path / "lines.db"))
+    first, second = line_key("first"), line_key("second")
+    cache.put_many({first: np.array([1.0, 2.0], dtype=np.float32)})
+    cache.put_many({second: np.array([3.0, 4.0], dtype=np.float32)})
+
+    found = cache.get_many([first])
+    np.testing.assert_array_equal(found[first], [1.0, 2.0])
+    assert cache.stats()["hits"] == 1
+
+
+def test_spill_is_bounded(tmp_path):
+    cache = LineEmbeddingCache(max_entries=1, spill_path=str(tmp_path / "lines.db"), max_spill_entries=3)
+    for i in range(10):
+        cache.put_many({line_key(str(i)): np.zeros(2, dtype=np.float32)})
+    count = cache._spill.execute("SELECT COUNT(*) FROM line_embeddings").fetchone()[0]
+    assert count <= 3
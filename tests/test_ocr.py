@@ -0,0 +1,100 @@
+from types import SimpleNamespace
+from unittest import mock
+
+import numpy as np
+import pytest
+
+from openrecall.ocr import DirtyRegionOCR, words_to_text
+
+
+class FakeOCR:
+    """Recognizes each solid rectangle of gray level v as the word 'w<v>'."""
+
+    def __init__(self):
+        self.shapes = []
+
+    def __call__(self, images):
+        pages = []
+        for image in images:
+            self.shapes.append(image.shape[:2])
+            height, width = image.shape[:2]
+            words = []
+            for value in np.unique(image[..., 0]):
+                if value == 255:
+                    continue
+                ys, xs = np.nonzero(image[..., 0] == value)
+                geometry = (
+                    (xs.min() / width, ys.min() / height),
+                    ((xs.max() + 1) / width, (ys.max() + 1) / height),
+                )
+                words.append(SimpleNamespace(value=f"w{value}", geometry=geometry))
+            line = SimpleNamespace(words=words)
+            pages.append(SimpleNamespace(blocks=[SimpleNamespace(lines=[line])]))
+        return SimpleNamespace(pages=pages)
+
+
+def screen(*words):
+    image = np.full((256, 512, 3), 255, dtype=np.uint8)
+    for value, (left, top) in words:
+        image[top : top + 16, left : left + 48] = value
+    return image
+
+
+@pytest.fixture
+def fake_ocr():
+    fake = FakeOCR()
+    with mock.patch("openrecall.ocr.get_ocr", return_value=fake):
+        yield fake
+
+
+def test_words_are_laid_out_in_lines():
+    words = [(60, 12, 90, 28, "b"), (0, 10, 50, 26, "a"), (0, 40, 50, 56, "c")]
+    assert words_to_text(words) == "a b \nc \n"
+
+
+def test_only_changed_regions_are_recognized(fake_ocr):
+    ocr = DirtyRegionOCR()
+    first = screen((10, (20, 20)), (20, (300, 20)), (30, (20, 200)))
+    assert ocr.extract_text(0, first) == "w10 w20 \nw30 \n"
+    assert fake_ocr.shapes == [(256, 512)]
+
+    second = screen((10, (20, 20)), (20, (300, 20)), (40, (20, 200)))
+    assert ocr.extract_text(0, second) == "w10 w20 \nw40 \n"
+    assert len(fake_ocr.shapes) == 2
+    height, width = fake_ocr.shapes[1]
+    assert height * width < 256 * 512 / 4
+    assert ocr.recognized_fraction < 0.6
+
+
+def test_unchanged_frame_is_not_recognized_again(fake_ocr):
+    ocr = DirtyRegionOCR()
+    frame = screen((10, (20, 20)))
+    ocr.extract_text(0, frame)
+    assert ocr.extract_text(0, frame.copy()) == "w10 \n"
+    assert len(fake_ocr.shapes) == 1
+
+
+def test_crops_are_grown_to_whole_words(fake_ocr):
+    ocr = DirtyRegionOCR(pad_tiles=0)
+    ocr.extract_text(0, screen((10, (20, 20))))
+    changed = screen((10, (20, 20)))
+    changed[20:36, 60:68] = 50  # overwrite the end of the word
+    text = ocr.extract_text(0, changed)
+    assert text == "w10 w50 \n"
+    assert fake_ocr.shapes[1][1] >= 48
+
+
+def test_large_changes_and_new_monitors_are_recognized_in_full(fake_ocr):
+    ocr = DirtyRegionOCR()
+    ocr.extract_text(0, screen((10, (20, 20))))
+    ocr.extract_text(1, screen((10, (20, 20))))
+    ocr.extract_text(0, np.zeros((256, 512, 3), dtype=np.uint8))
+    assert fake_ocr.shapes == [(256, 512)] * 3
+
+
+def test_stats_report_the_recognized_fraction(fake_ocr):
+    ocr = DirtyRegionOCR()
+    frame = screen((10, (20, 20)))
+    ocr.extract_text(0, frame)
+    ocr.extract_text(0, frame)
+    assert ocr.stats() == {"full_passes": 1, "region_passes": 0, "recognized_fraction": 0.5}
@@ -0,0 +1,123 @@
+import os
+
+import numpy as np
+import pytest
+
+from openrecall.encoding import encode_frame, encode_frame_files, load_frame
+from openrecall.packs import PACK_DIR, PackStore, get_pack_store, migrate_directory
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = PackStore(str(tmp_path / PACK_DIR))
+    yield store
+    store.close()
+
+
+def test_files_and_byte_ranges_are_read_back(store):
+    store.put_many({"1_0.webp": b"first", os.path.join("thumbnails", "1_0.webp"): b"thumb"})
+    store.put("2_0.webp", b"second")
+
+    assert store.read("1_0.webp") == b"first"
+    assert store.read("thumbnails/1_0.webp") == b"thumb"
+    assert store.read("2_0.webp", 1, 4) == b"eco"
+    assert store.read("2_0.webp", 3, 100) == b"ond"
+    assert store.read("3_0.webp") is None
+    assert "2_0.webp" in store and "3_0.webp" not in store
+    assert store.locate("2_0.webp") == (1, 10, 6)
+
+
+def test_replaced_files_point_at_their_new_bytes(store):
+    store.put("1_0.webp", b"old")
+    store.put("1_0.webp", b"new bytes")
+
+    assert store.read("1_0.webp") == b"new bytes"
+    assert store.stats() == {"packs": 1, "files": 1, "live_bytes": 9, "pack_bytes": 12}
+
+
+def test_packs_roll_over_and_are_deleted_once_empty(tmp_path):
+    store = PackStore(str(tmp_path), pack_size=10)
+    store.put("1_0.webp", b"0123456789")
+    store.put("2_0.webp", b"abc")
+    assert store.packs() == [1, 2]
+    assert store.read("1_0.webp") == b"0123456789"
+
+    assert store.delete(["1_0.webp", "9_0.webp"]) == 1
+    assert store.packs() == [2]
+    assert store.delete(["2_0.webp"]) == 1
+    # The pack being appended to is kept
+    assert store.packs() == [2]
+    store.close()
+
+
+def test_index_survives_a_restart(tmp_path):
+    store = PackStore(str(tmp_path), pack_size=4)
+    store.put("1_0.webp", b"first")
+    store.close()
+
+    reopened = PackStore(str(tmp_path), pack_size=4)
+    reopened.put("2_0.webp", b"second")
+    assert reopened.read("1_0.webp") == b"first"
+    assert reopened.read("2_0.webp") == b"second"
+    assert reopened.packs() == [1, 2]
+    reopened.close()
+
+
+def test_reads_see_files_appended_after_the_pack_was_mapped(store):
+    store.put("1_0.webp", b"first")
+    assert store.read("1_0.webp") == b"first"
+    store.put("2_0.webp", b"second")
+    assert store.read("2_0.webp") == b"second"
+
+
+def test_packed_frames_load_like_files(tmp_path):
+    pytest.importorskip("PIL.Image")
+    pixels = np.random.default_rng(0).integers(0, 256, (32, 64, 3), dtype=np.uint8)
+    filename, files = encode_frame_files(pixels, "1_0")
+
+    get_pack_store(str(tmp_path)).put_many(files)
+
+    assert sorted(files) == [
+        "1_0.webp",
+        os.path.join("previews", "1_0.webp"),
+        os.path.join("thumbnails", "1_0.webp"),
+    ]
+    assert os.listdir(tmp_path) == [PACK_DIR]
+    np.testing.assert_array_equal(load_frame(str(tmp_path), filename), pixels)
+    assert load_frame(str(tmp_path), "2_0.webp") is None
+
+
+def test_frames_without_packs_do_not_create_a_store(tmp_path):
+    assert load_frame(str(tmp_path), "1_0.webp") is None
+    assert get_pack_store(str(tmp_path), create=False) is None
+    assert not os.path.exists(tmp_path / PACK_DIR)
+
+
+def test_migration_moves_files_into_packs(tmp_path, store):
+    pytest.importorskip("PIL.Image")
+    pixels = np.zeros((16, 16, 3), dtype=np.uint8)
+    encode_frame(pixels, str(tmp_path), "1_0")
+    encode_frame(pixels, str(tmp_path), "2_0", image_format="png")
+    (tmp_path / "1_0.webp.tmp").write_bytes(b"partial")
+    expected = {
+        name: (tmp_path / name).read_bytes()
+        for name in ("1_0.webp", "2_0.png", os.path.join("previews", "2_0.webp"))
+    }
+
+    files, size = migrate_directory(str(tmp_path), store)
+
+    assert files == 6
+    assert size == sum(os.path.getsize(store.pack_path(pack)) for pack in store.packs())
+    for name, data in expected.items():
+        assert store.read(name) == data
+    assert sorted(os.listdir(tmp_path)) == ["1_0.webp.tmp", PACK_DIR, "previews", "thumbnails"]
+    assert os.listdir(tmp_path / "previews") == []
+    # Running it again finds nothing left to move
+    assert migrate_directory(str(tmp_path), store) == (0, 0)
+
+
+def test_migration_can_keep_the_files(tmp_path, store):
+    (tmp_path / "1_0.webp").write_bytes(b"frame")
+
+    assert migrate_directory(str(tmp_path), store, keep_files=True) == (1, 5)
+    assert (tmp_path / "1_0.webp").read_bytes() == store.read("1_0.webp")
@@ -0,0 +1,118 @@
+import threading
+import time
+
+import pytest
+
+from openrecall.pipeline import BoundedQueue, Pipeline, Stage
+
+
+def wait_until(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.005)
+
+
+def test_items_flow_through_stages_in_order():
+    results = []
+    pipeline = Pipeline(
+        [
+            Stage("double", lambda x: x * 2),
+            Stage("odd_only", lambda x: x if x % 4 else None),
+            Stage("collect", results.append),
+        ]
+    ).start()
+    for i in range(10):
+        pipeline.submit(i)
+
+    assert pipeline.drain(timeout=2)
+    assert results == [2, 6, 10, 14, 18]
+    assert pipeline.stats()["odd_only"]["processed"] == 10
+
+
+def test_keyed_stage_keeps_order_per_key():
+    seen = {0: [], 1: [], 2: []}
+
+    def record(item):
+        key, i = item
+        time.sleep(0.001)
+        seen[key].append(i)
+
+    pipeline = Pipeline([Stage("keyed", record, workers=3, key=lambda item: item[0])]).start()
+    for i in range(30):
+        pipeline.submit((i % 3, i))
+
+    assert pipeline.drain(timeout=2)
+    assert seen == {key: list(range(key, 30, 3)) for key in seen}
+
+
+@pytest.mark.parametrize(
+    "overflow, expected, discarded",
+    [
+        ("coalesce", ["busy", (1, "a"), (0, "new")], [(0, "old")]),
+        ("drop", ["busy", (0, "old"), (1, "a")], [(0, "new")]),
+    ],
+)
+def test_overflow_policies(overflow, expected, discarded):
+    release = threading.Event()
+    processed, dropped = [], []
+
+    def slow(item):
+        release.wait()
+        processed.append(item)
+
+    stage = Stage(
+        "slow",
+        slow,
+        maxsize=2,
+        overflow=overflow,
+        key=lambda item: 0 if item == "busy" else item[0],
+        on_discard=dropped.append,
+    )
+    pipeline = Pipeline([stage]).start()
+    pipeline.submit("busy")
+    wait_until(lambda: stage.stats()["queue_depth"] == 0)
+    pipeline.submit((0, "old"))
+    pipeline.submit((1, "a"))
+    assert stage.stats()["queue_depth"] == 2
+    pipeline.submit((0, "new"))
+    release.set()
+
+    assert pipeline.drain(timeout=2)
+    assert processed == expected
+    assert dropped == discarded
+    assert stage.stats()["discarded"] == 1
+
+
+def test_block_policy_applies_backpressure():
+    release = threading.Event()
+    stage = Stage("slow", lambda item: release.wait(), maxsize=1, overflow="block")
+    pipeline = Pipeline([stage]).start()
+    pipeline.submit(1)
+    wait_until(lambda: stage.stats()["queue_depth"] == 0)
+    pipeline.submit(2)
+
+    producer = threading.Thread(target=pipeline.submit, args=(3,))
+    producer.start()
+    producer.join(timeout=0.05)
+    assert producer.is_alive()
+    release.set()
+    producer.join(timeout=2)
+    assert pipeline.drain(timeout=2)
+    assert stage.stats()["processed"] == 3
+
+
+def test_errors_are_counted_and_workers_survive():
+    results = []
+    pipeline = Pipeline([Stage("invert", lambda x: 1 / x), Stage("collect", results.append)]).start()
+    for x in (1, 0, 2):
+        pipeline.submit(x)
+
+    assert pipeline.drain(timeout=2)
+    assert results == [1.0, 0.5]
+    assert pipeline.stats()["invert"]["errors"] == 1
+
+
+def test_unknown_overflow_policy_rejected():
+    with pytest.raises(ValueError):
+        BoundedQueue(overflow="spill")
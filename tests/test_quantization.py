@@ -0,0 +1,101 @@
+import numpy as np
+import pytest
+from openrecall.embedding_store import EmbeddingStore
+from openrecall.quantization import QuantizedIndex, dequantize, measure_recall, quantize
+from openrecall.vector_index import normalize
+
+
+@pytest.fixture
+def store(tmp_path):
+    rng = np.random.default_rng(0)
+    topics = rng.normal(size=(30, 32))
+    vectors = topics[rng.integers(0, 30, 3000)] + rng.normal(scale=0.4, size=(3000, 32))
+    store = EmbeddingStore(str(tmp_path / "embeddings.f32"), 32, "test-model")
+    store.write(np.arange(1, 3001), vectors)
+    store.commit()
+    yield store
+    store.close()
+
+
+@pytest.mark.parametrize("mode", ["int8", "float16"])
+def test_quantize_round_trip_error_is_small(mode):
+    vectors = normalize(np.random.default_rng(1).normal(size=(100, 384)))
+    codes, scales = quantize(vectors, mode)
+    assert codes.dtype == (np.int8 if mode == "int8" else np.float16)
+    np.testing.assert_allclose(dequantize(codes, scales), vectors, atol=5e-3)
+
+
+def test_quantize_zero_vector():
+    codes, scales = quantize(np.zeros((1, 4)), "int8")
+    assert not codes.any()
+    assert np.isfinite(scales).all()
+
+
+def test_quantize_unknown_mode_raises():
+    with pytest.raises(ValueError):
+        quantize(np.zeros((1, 4)), "int4")
+
+
+@pytest.mark.parametrize("mode", ["int8", "float16"])
+def test_search_returns_exact_scores(store, mode):
+    index = QuantizedIndex(store, mode)
+    index.sync()
+    assert len(index) == 3000
+
+    query = store.arrays()[1][42]
+    ids, scores = index.search(query, k=5)
+    exact_ids, exact_scores = store.search(query, k=5)
+    assert ids.tolist() == exact_ids.tolist()
+    np.testing.assert_allclose(scores, exact_scores, rtol=1e-5)
+
+
+def test_codes_use_less_memory(store):
+    index = QuantizedIndex(store, "int8")
+    index.sync()
+    assert index.nbytes < len(store) * store.dim * 4 / 2
+
+
+def test_sync_picks_up_new_records(store):
+    index = QuantizedIndex(store, "int8")
+    index.sync()
+    store.write(np.array([5000]), np.ones(32))
+    store.commit()
+    index.add(5000, np.ones(32))
+    assert len(index) == 3001
+    assert index.search(np.ones(32), k=1)[0].tolist() == [5000]
+
+
+def test_load_codes_ignores_misaligned_codes(store):
+    index = QuantizedIndex(store, "int8")
+    codes, scales = quantize(np.ones((2, 32)), "int8")
+    index.load_codes(np.array([7, 8]), codes, scales)
+    assert len(index) == 0
+
+
+def test_load_codes_keeps_rows_of_expired_entries(store):
+    ids, vectors = store.arrays()
+    codes, scales = quantize(vectors[:100], "int8")
+    live = np.ones(100, dtype=bool)
+    live[[3, 50]] = False
+    index = QuantizedIndex(store, "int8")
+    index.load_codes(ids[:100][live], codes[live], scales[live], live_ids=ids[:100][live])
+    assert len(index) == 100
+    index.sync()
+    assert len(index) == 3000
+    assert ids[3] not in index.search(vectors[3], k=5)[0]
+
+
+def test_load_codes_rejects_missing_codes_of_live_entries(store):
+    ids, vectors = store.arrays()
+    codes, scales = quantize(vectors[:100], "int8")
+    index = QuantizedIndex(store, "int8")
+    index.load_codes(ids[1:100], codes[1:], scales[1:], live_ids=ids[:100])
+    assert len(index) == 0
+
+
+def test_measure_recall(store):
+    index = QuantizedIndex(store, "int8")
+    index.sync()
+    report = measure_recall(index, n_queries=50)
+    assert report["rescored_recall"] >= 0.95
+    assert report["rescored_recall"] >= report["first_pass_recall"]
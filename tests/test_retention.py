@@ -0,0 +1,185 @@
+import io
+import os
+from unittest import mock
+
+import numpy as np
+import pytest
+
+from openrecall import config
+from openrecall.database import (
+    TIER_LOSSY,
+    TIER_TEXT_ONLY,
+    close_connections,
+    create_db,
+    get_connection,
+    get_timestamps,
+    insert_entry,
+)
+from openrecall.packs import PACK_DIR, get_pack_store
+from openrecall.retention import DAY_SECONDS, Compactor, compaction_enabled
+from openrecall.segments import SegmentWriter, read_frame
+
+NOW = 1_000 * DAY_SECONDS
+
+
+@pytest.fixture
+def storage(tmp_path):
+    screenshots = tmp_path / "screenshots"
+    screenshots.mkdir()
+    args = config.parser.parse_args(
+        ["--keep-lossless-days", "7", "--keep-images-days", "90", "--retention-days", "365"]
+    )
+    with mock.patch.object(config, "db_path", str(tmp_path / "recall.db")), \
+            mock.patch.object(config, "screenshots_path", str(screenshots)), \
+            mock.patch.object(config, "args", args):
+        create_db()
+        yield screenshots
+        close_connections()
+
+
+def add_frame(screenshots, age_days, image=b"frame"):
+    timestamp = NOW - age_days * DAY_SECONDS
+    filename = f"{timestamp}_0.webp"
+    (screenshots / filename).write_bytes(image)
+    insert_entry("text", timestamp, np.ones(3, dtype=np.float32), "App", "Title", filename=filename)
+    return timestamp, filename
+
+
+def tiers():
+    return dict(get_connection().execute("SELECT timestamp, storage_tier FROM entries").fetchall())
+
+
+def test_old_frames_are_stripped_and_expired(storage):
+    expired, expired_file = add_frame(storage, 400)
+    old, old_file = add_frame(storage, 100)
+    recent, recent_file = add_frame(storage, 1)
+
+    assert Compactor(batch_size=1).run_slice(budget_seconds=10, now=NOW)
+
+    assert get_timestamps() == [recent, old]
+    assert tiers() == {old: TIER_TEXT_ONLY, recent: 0}
+    assert sorted(os.listdir(storage)) == [recent_file]
+
+
+def test_stripping_removes_preview_and_thumbnail(storage):
+    _, filename = add_frame(storage, 100)
+    for directory in ("previews", "thumbnails"):
+        (storage / directory).mkdir()
+        (storage / directory / filename).write_bytes(b"small")
+
+    assert Compactor().run_slice(budget_seconds=10, now=NOW)
+
+    assert [os.listdir(storage / d) for d in ("previews", "thumbnails")] == [[], []]
+
+
+def test_segment_frames_stay_until_their_hour_expires(storage):
+    pytest.importorskip("PIL.Image")
+    writer = SegmentWriter(str(storage))
+    pixels = np.zeros((32, 32, 3), dtype=np.uint8)
+    for age_days in (100, 10):
+        timestamp = NOW - age_days * DAY_SECONDS
+        filename = writer.append(0, timestamp, pixels)
+        insert_entry("text", timestamp, np.ones(3, dtype=np.float32), "App", "Title", filename=filename)
+
+    assert Compactor().run_slice(budget_seconds=10, now=NOW)
+
+    old, recent = NOW - 100 * DAY_SECONDS, NOW - 10 * DAY_SECONDS
+    assert tiers() == {old: TIER_TEXT_ONLY, recent: TIER_LOSSY}
+    assert read_frame(str(storage), 0, old) is None
+    np.testing.assert_array_equal(read_frame(str(storage), 0, recent), pixels)
+
+
+def test_missing_image_drops_to_text_only(storage):
+    timestamp, filename = add_frame(storage, 10)
+    os.remove(storage / filename)
+
+    assert Compactor().run_slice(budget_seconds=10, now=NOW)
+
+    assert tiers() == {timestamp: TIER_TEXT_ONLY}
+
+
+def test_tiers_are_disabled_by_default(storage):
+    timestamp, filename = add_frame(storage, 400)
+    args = config.parser.parse_args(["--text-compression", "none"])
+
+    with mock.patch.object(config, "args", args):
+        assert not compaction_enabled()
+        assert Compactor().run_slice(budget_seconds=10, now=NOW)
+
+    assert tiers() == {timestamp: 0}
+    assert os.listdir(storage) == [filename]
+
+
+def test_slice_stops_when_budget_is_spent(storage):
+    add_frame(storage, 100)
+
+    compactor = Compactor()
+    assert not compactor.run_slice(budget_seconds=0, now=NOW)
+    assert compactor.stripped == 0
+
+
+def test_lossless_frames_are_recompressed(storage):
+    Image = pytest.importorskip("PIL.Image")
+    timestamp, filename = add_frame(storage, 10, image=b"")
+    Image.new("RGB", (2560, 1440), "white").save(storage / filename, format="webp", lossless=True)
+
+    assert Compactor().run_slice(budget_seconds=10, now=NOW)
+
+    assert tiers() == {timestamp: TIER_LOSSY}
+    width, height = get_connection().execute("SELECT width, height FROM entries").fetchone()
+    assert (width, height) == (1280, 720)
+    with Image.open(storage / filename) as image:
+        assert image.size == (1280, 720)
+
+
+def test_png_frames_are_recompressed_to_webp(storage):
+    Image = pytest.importorskip("PIL.Image")
+    timestamp, filename = add_frame(storage, 10, image=b"")
+    os.remove(storage / filename)
+    png = filename.replace(".webp", ".png")
+    Image.new("RGB", (640, 360), "white").save(storage / png, format="png")
+    with get_connection() as conn:
+        conn.execute("UPDATE entries SET filename = ?", (png,))
+
+    assert Compactor().run_slice(budget_seconds=10, now=NOW)
+
+    assert get_connection().execute("SELECT filename FROM entries").fetchone()[0] == filename
+    assert os.listdir(storage) == [filename]
+
+
+def test_packed_frames_are_recompressed_and_stripped(storage):
+    Image = pytest.importorskip("PIL.Image")
+    store = get_pack_store(str(storage))
+    png = io.BytesIO()
+    Image.new("RGB", (2560, 1440), "white").save(png, format="png")
+    lossy, lossy_file = add_frame(storage, 10, image=b"")
+    old, old_file = add_frame(storage, 100, image=b"")
+    for filename in (lossy_file, old_file):
+        os.remove(storage / filename)
+    png_file = lossy_file.replace(".webp", ".png")
+    store.put_many({png_file: png.getvalue(), old_file: b"frame"})
+    with get_connection() as conn:
+        conn.execute("UPDATE entries SET filename = ? WHERE timestamp = ?", (png_file, lossy))
+
+    assert Compactor().run_slice(budget_seconds=10, now=NOW)
+
+    assert tiers() == {lossy: TIER_LOSSY, old: TIER_TEXT_ONLY}
+    filenames = dict(get_connection().execute("SELECT timestamp, filename FROM entries").fetchall())
+    assert filenames[lossy] == lossy_file
+    with Image.open(io.BytesIO(store.read(lossy_file))) as image:
+        assert image.size == (1280, 720)
+    assert store.stats()["files"] == 1
+    assert os.listdir(storage) == [PACK_DIR]
+
+
+def test_text_is_compressed_once_there_is_enough_history(storage):
+    for day in range(5):
+        add_frame(storage, day)
+
+    with mock.patch("openrecall.retention.DICTIONARY_MIN_ENTRIES", 5):
+        compactor = Compactor(batch_size=2)
+        assert compactor.run_slice(budget_seconds=10, now=NOW)
+
+    assert compactor.text_compressed == 5
+    types = get_connection().execute("SELECT DISTINCT typeof(text) FROM entries").fetchall()
+    assert types == [("blob",)]
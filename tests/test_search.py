@@ -0,0 +1,140 @@
+import numpy as np
+from unittest import mock
+from datetime import datetime
+from openrecall.database import SearchFilters
+from openrecall.search import SearchCache, hybrid_search, parse_query, reciprocal_rank_fusion
+
+
+class FakeIndex:
+    def __init__(self, ids):
+        self.ids = np.array(ids)
+
+    def search(self, query, k):
+        return self.ids[:k], np.linspace(1, 0, len(self.ids))[:k]
+
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    fused = reciprocal_rank_fusion([[1, 2, 3], [3, 4, 1]])
+    assert fused[:2] == [1, 3]
+    assert set(fused) == {1, 2, 3, 4}
+
+
+def test_reciprocal_rank_fusion_single_ranking_keeps_order():
+    assert reciprocal_rank_fusion([[5, 9, 2]]) == [5, 9, 2]
+
+
+def test_hybrid_search_promotes_exact_keyword_hit():
+    index = FakeIndex([10, 11, 12, 13, 14])
+    with mock.patch("openrecall.search.keyword_search", return_value=[(14, -3.2), (11, -1.0)]):
+        ids = hybrid_search("TICKET-99", np.zeros(3), index, limit=3)
+    assert ids[0] == 11
+    assert 14 in ids
+    assert len(ids) == 3
+
+
+def test_hybrid_search_without_keyword_matches():
+    index = FakeIndex([3, 2, 1])
+    with mock.patch("openrecall.search.keyword_search", return_value=[]):
+        assert hybrid_search("anything", np.zeros(3), index, limit=2) == [3, 2]
+
+
+def test_parse_query_extracts_filters():
+    text, filters = parse_query('invoice app:Firefox title:"Q3 report" after:2024-05-01 before:1717200000 total')
+    assert text == "invoice total"
+    assert filters == SearchFilters(
+        app="Firefox",
+        title="Q3 report",
+        after=int(datetime(2024, 5, 1).timestamp()),
+        before=1717200000,
+    )
+
+
+def test_parse_query_monitor_filter():
+    assert parse_query("slides monitor:1") == ("slides", SearchFilters(monitor=1))
+    assert parse_query("monitor:left") == ("monitor:left", SearchFilters())
+
+
+def test_parse_query_keeps_unparseable_terms():
+    text, filters = parse_query("error after:yesterday http://host:8080")
+    assert text == "error after:yesterday http://host:8080"
+    assert filters == SearchFilters()
+
+
+class FakeStore:
+    def __init__(self):
+        self.candidates = None
+
+    def search_subset(self, query, candidate_ids, k):
+        self.candidates = candidate_ids
+        return candidate_ids[:k], np.ones(min(k, len(candidate_ids)))
+
+
+def test_hybrid_search_scores_only_filtered_candidates():
+    store = FakeStore()
+    index = mock.Mock()
+    with mock.patch("openrecall.search.filter_entry_ids", return_value=np.array([4, 7, 9])), \
+         mock.patch("openrecall.search.get_embedding_store", return_value=store), \
+         mock.patch("openrecall.search.keyword_search", return_value=[(9, -1.0)]) as keyword:
+        ids = hybrid_search("report", np.zeros(3), index, limit=2, filters=SearchFilters(app="Mail"))
+    index.search.assert_not_called()
+    assert store.candidates.tolist() == [4, 7, 9]
+    assert keyword.call_args[0][2] == SearchFilters(app="Mail")
+    assert ids[0] == 9
+    assert set(ids) <= {4, 7, 9}
+
+
+def test_hybrid_search_filters_without_text_lists_newest():
+    with mock.patch("openrecall.search.filter_entry_ids", return_value=np.array([4, 7, 9])):
+        assert hybrid_search("", np.zeros(3), None, limit=2, filters=SearchFilters(app="Mail")) == [9, 7]
+
+
+def test_search_cache_reuses_query_embeddings():
+    cache = SearchCache(max_queries=2)
+    calls = []
+
+    def embed(query):
+        calls.append(query)
+        return np.ones(3)
+
+    first = cache.embedding("error", embed)
+    second = cache.embedding("error", embed)
+    assert calls == ["error"]
+    assert first is second
+    assert not first.flags.writeable
+
+
+def test_search_cache_evicts_least_recent_query():
+    cache = SearchCache(max_queries=2)
+    calls = []
+    embed = lambda query: calls.append(query) or np.ones(3)
+    for query in ["a", "b", "a", "c", "a", "b"]:
+        cache.embedding(query, embed)
+    assert calls == ["a", "b", "c", "b"]
+
+
+def test_search_cache_results_invalidated_when_max_id_advances():
+    cache = SearchCache()
+    calls = []
+    compute = lambda: calls.append(1) or ([1, 2], False)
+    with mock.patch("openrecall.search.get_max_entry_id", return_value=10):
+        assert cache.results(("q", 1), compute) == ([1, 2], False)
+        cache.results(("q", 1), compute)
+        cache.results(("q", 2), compute)
+    assert len(calls) == 2
+    with mock.patch("openrecall.search.get_max_entry_id", return_value=11):
+        cache.results(("q", 1), compute)
+    assert len(calls) == 3
+    assert cache.stats()["result_hits"] == 1
+
+
+def test_search_cache_serves_stale_rankings_without_refresh():
+    cache = SearchCache()
+    calls = []
+    compute = lambda: calls.append(1) or (1, 2, 3)
+    with mock.patch("openrecall.search.get_max_entry_id", return_value=10):
+        cache.results(("q", None), compute)
+    with mock.patch("openrecall.search.get_max_entry_id", return_value=11):
+        assert cache.results(("q", None), compute, refresh=False) == (1, 2, 3)
+        assert len(calls) == 1
+        cache.results(("q", None), compute)
+    assert len(calls) == 2
@@ -0,0 +1,110 @@
+import os
+
+import numpy as np
+import pytest
+
+from openrecall.segments import (
+    DELTA,
+    KEYFRAME,
+    SegmentWriter,
+    apply_delta,
+    encode_delta,
+    is_segment_frame,
+    read_frame,
+    read_frame_by_name,
+    read_index,
+    remove_segments_before,
+    segment_path,
+)
+
+pytest.importorskip("PIL.Image")
+
+HOUR = 1_700_000_000 - 1_700_000_000 % 3600
+
+
+def frames(count, height=70, width=100):
+    """A screen where a small region changes each frame."""
+    rng = np.random.default_rng(0)
+    frame = rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+    result = []
+    for i in range(count):
+        frame = frame.copy()
+        frame[(i * 7) % height, (i * 13) % width] = rng.integers(0, 256, 3)
+        result.append(frame)
+    return result
+
+
+def test_delta_round_trip_including_edge_tiles():
+    previous, current = frames(2, height=70, width=100)
+    current = current.copy()
+    current[69, 99] = (1, 2, 3)
+
+    payload = encode_delta(previous, current, tile=32)
+
+    np.testing.assert_array_equal(apply_delta(previous.copy(), payload), current)
+
+
+def test_large_changes_are_not_deltas():
+    previous = np.zeros((64, 64, 3), dtype=np.uint8)
+    assert encode_delta(previous, previous + 1, tile=32) is None
+
+
+def test_frames_are_rebuilt_from_keyframes_and_deltas(tmp_path):
+    writer = SegmentWriter(str(tmp_path), keyframe_interval=4)
+    sequence = frames(10)
+    names = [writer.append(0, HOUR + i, frame) for i, frame in enumerate(sequence)]
+
+    assert all(is_segment_frame(name) for name in names)
+    index = read_index(segment_path(str(tmp_path), 0, HOUR))
+    assert index["kind"].tolist() == [KEYFRAME, DELTA, DELTA, DELTA] * 2 + [KEYFRAME, DELTA]
+    for i, frame in enumerate(sequence):
+        np.testing.assert_array_equal(read_frame(str(tmp_path), 0, HOUR + i), frame)
+    np.testing.assert_array_equal(read_frame_by_name(str(tmp_path), names[5]), sequence[5])
+    assert read_frame(str(tmp_path), 0, HOUR + 99) is None
+    assert read_frame(str(tmp_path), 1, HOUR) is None
+
+
+def test_new_hour_and_resolution_start_with_a_keyframe(tmp_path):
+    writer = SegmentWriter(str(tmp_path))
+    small, = frames(1, height=40, width=40)
+    writer.append(0, HOUR, small)
+    writer.append(0, HOUR + 3600, small)
+    writer.append(0, HOUR + 3601, frames(1)[0])
+
+    assert read_index(segment_path(str(tmp_path), 0, HOUR))["kind"].tolist() == [KEYFRAME]
+    assert read_index(segment_path(str(tmp_path), 0, HOUR + 3600))["kind"].tolist() == [KEYFRAME, KEYFRAME]
+
+
+def test_torn_index_records_are_dropped_before_appending(tmp_path):
+    sequence = frames(3)
+    writer = SegmentWriter(str(tmp_path))
+    writer.append(0, HOUR, sequence[0])
+    writer.append(0, HOUR + 3, sequence[1])
+    path = segment_path(str(tmp_path), 0, HOUR)
+    index_path = path[: -len(".seg")] + ".idx"
+    # A record whose frame never reached the disk, then half a record
+    with open(index_path, "ab") as index:
+        index.write(read_index(path)[-1:].tobytes())
+        index.write(b"torn")
+    with open(path, "r+b") as segment:
+        segment.truncate(read_index(path)[-1]["offset"])
+    assert len(read_index(path)) == 1
+
+    restarted = SegmentWriter(str(tmp_path))
+    restarted.append(0, HOUR + 6, sequence[2])
+
+    assert os.path.getsize(index_path) == 2 * read_index(path).itemsize
+    assert read_frame(str(tmp_path), 0, HOUR + 3) is None
+    np.testing.assert_array_equal(read_frame(str(tmp_path), 0, HOUR), sequence[0])
+    np.testing.assert_array_equal(read_frame(str(tmp_path), 0, HOUR + 6), sequence[2])
+
+
+def test_old_segments_are_removed_whole(tmp_path):
+    writer = SegmentWriter(str(tmp_path))
+    frame, = frames(1)
+    writer.append(0, HOUR, frame)
+    writer.append(0, HOUR + 3600, frame)
+
+    assert remove_segments_before(str(tmp_path), HOUR + 3600) == 1
+    assert not os.path.exists(segment_path(str(tmp_path), 0, HOUR))
+    assert read_frame(str(tmp_path), 0, HOUR + 3600) is not None
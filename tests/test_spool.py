@@ -0,0 +1,53 @@
+from unittest import mock
+
+import pytest
+
+from openrecall.spool import FrameSpool, SpooledFrame, load_is_low
+
+
+@pytest.fixture
+def spool_path(tmp_path):
+    return str(tmp_path / "spool.db")
+
+
+def test_frames_come_out_in_capture_order(spool_path):
+    spool = FrameSpool(spool_path)
+    spool.append(20, 1, "20_1.webp", "App", "Title")
+    first = spool.append(10, 0, "10_0.webp", "App", "Title", 1920, 1080)
+    spool.append(20, 0, "20_0.webp", "App", "Title")
+
+    frames = spool.peek(2)
+
+    assert [frame.filename for frame in frames] == ["10_0.webp", "20_0.webp"]
+    assert frames[0] == SpooledFrame(first, 10, 0, "10_0.webp", "App", "Title", 1920, 1080)
+    assert spool.backlog() == 3
+    spool.close()
+
+
+def test_removed_frames_are_gone_and_the_rest_survive_a_restart(spool_path):
+    spool = FrameSpool(spool_path)
+    for timestamp in (1, 2, 3):
+        spool.append(timestamp, 0, f"{timestamp}_0.webp", "App", "Title")
+    spool.remove(spool.peek()[0].id)
+    spool.close()
+
+    reopened = FrameSpool(spool_path)
+    assert reopened.stats() == {"backlog": 2, "oldest_timestamp": 2}
+    assert [frame.timestamp for frame in reopened.peek(10)] == [2, 3]
+    reopened.close()
+
+
+def test_empty_spool_stats(spool_path):
+    spool = FrameSpool(spool_path)
+    assert spool.peek() == []
+    assert spool.stats() == {"backlog": 0, "oldest_timestamp": None}
+    spool.close()
+
+
+def test_load_is_low():
+    with mock.patch("os.getloadavg", return_value=(1.0, 1.0, 1.0)), \
+            mock.patch("os.cpu_count", return_value=4):
+        assert load_is_low(0.5)
+        assert not load_is_low(0.2)
+    with mock.patch("os.getloadavg", side_effect=OSError):
+        assert not load_is_low(0.5)
@@ -0,0 +1,42 @@
+import pytest
+
+from openrecall.text_codec import TextDictionary, dictionary_id, train_dictionary
+
+SAMPLES = [
+    f"File Edit View Selection Go Run Terminal Help\nInbox (3) - Quarterly planning\nline {i}"
+    for i in range(50)
+]
+
+
+def test_zlib_round_trip_with_dictionary():
+    data = train_dictionary(SAMPLES, "zlib")
+    assert b"File Edit View Selection Go Run Terminal Help" in data
+    dictionary = TextDictionary(7, "zlib", data)
+    value = dictionary.compress(SAMPLES[3])
+    assert dictionary_id(value) == 7
+    assert dictionary.decompress(value) == SAMPLES[3]
+    assert len(value) < len(TextDictionary(8, "zlib", b"").compress(SAMPLES[3]))
+
+
+def test_zlib_dictionary_respects_size():
+    assert len(train_dictionary(SAMPLES, "zlib", size=20)) <= 20
+
+
+def test_zstd_round_trip_with_dictionary():
+    pytest.importorskip("zstandard")
+    samples = [f"{text}\nwindow {i % 7} of {i}" for i, text in enumerate(SAMPLES * 20)]
+    dictionary = TextDictionary(1, "zstd", train_dictionary(samples, "zstd", size=4096))
+    assert dictionary.decompress(dictionary.compress(samples[5])) == samples[5]
+
+
+def test_unknown_codec_is_rejected():
+    with pytest.raises(ValueError):
+        TextDictionary(1, "lz4", b"")
+
+
+def test_zstd_falls_back_to_frequent_lines_on_few_samples():
+    pytest.importorskip("zstandard")
+    data = train_dictionary(["menu bar\nhello", "menu bar\nworld"], "zstd")
+    assert data == b"menu bar\n"
+    dictionary = TextDictionary(1, "zstd", data)
+    assert dictionary.decompress(dictionary.compress("menu bar\nagain")) == "menu bar\nagain"
@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+from openrecall.vector_index import EmbeddingIndex
+
+
+def test_search_empty_index():
+    index = EmbeddingIndex(dim=3)
+    ids, scores = index.search(np.array([1.0, 0.0, 0.0]), k=5)
+    assert len(ids) == 0
+    assert len(scores) == 0
+
+
+def test_search_orders_by_cosine_similarity():
+    index = EmbeddingIndex()
+    index.add(1, np.array([0.0, 1.0, 0.0]))
+    index.add(2, np.array([3.0, 0.0, 0.0]))
+    index.add(3, np.array([1.0, 1.0, 0.0]))
+    ids, scores = index.search(np.array([2.0, 0.0, 0.0]), k=3)
+    assert ids.tolist() == [2, 3, 1]
+    assert scores[0] == pytest.approx(1.0)
+    assert scores[1] == pytest.approx(np.sqrt(0.5))
+    assert scores[2] == pytest.approx(0.0)
+
+
+def test_search_top_k_matches_full_sort():
+    rng = np.random.default_rng(0)
+    embeddings = rng.normal(size=(500, 8)).astype(np.float32)
+    index = EmbeddingIndex()
+    index.add_batch(np.arange(500), embeddings)
+    query = rng.normal(size=8)
+
+    ids, _ = index.search(query, k=10)
+
+    normalized = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+    expected = np.argsort(-(normalized @ query))[:10]
+    assert ids.tolist() == expected.tolist()
+
+
+def test_index_grows_beyond_initial_capacity():
+    index = EmbeddingIndex(dim=2)
+    for i in range(3000):
+        index.add(i, np.array([1.0, i], dtype=np.float32))
+    assert len(index) == 3000
+    ids, _ = index.search(np.array([0.0, 1.0]), k=5000)
+    assert sorted(ids.tolist()) == list(range(3000))
+
+
+def test_zero_vector_scores_zero():
+    index = EmbeddingIndex()
+    index.add(1, np.zeros(3))
+    ids, scores = index.search(np.array([1.0, 0.0, 0.0]), k=1)
+    assert ids.tolist() == [1]
+    assert scores[0] == 0.0
+
+
+def test_dimension_mismatch_raises():
+    index = EmbeddingIndex(dim=3)
+    with pytest.raises(ValueError):
+        index.add(1, np.zeros(4))